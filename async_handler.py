@@ -0,0 +1,176 @@
+import asyncio
+import os
+
+import pymysql
+
+import provisioning
+from classifier import pretty_print_sql, log_info, log_warning, log_error
+from provisioned_cache import cache as provisioned_cache
+
+#
+# asyncio entry point for the container deployment, where signup events come
+# from a queue and one process keeps many signups in flight at once.
+#
+#   pool = await create_pool()
+#   results = await asyncio.gather(*(handle_event(event, pool) for event in events))
+#
+# handle_event takes the same steps as lambda_handler and returns the same
+# results: the event on success or a warning, an error string when the user
+# would be invalid in the App. Every signup holds a pooled connection only
+# while it talks to the database, async_pool_size bounds the connections and
+# so the signups waiting on MySQL at any one time. Needs aiomysql, whose
+# errors are the pymysql exception classes handled below.
+#
+
+try:
+    import aiomysql
+except ImportError:
+    aiomysql = None
+
+async_pool_size = int(os.environ.get('async_pool_size', '20'))
+provision_mode = os.environ.get('provision_mode', 'steps')
+idempotent_provisioning = os.environ.get('idempotent_provisioning', 'false').lower() == 'true'
+
+
+async def create_pool(size=None):
+    if aiomysql is None:
+        raise RuntimeError('async provisioning needs aiomysql: pip install aiomysql')
+    return await aiomysql.create_pool(
+        host=os.environ['endpoint'], user=os.environ['username'],
+        password=os.environ['db_password'], db=os.environ['db_name'],
+        minsize=1, maxsize=size or async_pool_size,
+        connect_timeout=3, autocommit=False)
+
+
+async def execute(conn, sql_statement, params, label):
+    pretty_print_sql(sql_statement, label)
+    async with conn.cursor() as cursor:
+        return await cursor.execute(sql_statement, params)
+
+
+async def rollback(conn):
+    try:
+        await conn.rollback()
+    except pymysql.Error:
+        pass
+
+
+async def handle_event(event, pool):
+
+    # only a confirmed sign up provisions, any other trigger source is returned untouched
+    if event.get('triggerSource') != 'PostConfirmation_ConfirmSignUp':
+        return event
+
+    # STEP 1 => process Cognito event to retrieve user information
+    name = event.get('request', {}).get('userAttributes', {}).get('name')
+    email = event.get('request', {}).get('userAttributes', {}).get('email')
+    # userName is absolutely required for use in the database, cannot proceed without
+    userName = event.get('userName')
+
+    if userName is None:
+        error_message = f"Username data unavailable from Cognito for user: {name}, {email}"
+        log_error(error_message)
+        return error_message
+
+    if provisioned_cache.contains(userName):
+        log_info("User %s provisioned by this container, nothing to do", userName)
+        return event
+
+    async with pool.acquire() as conn:
+        return await confirm_signup(conn, event, userName, name, email)
+
+
+async def confirm_signup(conn, event, userName, name, email):
+
+    # idempotent mode => one indexed check, then only the missing rows
+    if idempotent_provisioning:
+        try:
+            pretty_print_sql(provisioning.PROVISIONING_STATE, 'CHECK USER STATE')
+            async with conn.cursor() as cursor:
+                await cursor.execute(provisioning.PROVISIONING_STATE, (userName,) * 4)
+                row = await cursor.fetchone()
+            await conn.commit()
+        except pymysql.Error as e:
+            error_message = f"User Provisioning state check failed for user {name} : {email}: {e.args[0]} {e.args[1]}"
+            log_error(error_message)
+            return error_message
+
+        state = provisioning.state_from_counts(row)
+        if state == provisioning.STATE_COMPLETE:
+            log_info("User %s already provisioned, nothing to do", userName)
+            provisioned_cache.add(userName)
+            return event
+
+        if state == provisioning.STATE_PARTIAL:
+            try:
+                for statement in provisioning.SEED_PLAN.statements([userName], missing_only=True):
+                    await execute(conn, statement.sql_statement, statement.params, statement.label)
+                await conn.commit()
+                provisioned_cache.add(userName)
+            except pymysql.Error as e:
+                await rollback(conn)
+                log_warning(f"Warning: Seed data repair failed for user {name} : {email}: {e.args[0]} {e.args[1]}")
+            return event
+
+    # transaction mode => STEPS 2 through 5 as one all-or-nothing unit
+    if provision_mode == 'transaction':
+        try:
+            await execute(conn, provisioning.PROFILE_INSERT, (userName, name, email), 'PUT NEW USER')
+            for statement in provisioning.SEED_PLAN.statements([userName]):
+                await execute(conn, statement.sql_statement, statement.params, statement.label)
+            await conn.commit()
+        except pymysql.Error as e:
+            await rollback(conn)
+            error_message = f"User Provisioning failed for user {name} : {email}: {e.args[0]} {e.args[1]}"
+            log_error(error_message)
+            return error_message
+
+        provisioned_cache.add(userName)
+        return event
+
+    # STEP 2 => create user profile
+    try:
+        affected_put_rows = await execute(conn, provisioning.PROFILE_INSERT, (userName, name, email), 'PUT NEW USER')
+        if affected_put_rows > 0:
+            await conn.commit()
+        else:
+            error_message = f"User Profile Create failed for user {name} : {email}. Zero affected rows returned."
+            log_error(error_message)
+            return error_message
+
+    except pymysql.Error as e:
+        await rollback(conn)
+        error_message = f"User Profile Create failed for user {name} : {email}: {e.args[0]} {e.args[1]}"
+        log_error(error_message)
+        return error_message
+
+    # two phase mode => the queue is built and used off the event loop, its client blocks
+    if provision_mode == 'two_phase':
+        import seed_queue
+        if not seed_queue.configured():
+            log_warning("Warning: two_phase needs seed_queue_backend sqs, or spool on shared storage, "
+                        "seeding user %s inline", userName)
+        else:
+            try:
+                await asyncio.to_thread(seed_queue.put, {'userName': userName})
+                return event
+            except Exception as e:
+                log_warning("Warning: seed job enqueue failed for user %s, seeding inline: %s", userName, e)
+
+    # STEPS 3 through 5 => one statement per seed level, a failure leaves a partial user for repair
+    for statement in provisioning.SEED_PLAN.statements([userName]):
+        try:
+            affected_put_rows = await execute(conn, statement.sql_statement, statement.params, statement.label)
+            if affected_put_rows > 0:
+                await conn.commit()
+            else:
+                log_warning(f"Warning: {statement.kind} Create failed for user {name} : {email}. Zero affected rows returned.")
+                return event
+
+        except pymysql.Error as e:
+            await rollback(conn)
+            log_warning(f"Warning: {statement.kind} Create failed for user {name} : {email}: {e.args[0]} {e.args[1]}")
+            return event
+
+    provisioned_cache.add(userName)
+    return event
@@ -0,0 +1,174 @@
+import argparse
+import csv
+import itertools
+import json
+import os
+import sys
+
+import pymysql
+
+from provisioning import PROFILE_INSERT
+from reconcile import first_column
+from seed_data import SEED_PLAN, placeholders
+
+#
+# offline bulk provisioning of users from a Cognito user pool export.
+#
+# usage: python backfill.py users.csv [--batch-size 500] [--offset 0] [--dry-run]
+#
+# The export is streamed one record at a time and provisioned in chunks, each
+# chunk is one multi-row INSERT per table and a single commit. On failure the
+# offset of the first unprocessed record is printed, re-run with --offset to resume.
+#
+# Users whose profile already exists are not inserted again, so a backfill can
+# run against a database that already holds some of the users and be re-run
+# safely. An existing profile without any domains gets the seed rows it is
+# missing, one with seed data is left as its user shaped it.
+#
+
+DEFAULT_BATCH_SIZE = 500
+
+
+def read_export(path):
+
+    #
+    # yield (userName, name, email) for each user in a CSV or JSONL export.
+    # CSV uses the Cognito import/export header names, JSONL accepts either the
+    # list-users shape (Username + Attributes) or a flat dict per line.
+    #
+    with open(path, newline='') as export_file:
+        if path.endswith('.csv'):
+            for record in csv.DictReader(export_file):
+                yield (record.get('cognito:username') or record.get('username'),
+                       record.get('name'),
+                       record.get('email'))
+        else:
+            for line in export_file:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                attributes = {a['Name']: a['Value'] for a in record.get('Attributes', [])}
+                attributes.update({k: v for k, v in record.items() if isinstance(v, str)})
+                yield (attributes.get('Username') or attributes.get('userName'),
+                       attributes.get('name'),
+                       attributes.get('email'))
+
+
+def chunked(users, batch_size):
+    while True:
+        chunk = list(itertools.islice(users, batch_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def build_profile_rows(chunk):
+    return [(userName, name, email) for userName, name, email in chunk]
+
+
+def existing_users(cursor, user_names):
+
+    #
+    # (userNames with a profile, userNames with at least one domain) among user_names
+    #
+    users = placeholders(len(user_names))
+    cursor.execute(f"SELECT id FROM profiles WHERE id IN ({users});", user_names)
+    profiles = {first_column(row) for row in cursor.fetchall()}
+    cursor.execute(f"SELECT DISTINCT creator_fk FROM domains WHERE creator_fk IN ({users});", user_names)
+    seeded = {first_column(row) for row in cursor.fetchall()}
+    return profiles, seeded
+
+
+def provision_chunk(conn, chunk):
+
+    #
+    # returns the number of users in chunk whose profile already existed
+    #
+    # a user listed twice in the export is provisioned once
+    chunk = list({userName: (userName, name, email) for userName, name, email in chunk}.values())
+    user_names = [userName for userName, _, _ in chunk]
+
+    try:
+        with conn.cursor() as cursor:
+            profiles, seeded = existing_users(cursor, user_names)
+            new_users = [user for user in chunk if user[0] not in profiles]
+            unseeded_users = [userName for userName in user_names if userName in profiles and userName not in seeded]
+
+            if new_users:
+                cursor.executemany(PROFILE_INSERT, build_profile_rows(new_users))
+                # one statement per seed level for the whole chunk
+                for statement in SEED_PLAN.statements([userName for userName, _, _ in new_users]):
+                    cursor.execute(statement.sql_statement, statement.params)
+            if unseeded_users:
+                for statement in SEED_PLAN.statements(unseeded_users, missing_only=True):
+                    cursor.execute(statement.sql_statement, statement.params)
+        conn.commit()
+
+    except pymysql.Error:
+        conn.rollback()
+        raise
+
+    return len(profiles)
+
+
+def backfill(path, conn=None, batch_size=DEFAULT_BATCH_SIZE, offset=0, dry_run=False):
+
+    #
+    # returns (users provisioned, offset to resume from)
+    #
+    users = read_export(path)
+    users = (user for user in users if user[0])
+    users = itertools.islice(users, offset, None)
+
+    provisioned = 0
+    existing = 0
+    for chunk in chunked(users, batch_size):
+        if not dry_run:
+            try:
+                existing += provision_chunk(conn, chunk)
+            except pymysql.Error as e:
+                print(f"Backfill failed at offset {offset + provisioned}: {e.args[0]} {e.args[1]}")
+                print(f"Resume with --offset {offset + provisioned}")
+                raise
+        provisioned += len(chunk)
+        print(f"Backfill progress: {offset + provisioned} users, {existing} already provisioned")
+
+    return provisioned, offset + provisioned
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Provision users from a Cognito user pool export')
+    parser.add_argument('export', help='Cognito user export, .csv or .jsonl')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--offset', type=int, default=0, help='number of users to skip, used to resume')
+    parser.add_argument('--dry-run', action='store_true', help='count rows without touching the database')
+    args = parser.parse_args(argv)
+
+    conn = None
+    if not args.dry_run:
+        conn = pymysql.connect(
+            host=os.environ['endpoint'], user=os.environ['username'],
+            password=os.environ['db_password'], database=os.environ['db_name'])
+
+    try:
+        provisioned, next_offset = backfill(args.export, conn, args.batch_size, args.offset, args.dry_run)
+    except pymysql.Error:
+        return 1
+    finally:
+        if conn is not None:
+            conn.close()
+
+    if args.dry_run:
+        # each user receives a profile and the seed tree
+        print(f"Dry run: {provisioned} users, {provisioned * (1 + SEED_PLAN.rows_per_user())} rows "
+              f"({provisioned} profiles, {provisioned * len(SEED_PLAN.domain_rows)} domains, "
+              f"{provisioned * len(SEED_PLAN.area_rows)} areas, {provisioned * len(SEED_PLAN.task_rows)} tasks)")
+    else:
+        print(f"Backfill complete: {provisioned} users provisioned, next offset {next_offset}")
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
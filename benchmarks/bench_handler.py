@@ -0,0 +1,167 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import uuid
+
+#
+# local benchmark for the post confirmation handler.
+#
+# usage: python benchmarks/bench_handler.py [--signups 200] [--latency-ms 1.0]
+#                                           [--save-baseline | --compare]
+#
+# Drives lambda_handler with build_cognito_event events against the fake
+# MySQL in fake_mysql.py and reports, per provisioning mode, latency
+# percentiles, round trips and commits per signup and time spent printing,
+# which includes the one metrics line written per invocation.
+#
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+sys.path.insert(0, os.path.join(HERE, '..', 'tests'))
+
+# lambda_function reads its credentials on first connect, none are used against the fake
+for env_var in ('endpoint', 'username', 'db_password', 'db_name'):
+    os.environ.setdefault(env_var, 'benchmark')
+
+import lambda_function
+import seed_queue
+from conftest import build_cognito_event
+from fake_mysql import FakeConnection, constant_latency
+
+BASELINE_PATH = os.path.join(HERE, 'baseline.json')
+
+# provisioning configurations measured: name => (provision_mode, multi_statements)
+MODES = {
+    'steps': ('steps', False),
+    'transaction': ('transaction', False),
+    'transaction_multi': ('transaction', True),
+    'two_phase': ('two_phase', False),
+}
+
+# a run regresses if p95 grows past this factor of the baseline
+LATENCY_TOLERANCE = 1.25
+
+
+class TimedWriter:
+
+    # stdout replacement that accumulates the time spent writing log output
+    def __init__(self, stream):
+        self.stream = stream
+        self.seconds = 0.0
+
+    def write(self, text):
+        started = time.perf_counter()
+        self.stream.write(text)
+        self.seconds += time.perf_counter() - started
+
+    def flush(self):
+        self.stream.flush()
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_mode(mode, signups, latency_ms):
+
+    provision_mode, multi_statements = MODES[mode]
+    lambda_function.provision_mode = provision_mode
+    lambda_function.multi_statements = multi_statements
+    lambda_function.connection = None
+    # two_phase needs a queue, jobs are left undrained: only the synchronous half is measured
+    seed_queue.queue = seed_queue.MemoryQueue() if provision_mode == 'two_phase' else None
+
+    fakes = []
+
+    def connect():
+        fake = FakeConnection(constant_latency(latency_ms), multi_statements)
+        fakes.append(fake)
+        return fake
+
+    original_connect = lambda_function.connect
+    lambda_function.connect = connect
+
+    latencies = []
+    log_writer = TimedWriter(open(os.devnull, 'w'))
+    original_stdout = sys.stdout
+    sys.stdout = log_writer
+
+    try:
+        for _ in range(signups):
+            event = build_cognito_event(user_name=f"bench-{uuid.uuid4().hex[:8]}")
+            started = time.perf_counter()
+            lambda_function.lambda_handler(event, None)
+            latencies.append((time.perf_counter() - started) * 1000)
+    finally:
+        sys.stdout = original_stdout
+        log_writer.stream.close()
+        lambda_function.connect = original_connect
+        lambda_function.connection = None
+
+    round_trips = sum(fake.round_trips for fake in fakes)
+    commits = sum(fake.commits for fake in fakes)
+
+    return {
+        'signups': signups,
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'mean_ms': round(statistics.mean(latencies), 3),
+        'round_trips_per_signup': round(round_trips / signups, 2),
+        'commits_per_signup': round(commits / signups, 2),
+        'logging_ms_per_signup': round(log_writer.seconds * 1000 / signups, 4),
+    }
+
+
+def compare(results, baseline):
+
+    # round trips and commits are deterministic and must not grow, latency gets a tolerance
+    regressions = []
+    for mode, result in results.items():
+        expected = baseline.get(mode)
+        if expected is None:
+            continue
+        for metric in ('round_trips_per_signup', 'commits_per_signup'):
+            if result[metric] > expected[metric]:
+                regressions.append(f"{mode}: {metric} {expected[metric]} => {result[metric]}")
+        if result['p95_ms'] > expected['p95_ms'] * LATENCY_TOLERANCE:
+            regressions.append(f"{mode}: p95_ms {expected['p95_ms']} => {result['p95_ms']}")
+    return regressions
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Benchmark lambda_handler against a fake MySQL')
+    parser.add_argument('--signups', type=int, default=200)
+    parser.add_argument('--latency-ms', type=float, default=1.0, help='modelled latency of one round trip')
+    parser.add_argument('--mode', choices=sorted(MODES), action='append', help='default: every mode')
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--compare', action='store_true', help='exit non-zero on regression against the baseline')
+    args = parser.parse_args(argv)
+
+    results = {mode: run_mode(mode, args.signups, args.latency_ms) for mode in (args.mode or MODES)}
+    print(json.dumps(results, indent=4))
+
+    if args.save_baseline:
+        with open(BASELINE_PATH, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=4)
+            baseline_file.write('\n')
+        print(f"Baseline saved to {BASELINE_PATH}")
+
+    if args.compare:
+        with open(BASELINE_PATH) as baseline_file:
+            regressions = compare(results, json.load(baseline_file))
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,127 @@
+import re
+import time
+
+from pymysql.constants import CLIENT
+
+#
+# pymysql compatible stand-in with an injectable per-query latency model.
+#
+# Nothing is stored. Every call that would cross the network (execute,
+# executemany, commit, rollback, ping) counts as one round trip and sleeps for
+# the modelled latency, so handler timings reflect the number of round trips a
+# signup really costs against RDS.
+#
+
+INSERT_PATTERN = re.compile(r'^\s*INSERT\b', re.IGNORECASE)
+
+
+def constant_latency(latency_ms):
+    return lambda sql_statement: latency_ms / 1000
+
+
+class FakeCursor:
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.lastrowid = None
+        self.rowcount = -1
+        self.result = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def execute(self, sql_statement, args=None):
+        self.conn.round_trip(sql_statement)
+        statements = [s for s in sql_statement.split(';') if s.strip()]
+
+        for statement in statements:
+            if INSERT_PATTERN.match(statement):
+                self.conn.last_insert_id += 1
+                self.lastrowid = self.conn.last_insert_id
+                self.rowcount = 1
+                self.result = []
+            elif statement.strip().upper() == 'COMMIT':
+                self.conn.commits += 1
+            elif 'LAST_INSERT_ID()' in statement.upper():
+                self.rowcount = 1
+                self.result = [(self.conn.last_insert_id,)]
+            else:
+                self.rowcount = 0
+                self.result = []
+
+        return self.rowcount
+
+    def executemany(self, sql_statement, args):
+        # pymysql folds a multi-row INSERT into a single statement
+        rows = list(args)
+        self.conn.round_trip(sql_statement)
+        self.conn.last_insert_id += len(rows)
+        self.rowcount = len(rows)
+        return self.rowcount
+
+    def fetchone(self):
+        return self.result.pop(0) if self.result else None
+
+    def fetchall(self):
+        rows, self.result = self.result, []
+        return rows
+
+    def nextset(self):
+        return None
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+
+    def __init__(self, latency=None, multi_statements=False):
+        # latency is a callable: sql statement => seconds for that round trip
+        self.latency = latency or constant_latency(0)
+        self.client_flag = CLIENT.MULTI_STATEMENTS if multi_statements else 0
+        self.last_insert_id = 0
+        self.round_trips = 0
+        self.commits = 0
+        self.statements = 0
+
+    def round_trip(self, sql_statement):
+        self.round_trips += 1
+        if sql_statement not in ('COMMIT', 'ROLLBACK', 'PING'):
+            self.statements += 1
+        delay = self.latency(sql_statement)
+        if delay:
+            time.sleep(delay)
+
+    def cursor(self, *args, **kwargs):
+        return FakeCursor(self)
+
+    def ping(self, reconnect=False):
+        self.round_trip('PING')
+
+    def commit(self):
+        self.commits += 1
+        self.round_trip('COMMIT')
+
+    def rollback(self):
+        self.round_trip('ROLLBACK')
+
+    def close(self):
+        pass
+
+
+def server_latency(latency_ms, slots):
+
+    #
+    # a server executing at most slots statements at once: the returned callable
+    # waits for a free slot and the statement's latency itself, then returns 0.
+    # slots is a threading or multiprocessing semaphore shared by every connection.
+    #
+    def latency(sql_statement):
+        with slots:
+            time.sleep(latency_ms / 1000)
+        return 0
+
+    return latency
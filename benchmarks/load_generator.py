@@ -0,0 +1,173 @@
+import argparse
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+#
+# concurrent signup load generator for the post confirmation handler.
+#
+# usage: python benchmarks/load_generator.py [--signups 1000] [--concurrency 1,4,16,64]
+#                                            [--rate 0] [--backend fake|mysql]
+#                                            [--latency-ms 2.0] [--db-capacity 8]
+#                                            [--provision-mode steps]
+#
+# Each worker process stands in for one Lambda container: it imports
+# lambda_function itself, so it keeps its own module level connection. The
+# processes are started before the clock does, their first signup still
+# opens the connection as on a freshly initialized container. Unique
+# build_cognito_event events are pushed through lambda_handler either as fast
+# as the workers take them or, with --rate, at a fixed number of signups per
+# second. For each concurrency level the report gives throughput, handler
+# latency percentiles, how long signups waited for a free container,
+# connections opened and the error classes returned.
+#
+# --backend fake uses fake_mysql.py, a server running at most --db-capacity
+# statements at once, so the point where throughput stops growing with
+# concurrency shows the database saturating. --backend mysql drives the
+# database at endpoint/username/db_password/db_name: never point it at production.
+#
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+sys.path.insert(0, os.path.join(HERE, '..', 'tests'))
+
+# state of the worker process, set by init_worker
+worker = {}
+
+
+def init_worker(backend, latency_ms, slots, provision_mode):
+
+    # runs once in each worker process, before its first signup
+    if backend == 'fake':
+        for env_var in ('endpoint', 'username', 'db_password', 'db_name'):
+            os.environ.setdefault(env_var, 'load')
+    os.environ['provision_mode'] = provision_mode
+    sys.stdout = open(os.devnull, 'w')
+
+    import lambda_function
+    from conftest import build_cognito_event
+
+    if backend == 'fake':
+        from fake_mysql import FakeConnection, server_latency
+        lambda_function.connect = lambda: FakeConnection(server_latency(latency_ms, slots))
+        if provision_mode == 'two_phase':
+            import seed_queue
+            seed_queue.queue = seed_queue.MemoryQueue()
+
+    worker.update(lambda_function=lambda_function, build_cognito_event=build_cognito_event)
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def error_class(result):
+
+    # the handler returns the event on success and warnings, an error string otherwise
+    if isinstance(result, dict):
+        return None
+    return str(result).split(' for user')[0].split(':')[0]
+
+
+def run_signup(user_name, scheduled):
+
+    lambda_function = worker['lambda_function']
+    event = worker['build_cognito_event'](user_name=user_name)
+    lag_ms = max(0.0, (time.time() - scheduled) * 1000)
+
+    started = time.perf_counter()
+    try:
+        failure = error_class(lambda_function.lambda_handler(event, None))
+    except Exception as e:
+        failure = f"exception {type(e).__name__}"
+    latency_ms = (time.perf_counter() - started) * 1000
+
+    connects = lambda_function.connection_health.stats['connects'] if lambda_function.connection_health else 0
+    return latency_ms, lag_ms, failure, os.getpid(), connects
+
+
+def hold_worker(seconds):
+    # keeps a worker busy so the next start up task lands on another process
+    time.sleep(seconds)
+
+
+def run_level(concurrency, signups, rate, backend, latency_ms, db_capacity, provision_mode):
+
+    slots = multiprocessing.BoundedSemaphore(db_capacity)
+    user_prefix = f"load-{uuid.uuid4().hex[:6]}"
+    results = []
+
+    with ProcessPoolExecutor(max_workers=concurrency, initializer=init_worker,
+                             initargs=(backend, latency_ms, slots, provision_mode)) as executor:
+        for future in [executor.submit(hold_worker, 0.2) for _ in range(concurrency)]:
+            future.result()
+
+        started = time.time()
+        futures = []
+        for index in range(signups):
+            scheduled = started + index / rate if rate else started
+            delay = scheduled - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(executor.submit(run_signup, f"{user_prefix}-{index}", scheduled))
+        results = [future.result() for future in futures]
+        wall_seconds = time.time() - started
+
+    latencies = [latency for latency, _, _, _, _ in results]
+    lags = [lag for _, lag, _, _, _ in results]
+    errors = {}
+    for _, _, failure, _, _ in results:
+        if failure is not None:
+            errors[failure] = errors.get(failure, 0) + 1
+
+    # connections opened per worker, the last report of each process is its total
+    connects = {}
+    for _, _, _, pid, count in results:
+        connects[pid] = max(connects.get(pid, 0), count)
+
+    return {
+        'concurrency': concurrency,
+        'signups': signups,
+        'wall_s': round(wall_seconds, 3),
+        'throughput_per_s': round(signups / wall_seconds, 1),
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'max_ms': round(max(latencies), 3),
+        'mean_ms': round(statistics.mean(latencies), 3),
+        'wait_p95_ms': round(percentile(lags, 95), 3),
+        'containers': len(connects),
+        'connections': sum(connects.values()),
+        'errors': errors,
+    }
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Fire concurrent synthetic signups through lambda_handler')
+    parser.add_argument('--signups', type=int, default=1000)
+    parser.add_argument('--concurrency', default='1,4,16', help='comma separated worker counts, one run each')
+    parser.add_argument('--rate', type=float, default=0, help='signups per second, 0 sends as fast as workers take them')
+    parser.add_argument('--backend', choices=('fake', 'mysql'), default='fake')
+    parser.add_argument('--latency-ms', type=float, default=2.0, help='fake backend: latency of one statement')
+    parser.add_argument('--db-capacity', type=int, default=8, help='fake backend: statements executed at once')
+    parser.add_argument('--provision-mode', choices=('steps', 'transaction', 'two_phase'), default='steps')
+    args = parser.parse_args(argv)
+
+    levels = [int(level) for level in args.concurrency.split(',')]
+    report = [run_level(level, args.signups, args.rate, args.backend, args.latency_ms,
+                        args.db_capacity, args.provision_mode)
+              for level in levels]
+    print(json.dumps(report, indent=4))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,16 +1,85 @@
-import json
+import os
+import random
+
+#
+# leveled logging. Messages are %-formatted only when their level is enabled,
+# so disabled debug output costs one integer compare on the hot path.
+#
+LEVELS = {'debug': 10, 'info': 20, 'warning': 30, 'error': 40}
+
+log_level = LEVELS.get(os.environ.get('log_level', 'info').lower(), LEVELS['info'])
+# fraction of debug level varDumps that are actually printed
+dump_sample_rate = float(os.environ.get('dump_sample_rate', '1.0'))
+
+# a single invocation may raise its own verbosity, see set_invocation_log_level
+invocation_level = log_level
+invocation_sample_rate = dump_sample_rate
+
+# normalized SQL text keyed by the raw statement, statements are module constants
+sql_cache = {}
+SQL_CACHE_SIZE = 256
+
+
+def set_invocation_log_level(level_name=None):
+    # called at the start of each invocation, no level name restores the configured defaults
+    global invocation_level, invocation_sample_rate
+    if level_name in LEVELS:
+        invocation_level = LEVELS[level_name]
+        invocation_sample_rate = 1.0
+    else:
+        invocation_level = log_level
+        invocation_sample_rate = dump_sample_rate
+
+
+def log_enabled(level_name):
+    return LEVELS[level_name] >= invocation_level
+
+
+def log(level_name, message, *args):
+    if LEVELS[level_name] >= invocation_level:
+        print(message % args if args else message)
+
+
+def log_debug(message, *args):
+    log('debug', message, *args)
+
+
+def log_info(message, *args):
+    log('info', message, *args)
+
+
+def log_warning(message, *args):
+    log('warning', message, *args)
+
+
+def log_error(message, *args):
+    log('error', message, *args)
+
+
+def normalize_sql(sql_statement):
+    pretty_sql = sql_cache.get(sql_statement)
+    if pretty_sql is None:
+        pretty_sql = ' '.join(sql_statement.split())
+        if len(sql_cache) < SQL_CACHE_SIZE:
+            sql_cache[sql_statement] = pretty_sql
+    return pretty_sql
+
 
 def varDump(some_value, description='', dump_type='print'):
     # in honor of PHP lmao
+    if not log_enabled('debug') or random.random() >= invocation_sample_rate:
+        return
+
     sv_type = type(some_value)
     print('')
     print(f'{description}\t\ttype:\t\t{sv_type}')
     if dump_type == 'json':
+        import json
         print(f'{json.dumps(some_value,indent=4)}')
     else:
         # so pretty much dump_type other than json prints the value straight up
         print(f"{some_value}")
 
 def pretty_print_sql(sql_statement, method=''):
-        pretty_sql = ' '.join(sql_statement.split())
-        print(f"{method} SQL statement is: {pretty_sql}")
+        if log_enabled('debug'):
+            print(f"{method} SQL statement is: {normalize_sql(sql_statement)}")
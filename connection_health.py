@@ -0,0 +1,187 @@
+import re
+import time
+
+import pymysql
+from pymysql.constants import SERVER_STATUS
+
+import deadline
+
+#
+# connection health tracking for the module level Lambda connection.
+#
+# A connection used successfully within the idle window is assumed healthy and
+# returned without a ping, saving a round trip on every warm invocation. If the
+# server has dropped it anyway, the first failed statement reconnects and is
+# retried once, provided no transaction was open on the server (nothing earlier
+# is lost) and the statement does not carry its own COMMIT. The transaction
+# state is the server's, from the status flags of its last reply, so a COMMIT
+# inside a multi-statement batch ends the transaction like commit() does.
+# Statements and commits get socket timeouts from the invocation deadline.
+#
+
+# client side error codes meaning the server end of the socket is gone
+LOST_CONNECTION_ERRORS = (2006, 2013, 2055)
+
+# a statement or batch that commits itself, replaying it could commit twice
+COMMIT_STATEMENT = re.compile(r'\bCOMMIT\b', re.IGNORECASE)
+
+# process wide counters, they survive reconnects
+stats = {
+    'connects': 0,
+    'reconnects': 0,
+    'pings': 0,
+    'pings_skipped': 0,
+    'retries': 0,
+    'last_connect_ms': 0.0,
+    'total_connect_ms': 0.0,
+}
+
+
+def is_connection_lost(e):
+    if isinstance(e, pymysql.err.InterfaceError):
+        return True
+    return isinstance(e, pymysql.err.OperationalError) and bool(e.args) and e.args[0] in LOST_CONNECTION_ERRORS
+
+
+class HealthTrackedConnection:
+
+    def __init__(self, connect, idle_window):
+        # connect is a zero argument callable returning a new pymysql connection
+        self._connect = connect
+        self.idle_window = idle_window
+        self.conn = None
+        self.last_used = 0.0
+        # statements sent since the last commit/rollback, for connections
+        # without server status flags (the SQLite stand-in, test stubs)
+        self.pending_statements = False
+        self.connect()
+
+    def __getattr__(self, name):
+        # everything not tracked goes straight to the pymysql connection
+        return getattr(self.conn, name)
+
+    @property
+    def in_transaction(self):
+        raw = deadline.socket_connection(self.conn)
+        server_status = getattr(raw, 'server_status', None)
+        if server_status is None:
+            return self.pending_statements
+        return bool(server_status & SERVER_STATUS.SERVER_STATUS_IN_TRANS)
+
+    def connect(self):
+        started = time.monotonic()
+        self.conn = self._connect()
+        elapsed_ms = (time.monotonic() - started) * 1000
+
+        stats['connects'] += 1
+        stats['last_connect_ms'] = elapsed_ms
+        stats['total_connect_ms'] += elapsed_ms
+        self.pending_statements = False
+        self.mark_used()
+
+    def reconnect(self):
+        stats['reconnects'] += 1
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+        self.connect()
+
+    def mark_used(self):
+        self.last_used = time.monotonic()
+
+    def ensure_alive(self):
+
+        # closed on our side (a failed statement or commit) => reconnect without a ping
+        if not getattr(self.conn, 'open', True):
+            self.reconnect()
+            return
+
+        # recently used => skip the ping round trip
+        if time.monotonic() - self.last_used < self.idle_window:
+            stats['pings_skipped'] += 1
+            return
+
+        stats['pings'] += 1
+        try:
+            self.conn.ping(reconnect=False)
+        except pymysql.MySQLError:
+            self.reconnect()
+        self.mark_used()
+
+    def cursor(self, *args, **kwargs):
+        return TrackedCursor(self, args, kwargs)
+
+    def commit(self):
+        deadline.apply(self.conn)
+        self.conn.commit()
+        self.pending_statements = False
+        self.mark_used()
+
+    def rollback(self):
+        self.conn.rollback()
+        self.pending_statements = False
+        self.mark_used()
+
+    def close(self):
+        self.conn.close()
+
+
+class TrackedCursor:
+
+    def __init__(self, owner, cursor_args, cursor_kwargs):
+        self.owner = owner
+        self.cursor_args = cursor_args
+        self.cursor_kwargs = cursor_kwargs
+        self.cursor = owner.conn.cursor(*cursor_args, **cursor_kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.cursor.close()
+
+    def execute(self, sql_statement, args=None):
+        return self._run('execute', sql_statement, args)
+
+    def executemany(self, sql_statement, args):
+        return self._run('executemany', sql_statement, args)
+
+    def execute_prepared(self, sql_statement, args=None):
+        # binary protocol statement, see prepared_statements.py
+        return self._run('execute_prepared', sql_statement, args)
+
+    def _call(self, method, sql_statement, args):
+        if method == 'execute_prepared' and not hasattr(self.cursor, method):
+            # plain pymysql cursor, no sql_profiler in between
+            import prepared_statements
+            return prepared_statements.execute(self.cursor, sql_statement, args)
+        return getattr(self.cursor, method)(sql_statement, args)
+
+    def _run(self, method, sql_statement, args):
+        deadline.apply(self.owner.conn)
+        try:
+            result = self._call(method, sql_statement, args)
+
+        except pymysql.MySQLError as e:
+            # only a statement that opens the transaction is safe to replay,
+            # and only when there is time left to reconnect
+            if self.owner.in_transaction or not is_connection_lost(e):
+                raise
+            if COMMIT_STATEMENT.search(sql_statement):
+                raise
+            if deadline.current is not None and not deadline.current.allows(deadline.reconnect_ms):
+                raise
+
+            stats['retries'] += 1
+            self.owner.reconnect()
+            self.cursor = self.owner.conn.cursor(*self.cursor_args, **self.cursor_kwargs)
+            deadline.apply(self.owner.conn)
+            result = self._call(method, sql_statement, args)
+
+        self.owner.pending_statements = True
+        self.owner.mark_used()
+        return result
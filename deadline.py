@@ -0,0 +1,83 @@
+import os
+import time
+
+#
+# per invocation deadline for Cognito triggers.
+#
+# Cognito waits about 5 seconds for a trigger, whatever the function timeout
+# is. The deadline is the smaller of cognito_budget_ms and the time the Lambda
+# context has left, less deadline_margin_ms for returning the response. While
+# an invocation runs, each statement sent through connection_health gets
+# socket timeouts no longer than the time left, connect attempts are cut off
+# at the deadline, optional steps (seed data) only start when at least
+# optional_step_ms remain and a lost connection is only replaced and its
+# statement replayed when at least reconnect_ms remain.
+#
+
+cognito_budget_ms = float(os.environ.get('cognito_budget_ms', '5000'))
+deadline_margin_ms = float(os.environ.get('deadline_margin_ms', '300'))
+optional_step_ms = float(os.environ.get('optional_step_ms', '250'))
+reconnect_ms = float(os.environ.get('reconnect_ms', '1000'))
+
+# read/write timeouts outside an invocation, as passed to pymysql.connect
+DEFAULT_STATEMENT_TIMEOUT = 5.0
+# a statement always gets at least this many seconds
+MIN_STATEMENT_TIMEOUT = 0.1
+
+# deadline of the running invocation, None between invocations
+current = None
+
+
+class Deadline:
+
+    def __init__(self, budget_ms):
+        self.budget_ms = budget_ms
+        self.expires = time.monotonic() + budget_ms / 1000
+
+    def remaining_ms(self):
+        return (self.expires - time.monotonic()) * 1000
+
+    def allows(self, ms):
+        return self.remaining_ms() >= ms
+
+    def statement_timeout(self):
+        return min(DEFAULT_STATEMENT_TIMEOUT, max(MIN_STATEMENT_TIMEOUT, self.remaining_ms() / 1000))
+
+
+def start(context):
+    global current
+    budget_ms = cognito_budget_ms
+    get_remaining = getattr(context, 'get_remaining_time_in_millis', None)
+    if get_remaining is not None:
+        budget_ms = min(budget_ms, get_remaining())
+    current = Deadline(budget_ms - deadline_margin_ms)
+    return current
+
+
+def clear():
+    global current
+    current = None
+
+
+def socket_connection(conn):
+    # unwrap connection_health / sql_profiler wrappers down to the pymysql connection,
+    # by instance attributes only, the wrappers delegate everything else
+    while '_read_timeout' not in getattr(conn, '__dict__', {}):
+        conn = getattr(conn, '__dict__', {}).get('conn')
+        if conn is None:
+            return None
+    return conn
+
+
+def apply(conn):
+
+    #
+    # set the socket timeouts for the next statement on conn. pymysql has no
+    # public setter, it re-arms the socket from these before each read/write.
+    #
+    raw = socket_connection(conn)
+    if raw is None:
+        return
+    timeout = DEFAULT_STATEMENT_TIMEOUT if current is None else current.statement_timeout()
+    raw._read_timeout = timeout
+    raw._write_timeout = timeout
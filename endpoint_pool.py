@@ -0,0 +1,121 @@
+import time
+
+import pymysql
+
+from classifier import log_info, log_warning
+
+#
+# ordered database endpoints with failover, e.g. cluster writer, RDS Proxy, standby.
+#
+# Endpoints are tried fastest first by their recent connect latency, the ones
+# not yet measured follow in configured order. A measured endpoint gets a
+# timeout scaled from its latency instead of the full connect_timeout, the last
+# candidate always waits the full time. During an invocation no attempt waits
+# past the invocation deadline, with too little time left the remaining
+# endpoints are not tried at all. An endpoint that refuses or times out
+# sits in a cooldown and is only tried after the live ones, so a dead writer
+# costs one slow connect per container, not one per signup.
+#
+
+# client side error codes meaning the endpoint could not be reached
+UNREACHABLE_ERRORS = (2003, 2005, 2006, 2013)
+
+# weight of the newest sample in the latency average
+LATENCY_WEIGHT = 0.3
+# a measured endpoint gets this multiple of its latency to connect ...
+LATENCY_TIMEOUT_FACTOR = 4
+# ... but never less than this many seconds
+MIN_CONNECT_TIMEOUT = 0.5
+# an attempt with less time than this left before the deadline is not started
+MIN_ATTEMPT_TIMEOUT = 0.1
+
+# process wide counters
+stats = {
+    'attempts': 0,
+    'failures': 0,
+    'failovers': 0,
+}
+
+
+def is_unreachable(e):
+    return isinstance(e, pymysql.err.OperationalError) and bool(e.args) and e.args[0] in UNREACHABLE_ERRORS
+
+
+class EndpointPool:
+
+    def __init__(self, hosts, connect_timeout, cooldown):
+        if not hosts:
+            raise ValueError('at least one database endpoint is required')
+        self.hosts = list(hosts)
+        self.connect_timeout = connect_timeout
+        self.cooldown = cooldown
+        # host => average connect seconds, host => monotonic time its cooldown ends
+        self.latency = {}
+        self.dead_until = {}
+        self.current = None
+
+    def candidates(self):
+
+        # live endpoints fastest first, cooling ones last by soonest recovery
+        now = time.monotonic()
+        live = [host for host in self.hosts if self.dead_until.get(host, 0.0) <= now]
+        cooling = [host for host in self.hosts if host not in live]
+        live.sort(key=lambda host: (host not in self.latency, self.latency.get(host, 0.0)))
+        cooling.sort(key=lambda host: self.dead_until[host])
+        return live + cooling
+
+    def attempt_timeout(self, host, last):
+        if last or host not in self.latency:
+            return self.connect_timeout
+        return min(self.connect_timeout, max(MIN_CONNECT_TIMEOUT, self.latency[host] * LATENCY_TIMEOUT_FACTOR))
+
+    def record_success(self, host, elapsed):
+        previous = self.latency.get(host)
+        self.latency[host] = elapsed if previous is None else previous + LATENCY_WEIGHT * (elapsed - previous)
+        self.dead_until.pop(host, None)
+
+    def mark_dead(self, host):
+        # its latency is kept, once the cooldown ends it competes on it again
+        self.dead_until[host] = time.monotonic() + self.cooldown
+
+    def connect(self, open_connection, deadline=None):
+
+        #
+        # open_connection(host, connect_timeout) returns a new connection.
+        # deadline, a deadline.Deadline, caps each attempt at the time it has left.
+        # Raises the last error when no endpoint could be reached.
+        #
+        candidates = self.candidates()
+        last_error = None
+
+        for index, host in enumerate(candidates):
+            timeout = self.attempt_timeout(host, index == len(candidates) - 1)
+            if deadline is not None:
+                remaining = deadline.remaining_ms() / 1000
+                if remaining < MIN_ATTEMPT_TIMEOUT:
+                    break
+                timeout = min(timeout, remaining)
+            stats['attempts'] += 1
+            started = time.monotonic()
+            try:
+                conn = open_connection(host, timeout)
+            except pymysql.MySQLError as e:
+                if not is_unreachable(e):
+                    raise
+                stats['failures'] += 1
+                self.mark_dead(host)
+                log_warning("Warning: endpoint %s unreachable after %.2f s, cooling down %s s: %s",
+                            host, time.monotonic() - started, self.cooldown, e)
+                last_error = e
+                continue
+
+            self.record_success(host, time.monotonic() - started)
+            if self.current is not None and host != self.current:
+                stats['failovers'] += 1
+                log_info("Database endpoint failover %s => %s", self.current, host)
+            self.current = host
+            return conn
+
+        if last_error is None:
+            last_error = pymysql.err.OperationalError(2003, "No time left to connect to a database endpoint")
+        raise last_error
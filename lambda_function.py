@@ -1,24 +1,126 @@
 import os
-import pymysql
-
-from classifier import varDump, pretty_print_sql
-
-# retrieve db credential environment variables
-endpoint = os.environ['endpoint']
-username = os.environ['username']
-password = os.environ['db_password']
-db = os.environ['db_name']
+import time
+
+import deadline
+from classifier import (pretty_print_sql, set_invocation_log_level,
+                        log_info, log_warning, log_error)
+from metrics import StepMetrics
+from provisioned_cache import cache as provisioned_cache
+
+# measured from the first line of init, reported once per container
+init_started = time.perf_counter()
+cold_start_report = {'import_ms': 0.0, 'config_ms': 0.0, 'connect_ms': 0.0, 'init_ms': 0.0, 'init_connect': False}
+cold_start_reported = False
+
+# db modules are imported on first use, trigger sources that are a no-op never pay for them
+pymysql = None
+CLIENT = None
+provisioning = None
+connection_health = None
+endpoint_pool = None
+sql_profiler = None
+prepared_statements = None
+
+# credentials are read on first connect
+endpoint = None
+username = None
+password = None
+db = None
+endpoints = None
+
+# 'steps' commits each row as it goes, 'transaction' provisions the user atomically,
+# 'two_phase' commits the profile and queues the seed data for seed_worker.py,
+# it needs a durable seed_queue_backend and seeds inline without one
+provision_mode = os.environ.get('provision_mode', 'steps')
+# allow the transaction mode to ship all of its statements in a single packet
+multi_statements = os.environ.get('multi_statements', 'false').lower() == 'true'
+# seconds a connection may sit idle and still be used without a ping
+ping_idle_window = float(os.environ.get('ping_idle_window', '30'))
+# a retried trigger only does the work an earlier attempt left undone
+idempotent_provisioning = os.environ.get('idempotent_provisioning', 'false').lower() == 'true'
+# record every statement and log slow ones, see sql_profiler.py
+sql_profiling = os.environ.get('sql_profiling', 'false').lower() == 'true'
+# one Embedded Metric Format line of step timings per signup
+emit_metrics = os.environ.get('emit_metrics', 'true').lower() == 'true'
+metrics_namespace = os.environ.get('metrics_namespace', 'CognitoPostConfirmation')
+# connect during the init phase so the first signup finds the connection ready
+init_connect = os.environ.get('init_connect', 'false').lower() == 'true'
+# seconds to wait for an unmeasured or last resort endpoint, see endpoint_pool.py
+connect_timeout = float(os.environ.get('connect_timeout', '3'))
+# seconds an unreachable endpoint is passed over
+endpoint_cooldown = float(os.environ.get('endpoint_cooldown', '30'))
+# steps mode INSERTs as server side prepared statements, see prepared_statements.py
+prepare_statements = os.environ.get('prepare_statements', 'false').lower() == 'true'
 
 # setup database access
-print('Cognito Post User Confirmation Lambda Cold Start')
+log_info('Cognito Post User Confirmation Lambda Cold Start')
 
 connection = None
+invocation_count = 0
+
+def import_db_modules():
+    global pymysql, CLIENT, provisioning, connection_health, endpoint_pool, sql_profiler, prepared_statements
+    if pymysql is not None:
+        return
+
+    started = time.perf_counter()
+    import pymysql as pymysql_module
+    from pymysql.constants import CLIENT as client_constants
+    import provisioning as provisioning_module
+    import connection_health as connection_health_module
+    import endpoint_pool as endpoint_pool_module
+
+    CLIENT = client_constants
+    provisioning = provisioning_module
+    connection_health = connection_health_module
+    endpoint_pool = endpoint_pool_module
+    if sql_profiling:
+        import sql_profiler as sql_profiler_module
+        sql_profiler = sql_profiler_module
+    if prepare_statements:
+        import prepared_statements as prepared_statements_module
+        prepared_statements = prepared_statements_module
+    pymysql = pymysql_module
+    cold_start_report['import_ms'] = (time.perf_counter() - started) * 1000
+
+def load_config():
+    global endpoint, username, password, db, endpoints
+    if endpoint is not None:
+        return
+
+    # retrieve db credential environment variables
+    started = time.perf_counter()
+    endpoint = os.environ['endpoint']
+    username = os.environ['username']
+    password = os.environ['db_password']
+    db = os.environ['db_name']
+    # optional comma separated failover list, e.g. writer,proxy,standby
+    hosts = [host.strip() for host in os.environ.get('endpoints', '').split(',') if host.strip()]
+    endpoints = endpoint_pool.EndpointPool(hosts or [endpoint], connect_timeout, endpoint_cooldown)
+    cold_start_report['config_ms'] = (time.perf_counter() - started) * 1000
+
+def open_connection(host, timeout):
+    return pymysql.connect(
+        host=host, user=username, password=password, database=db,
+        connect_timeout=timeout,
+        read_timeout=deadline.DEFAULT_STATEMENT_TIMEOUT, write_timeout=deadline.DEFAULT_STATEMENT_TIMEOUT,
+        client_flag=CLIENT.MULTI_STATEMENTS if multi_statements else 0)
+
+def connect():
+    load_config()
+    # never waits past the invocation deadline
+    conn = endpoints.connect(open_connection, deadline.current)
+    if sql_profiler is not None:
+        conn = sql_profiler.ProfilingConnection(conn)
+    return conn
 
 def get_connection():
     global connection
+    import_db_modules()
     if connection is not None:
         try:
-            connection.ping(reconnect=True)
+            # pings only when the connection sat idle longer than the window
+            connection.ensure_alive()
             return connection
         except pymysql.MySQLError:
             try:
@@ -26,11 +128,33 @@ def get_connection():
             except Exception:
                 pass
             connection = None
-    connection = pymysql.connect(
-        host=endpoint, user=username, password=password, database=db,
-        connect_timeout=3, read_timeout=5, write_timeout=5)
+
+    started = time.perf_counter()
+    connection = connection_health.HealthTrackedConnection(connect, ping_idle_window)
+    if not cold_start_report['connect_ms']:
+        cold_start_report['connect_ms'] = (time.perf_counter() - started) * 1000
     return connection
 
+def report_cold_start():
+    global cold_start_reported
+    if cold_start_reported:
+        return
+    cold_start_reported = True
+    report = ', '.join(f"{key}={value:.2f}" if isinstance(value, float) else f"{key}={value}"
+                       for key, value in cold_start_report.items())
+    log_info("Cold start report: %s", report)
+
+
+# init phase connect, a failure here is retried by the first invocation
+if init_connect:
+    try:
+        get_connection()
+        cold_start_report['init_connect'] = True
+    except Exception as e:
+        log_warning("Warning: init phase connect failed: %s", e)
+
+cold_start_report['init_ms'] = (time.perf_counter() - init_started) * 1000
+
 
 def lambda_handler(event, context):
 
@@ -39,13 +163,105 @@ def lambda_handler(event, context):
     # a message to a separate lambda to service the user data create request.
     # this is suitable for now.
 
-    # event handler only runs during actual confirmSignup, otherwise no action
-    if event.get('triggerSource') != 'PostConfirmation_ConfirmSignUp':
+    # a logLevel raised for one invocation never carries over to the next
+    set_invocation_log_level(event.get('logLevel'))
+
+    # scheduled warm-up events prime the container, see warmer.py
+    if event.get('warmer') is True:
+        return warm_up(event, context)
+
+    # each trigger source is routed through TRIGGER_HANDLERS, anything else is
+    # returned untouched. Handlers acquire a db connection only when they need one.
+    handler = TRIGGER_HANDLERS.get(event.get('triggerSource'))
+    if handler is None:
         return event
 
-    print('Lambda Invoked: Cognito Post User Confirmation Lambda')
-    conn = get_connection()
+    global invocation_count
+    invocation_count += 1
+    deadline.start(context)
+    try:
+        return handler(event, context)
+    finally:
+        deadline.clear()
+
+
+def post_confirmation(event, context):
+
+    metrics = StepMetrics(metrics_namespace, {'ColdStart': 'true' if invocation_count == 1 else 'false'})
+
+    try:
+        result = confirm_signup(event, metrics)
+    except Exception:
+        metrics.outcome = 'exception'
+        raise
+    finally:
+        if sql_profiler is not None:
+            sql_profiler.log_invocation_summary()
+            sql_profiler.reset_invocation()
+        if emit_metrics:
+            metrics.flush()
+
+    return result
+
+
+def post_authentication(event, context):
+
+    # buffered last login, the connection is only opened when the buffer flushes
+    import last_login
+    return last_login.post_authentication(event, get_connection)
+
+
+def warm_up(event, context):
+
+    # establish or validate the connection and build the seed statements the
+    # next signup will use, nothing in the database is read or written
+    import warmer
+    global invocation_count
+    cold = invocation_count == 0
+    invocation_count += 1
+    started = time.perf_counter()
+    import_db_modules()
+
+    connected = True
+    try:
+        get_connection()
+        report_cold_start()
+    except Exception as e:
+        connected = False
+        log_warning("Warning: warmer connect failed: %s", e)
 
+    provisioning.SEED_PLAN.compile(1)
+    if idempotent_provisioning:
+        provisioning.SEED_PLAN.compile(1, missing_only=True)
+    if provision_mode == 'two_phase':
+        import seed_queue
+        if seed_queue.configured():
+            seed_queue.get_queue()
+    prime_ms = (time.perf_counter() - started) * 1000
+
+    warmer.hold_container(event)
+    cold_targets = warmer.fan_out(event, context)
+
+    log_info("Warmed container: cold %s, connected %s, %.3f ms", cold, connected, prime_ms)
+    return {
+        'warmed': True,
+        'coldStart': cold,
+        'connected': connected,
+        'primeMs': round(prime_ms, 3),
+        'coldTargets': cold_targets,
+    }
+
+
+TRIGGER_HANDLERS = {
+    'PostConfirmation_ConfirmSignUp': post_confirmation,
+    'PostAuthentication_Authentication': post_authentication,
+}
+
+
+def confirm_signup(event, metrics):
+
+    # metrics.outcome is success unless a step below records otherwise
+    log_info('Lambda Invoked: Cognito Post User Confirmation Lambda')
 
     # STEP 1 => process Cognito event to retrieve user information
     name = event.get('request', {}).get('userAttributes', {}).get('name')
@@ -53,168 +269,180 @@ def lambda_handler(event, context):
 
     # userName is absolutely required for use in the database, cannot proceed without
     userName = event.get('userName')
+    metrics.lap('EventParse')
 
     if userName == None:
         error_message = f"Username data unavailable from Cognito for user: {name}, {email}"
-        print(error_message)
+        log_error(error_message)
+        metrics.outcome = 'error'
         return error_message
 
+    # provisioned by this container already => repeat delivery, no db round trip
+    if provisioned_cache.contains(userName):
+        log_info("User %s provisioned by this container, nothing to do", userName)
+        metrics.outcome = 'cached'
+        return event
+
+    import_db_modules()
+    conn = get_connection()
+    report_cold_start()
+    metrics.lap('Connect')
+
+    # idempotent mode => one indexed check, then only the missing rows
+    if idempotent_provisioning:
+        try:
+            state = provisioning.provisioning_state(conn, userName)
+            metrics.lap('StateCheck')
+        except pymysql.Error as e:
+            error_message = f"User Provisioning state check failed for user {name} : {email}: {e.args[0]} {e.args[1]}"
+            log_error(error_message)
+            metrics.outcome = 'error'
+            return error_message
+
+        if state == provisioning.STATE_COMPLETE:
+            log_info("User %s already provisioned, nothing to do", userName)
+            provisioned_cache.add(userName)
+            # end the read snapshot, the next invocation's first statement stays replayable
+            try:
+                conn.commit()
+            except pymysql.Error:
+                pass
+            return event
+
+        if state == provisioning.STATE_PARTIAL:
+            if not deadline.current.allows(deadline.optional_step_ms):
+                defer_seeding(userName, metrics)
+                return event
+            try:
+                provisioning.repair_users(conn, [userName])
+                metrics.lap('Repair')
+                provisioned_cache.add(userName)
+            except pymysql.Error as e:
+                # profile exists so the user is valid, the seed data can be repaired later
+                error_message = f"Warning: Seed data repair failed for user {name} : {email}: {e.args[0]} {e.args[1]}"
+                log_warning(error_message)
+                metrics.outcome = 'warning'
+            return event
+
+    # transaction mode => STEPS 2 through 5 as one all-or-nothing unit
+    if provision_mode == 'transaction':
+        try:
+            provisioning.provision_user(conn, userName, name, email)
+            metrics.lap('Provision')
+            provisioned_cache.add(userName)
+        except pymysql.Error as e:
+            # nothing was committed, the user would be invalid in the App
+            error_message = f"User Provisioning failed for user {name} : {email}: {e.args[0]} {e.args[1]}"
+            log_error(error_message)
+            metrics.outcome = 'error'
+            return error_message
+
+        return event
+
     # STEP 2 => create user profile
     try:
-        sql_statement = """
-                    INSERT INTO profiles (id, name, email)
-                    VALUES (%s, %s, %s);
-        """
         profile_params = (userName, name, email)
-        pretty_print_sql(sql_statement, 'PUT NEW USER')
+        pretty_print_sql(provisioning.PROFILE_INSERT, 'PUT NEW USER')
 
         with conn.cursor() as cursor:
-            affected_put_rows = cursor.execute(sql_statement, profile_params)
+            affected_put_rows = execute_insert(cursor, provisioning.PROFILE_INSERT, profile_params)
 
         if affected_put_rows > 0:
             conn.commit()
+            metrics.lap('ProfileInsert')
         else:
             # profile must be created, otherwise user is invalid in the App
             error_message = f"User Profile Create failed for user {name} : {email}. Zero affected rows returned."
-            print(error_message)
+            log_error(error_message)
+            metrics.outcome = 'error'
             return error_message
 
     except pymysql.Error as e:
         # profile must be created, otherwise user is invalid in the App
         error_message = f"User Profile Create failed for user {name} : {email}: {e.args[0]} {e.args[1]}"
-        print(error_message)
+        log_error(error_message)
+        metrics.outcome = 'error'
         return(error_message)
 
-    # STEP 3a => Create initial Domain record for the user.
-    try:
-        domain_name = 'Personal'
-        closed = 0
-
-        sql_statement = """
-                    INSERT INTO domains (domain_name, creator_fk, closed, sort_order)
-                    VALUES (%s, %s, %s, %s);
-        """
-        sort_order = 0
-        domain_params = (domain_name, userName, closed, sort_order)
-        pretty_print_sql(sql_statement, 'CREATE NEW DOMAIN')
-
-        with conn.cursor() as cursor:
-            affected_put_rows = cursor.execute(sql_statement, domain_params)
-
-        if affected_put_rows > 0:
-            conn.commit()
+    # two phase mode => the profile is all Cognito waits for, seed data goes to the queue.
+    # The user is not cached as provisioned until seed_worker.py has run.
+    if provision_mode == 'two_phase':
+        import seed_queue
+        if not seed_queue.configured():
+            # nothing would ever drain the job, seed inline
+            log_warning("Warning: two_phase needs seed_queue_backend sqs, or spool on shared storage, "
+                        "seeding user %s inline", userName)
         else:
-            # print message and exit successs back to Cognito. User created, but default data wasn't which is OK
-            error_message = f"Warning: Domain Create failed for user {name} : {email}. Zero affected rows returned."
-            print(error_message)
-            return event;
-
-    except pymysql.Error as e:
-        # print message and exit successs back to Cognito. User created, but default data wasn't which is OK
-        error_message = f"Warning: Domain Create failed for user {name} : {email}: {e.args[0]} {e.args[1]}"
-        print(error_message)
-        return event; 
-
-
-    # STEP 3b => retrieve ID of the initial domain for use in STEP 4
-    try:
-        # mySql syntax to retrieve ID of prior insert in this session
-        sql_statement = "SELECT LAST_INSERT_ID()"
-        with conn.cursor() as cursor:
-            affected_rows = cursor.execute(sql_statement)
-
-            if affected_rows > 0:
-                domain_fk = cursor.fetchone()
-            else:
-                # Without new domain Id, creation of user data cannot continue
-                print(f"Warning: failed to read last_insert_id for created domain.")
+            try:
+                seed_queue.get_queue().put({'userName': userName})
+                metrics.lap('Enqueue')
                 return event
+            except Exception as e:
+                # fall through and seed inline, the worker skips rows that already exist
+                log_warning("Warning: seed job enqueue failed for user %s, seeding inline: %s", userName, e)
+                metrics.outcome = 'warning'
+
+    # STEPS 3 through 5 => create the seed domains, areas and tasks. Each level is a
+    # single statement no matter how large the seed tree, see seed_data.py
+    for statement in provisioning.SEED_PLAN.statements([userName]):
+        # too little time left => return to Cognito now, the rest is repaired later
+        if not deadline.current.allows(deadline.optional_step_ms):
+            defer_seeding(userName, metrics)
+            return event
 
-    except pymysql.Error as e:
-        # Without new domain Id, creation of user data cannot continue
-        print(f"Warning: failed to read last_insert_id for created domain.")
-        return event
-
-
-    # STEP 4 => Create initial Area for the user
-    try:
-        area_name = 'Home'
-        closed = 0
-
-        sql_statement = """
-                    INSERT INTO areas (area_name, domain_fk, creator_fk, closed)
-                    VALUES (%s, %s, %s, %s);
-        """
-        area_params = (area_name, domain_fk[0], userName, closed)
-        pretty_print_sql(sql_statement, 'CREATE NEW AREA')
-
-        with conn.cursor() as cursor:
-            affected_put_rows = cursor.execute(sql_statement, area_params)
-
-        if affected_put_rows > 0:
-            conn.commit()
-        else:
-            # print message and exit successs back to Cognito. User created, but default data wasn't which is OK
-            error_message = f"Warning: Area Create failed for user {name} : {email}. Zero affected rows returned."
-            print(error_message)
-            return event;
+        try:
+            pretty_print_sql(statement.sql_statement, statement.label)
 
-    except pymysql.Error as e:
-        # print message and exit successs back to Cognito. User created, but default data wasn't which is OK
-        error_message = f"Warning: Area Create failed for user {name} : {email}: {e.args[0]} {e.args[1]}"
-        print(error_message)
-        return event; 
+            with conn.cursor() as cursor:
+                affected_put_rows = execute_insert(cursor, statement.sql_statement, statement.params)
 
-    # STEP 4b => retrieve ID of the initial area for use in STEP 5
-    try:
-        # mySql syntax to retrieve ID of prior insert in this session
-        sql_statement = "SELECT LAST_INSERT_ID()"
-        with conn.cursor() as cursor:
-            affected_rows = cursor.execute(sql_statement)
-
-            if affected_rows > 0:
-                area_fk = cursor.fetchone()
+            if affected_put_rows > 0:
+                conn.commit()
+                metrics.lap(f'{statement.kind}Insert')
             else:
-                # Without new area Id, creation of user data cannot continue
-                print(f"Warning: failed to read last_insert_id for created area.")
+                # print message and exit successs back to Cognito. User created, but default data wasn't which is OK
+                error_message = f"Warning: {statement.kind} Create failed for user {name} : {email}. Zero affected rows returned."
+                log_warning(error_message)
+                metrics.outcome = 'warning'
                 return event
 
-    except pymysql.Error as e:
-        # Without new area Id, creation of user data cannot continue
-        print(f"Warning: failed to read last_insert_id for created area.")
-        return event
+        except pymysql.Error as e:
+            # print message and exit successs back to Cognito. User created, but default data wasn't which is OK
+            error_message = f"Warning: {statement.kind} Create failed for user {name} : {email}: {e.args[0]} {e.args[1]}"
+            log_warning(error_message)
+            metrics.outcome = 'warning'
+            return event
 
+    provisioned_cache.add(userName)
 
-    # STEP 5 => Create initial Task for the user
-    try:
-        priority = 1
-        done = 0
-        description = 'Tasks are organized in two levels: Domains and Areas. On the Plan page, Domains correspond to the tabs, areas to the cards. All tasks are stored in an Area and sorted by priority. When completed, tasks show up in the calendar view.'
+    # for now, errors print to CloudWatch and return OK.
+    # later we can queue this up and have more sophisticated error handler there (or here)
+    return event
 
-        sql_statement = """
-                    INSERT INTO tasks (priority, done, description, area_fk, creator_fk)
-                    VALUES (%s, %s, %s, %s, %s);
-        """
-        task_params = (priority, done, description, area_fk[0], userName)
-        pretty_print_sql(sql_statement, 'CREATE NEW TASK')
 
-        with conn.cursor() as cursor:
-            affected_put_rows = cursor.execute(sql_statement, task_params)
+def execute_insert(cursor, sql_statement, params):
+    if prepared_statements is None:
+        return cursor.execute(sql_statement, params)
+    # through connection_health / sql_profiler when they wrap the cursor
+    if hasattr(cursor, 'execute_prepared'):
+        return cursor.execute_prepared(sql_statement, params)
+    return prepared_statements.execute(cursor, sql_statement, params)
 
-        if affected_put_rows > 0:
-            conn.commit()
-        else:
-            # print message and exit successs back to Cognito. User created, but default data wasn't which is OK
-            error_message = f"Warning: Task create failed for user {name} : {email}. Zero affected rows returned."
-            print(error_message)
-            return event;
 
-    except pymysql.Error as e:
-        # print message and exit successs back to Cognito. User created, but default data wasn't which is OK
-        error_message = f"Warning: Task create failed for user {name} : {email}: {e.args[0]} {e.args[1]}"
-        print(error_message)
-        return event; 
+def defer_seeding(userName, metrics):
 
-    # for now, errors print to CloudWatch and return OK.
-    # later we can queue this up and have more sophisticated error handler there (or here)
-    return event
+    # the profile is committed, queue the missing seed rows for seed_worker.py.
+    # Without a durable queue, or if the put fails, the user is left partial
+    # for reconcile.py.
+    log_warning("Warning: %.0f ms left, seed data for user %s deferred to repair",
+                deadline.current.remaining_ms(), userName)
+    metrics.outcome = 'deferred'
+    import seed_queue
+    if not seed_queue.configured():
+        log_warning("Warning: no durable seed_queue_backend, user %s left partial for reconciliation", userName)
+        return
+    try:
+        seed_queue.get_queue().put({'userName': userName})
+    except Exception as e:
+        log_warning("Warning: deferred seed job enqueue failed for user %s, left partial for reconciliation: %s",
+                    userName, e)
@@ -0,0 +1,130 @@
+import datetime
+import os
+import time
+
+from classifier import pretty_print_sql, log_info, log_warning
+
+#
+# coalesced last-login tracking for the PostAuthentication trigger.
+#
+# Logins are buffered per container, repeat logins by the same user collapse
+# into one entry holding the latest time. The buffer is written with one
+# multi-row UPDATE per chunk once it holds last_login_flush_size users or its
+# oldest entry is last_login_flush_seconds old. The check runs on each login,
+# so a container that goes idle or is reclaimed can drop its unflushed
+# entries: last_login is approximate by design.
+#
+# A failed flush, or a failed connect, waits last_login_flush_seconds before
+# the next attempt, so an outage costs one connect timeout per interval rather
+# than one per sign in. Meanwhile the buffer holds at most
+# last_login_max_buffer users, the least recently seen are dropped first.
+#
+# needs: ALTER TABLE profiles ADD COLUMN last_login DATETIME NULL;
+#
+
+flush_size = int(os.environ.get('last_login_flush_size', '50'))
+flush_seconds = float(os.environ.get('last_login_flush_seconds', '30'))
+max_buffer = int(os.environ.get('last_login_max_buffer', '10000'))
+
+# rows per UPDATE statement
+UPDATE_CHUNK = 500
+
+# userName => latest login, naive UTC, least recently seen first
+buffer = {}
+oldest_entry = None
+# no flush attempt before this time.monotonic() after a failure
+retry_after = None
+# entries dropped at the size cap since the last successful flush
+dropped = 0
+
+
+def utc_now():
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None, microsecond=0)
+
+
+def record_login(userName, login_time=None):
+    global oldest_entry, dropped
+    login_time = login_time or utc_now()
+    if not buffer:
+        oldest_entry = time.monotonic()
+    previous = buffer.pop(userName, None)
+    buffer[userName] = login_time if previous is None or login_time > previous else previous
+    while len(buffer) > max_buffer:
+        del buffer[next(iter(buffer))]
+        dropped += 1
+
+
+def flush_due():
+    if not buffer:
+        return False
+    if retry_after is not None and time.monotonic() < retry_after:
+        return False
+    return len(buffer) >= flush_size or time.monotonic() - oldest_entry >= flush_seconds
+
+
+def update_statement(row_count):
+    # a flush from a container holding an older login never moves last_login back
+    cases = ' '.join(['WHEN %s THEN GREATEST(COALESCE(last_login, %s), %s)'] * row_count)
+    users = ', '.join(['%s'] * row_count)
+    return f"UPDATE profiles SET last_login = CASE id {cases} END WHERE id IN ({users});"
+
+
+def flush(conn):
+
+    #
+    # write the buffer, returns the number of users updated. On failure the
+    # entries go back into the buffer for the next attempt and the error is raised.
+    #
+    global buffer, oldest_entry
+    pending, buffer = buffer, {}
+    flushed_since = oldest_entry
+    oldest_entry = None
+    updated = 0
+
+    try:
+        entries = list(pending.items())
+        with conn.cursor() as cursor:
+            for start in range(0, len(entries), UPDATE_CHUNK):
+                chunk = entries[start:start + UPDATE_CHUNK]
+                sql_statement = update_statement(len(chunk))
+                params = (tuple(value for userName, login_time in chunk for value in (userName, login_time, login_time))
+                          + tuple(userName for userName, _ in chunk))
+                pretty_print_sql(sql_statement, 'UPDATE LAST LOGIN')
+                updated += cursor.execute(sql_statement, params)
+        conn.commit()
+
+    except Exception:
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+        for userName, login_time in pending.items():
+            record_login(userName, login_time)
+        oldest_entry = min(oldest_entry, flushed_since) if flushed_since is not None else oldest_entry
+        raise
+
+    log_info("Last login flush: %s users buffered, %s profiles updated", len(pending), updated)
+    return updated
+
+
+def post_authentication(event, get_connection):
+
+    # only reaches for the database when the buffer is due a flush
+    global retry_after, dropped
+    userName = event.get('userName')
+    if userName is None:
+        return event
+
+    record_login(userName)
+    if flush_due():
+        try:
+            flush(get_connection())
+        except Exception as e:
+            # never block a sign in over last_login, back off until the next interval
+            retry_after = time.monotonic() + flush_seconds
+            log_warning("Warning: last login flush failed, %s users kept for retry in %.0f s, %s dropped: %s",
+                        len(buffer), flush_seconds, dropped, e)
+        else:
+            retry_after = None
+            dropped = 0
+    return event
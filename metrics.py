@@ -0,0 +1,49 @@
+import json
+import time
+
+#
+# per step timings written as a single CloudWatch Embedded Metric Format line.
+#
+# Steps are laps of a monotonic clock: lap(step) charges the time since the
+# previous lap to that step. Nothing is written until flush(), which prints one
+# JSON line per invocation. CloudWatch Logs extracts the metrics from it, so no
+# PutMetricData call is made.
+# https://docs.aws.amazon.com/AmazonCloudWatch/latest/monitoring/CloudWatch_Embedded_Metric_Format_Specification.html
+#
+
+
+class StepMetrics:
+
+    def __init__(self, namespace, dimensions):
+        self.namespace = namespace
+        self.dimensions = dict(dimensions)
+        self.steps = {}
+        self.outcome = 'success'
+        self.started = self.last_lap = time.monotonic()
+
+    def lap(self, step):
+        now = time.monotonic()
+        self.steps[step] = self.steps.get(step, 0.0) + (now - self.last_lap) * 1000
+        self.last_lap = now
+
+    def record(self):
+        values = {step: round(ms, 3) for step, ms in self.steps.items()}
+        values['Total'] = round((time.monotonic() - self.started) * 1000, 3)
+
+        dimensions = dict(self.dimensions, Outcome=self.outcome)
+        record = {
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': self.namespace,
+                    'Dimensions': [sorted(dimensions)],
+                    'Metrics': [{'Name': step, 'Unit': 'Milliseconds'} for step in values],
+                }],
+            },
+        }
+        record.update({name: str(value) for name, value in dimensions.items()})
+        record.update(values)
+        return record
+
+    def flush(self):
+        print(json.dumps(self.record(), separators=(',', ':')))
@@ -0,0 +1,225 @@
+import datetime
+import struct
+import weakref
+
+import pymysql
+from pymysql.connections import Connection
+from pymysql.constants import COMMAND
+
+from classifier import log_warning
+from deadline import apply as apply_deadline, socket_connection
+
+#
+# opt-in server side prepared statements for the signup INSERTs.
+#
+# pymysql has no prepared statement API, so this speaks the binary protocol
+# on the pymysql connection's own packet layer: COM_STMT_PREPARE once per
+# connection and statement, then COM_STMT_EXECUTE carrying only the statement
+# id and the parameters as binary values. Nothing is escaped or formatted on
+# the client, the SQL text is not sent again and the server skips parsing and
+# planning it on every later signup. One packet out, one OK packet back, the
+# same round trip count as the text protocol.
+#
+# Statements are cached per connection and per server session: a reconnect
+# gets a new server thread id and starts an empty cache, a server that has
+# forgotten a statement anyway (1243) gets it prepared again.
+#
+# Text statements are sent instead:
+#   - on anything but a pymysql connection (the SQLite stand-in, the benchmark fake)
+#   - through RDS Proxy, where a prepared statement pins the client to one
+#     database connection for the rest of its session
+#   - for a statement the server cannot prepare, or returning a result set
+#   - for one call when the server's max_prepared_stmt_count is reached (1461)
+#   - on a pymysql release other than PYMYSQL_VERSION, or one missing the
+#     private packet methods used here
+#
+# Callers go through cursor.execute_prepared: connection_health's TrackedCursor
+# applies the deadline and replays after a lost connection, sql_profiler's
+# ProfilingCursor records the statement, both end up in execute() below.
+#
+
+# the pymysql release the packet handling was written against, major and minor
+PYMYSQL_VERSION = (1, 2)
+PACKET_METHODS = ('_execute_command', '_read_packet', '_read_ok_packet')
+binary_protocol = (tuple(pymysql.VERSION[:2]) == PYMYSQL_VERSION
+                   and all(hasattr(Connection, name) for name in PACKET_METHODS))
+if not binary_protocol:
+    log_warning("Warning: prepared statements written for pymysql %s.%s, found %s, statements sent as text",
+                *PYMYSQL_VERSION, pymysql.VERSION_STRING)
+
+# not supported: unknown command, statement not supported by the prepared protocol
+UNSUPPORTED_ERRORS = (1047, 1295)
+# max_prepared_stmt_count reached, server wide and temporary
+TOO_MANY_STATEMENTS = 1461
+UNKNOWN_STATEMENT = 1243
+
+# RDS Proxy endpoints look like name.proxy-xxxxxxxx.region.rds.amazonaws.com
+PROXY_HOST_MARKER = '.proxy-'
+
+# binary protocol column types and the unsigned flag
+TYPE_DOUBLE = 0x05
+TYPE_NULL = 0x06
+TYPE_LONGLONG = 0x08
+TYPE_VAR_STRING = 0xfd
+UNSIGNED_FLAG = 0x80
+
+# pymysql connection => (server thread id, {sql text: (statement id, param count) or None for text})
+caches = weakref.WeakKeyDictionary()
+
+stats = {'prepares': 0, 'executes': 0, 'text': 0}
+
+
+def statement_cache(raw):
+    thread_id = raw.server_thread_id
+    cached = caches.get(raw)
+    if cached is None or cached[0] != thread_id:
+        cached = caches[raw] = (thread_id, {})
+    return cached[1]
+
+
+def server_text(sql_statement):
+    # pymysql %s placeholders => server side ? markers
+    return sql_statement.replace('%s', '?').replace('%%', '%')
+
+
+def length_encoded(data):
+    length = len(data)
+    if length < 251:
+        return bytes((length,)) + data
+    if length < 1 << 16:
+        return b'\xfc' + struct.pack('<H', length) + data
+    if length < 1 << 24:
+        return b'\xfd' + struct.pack('<I', length)[:3] + data
+    return b'\xfe' + struct.pack('<Q', length) + data
+
+
+def encode_param(value, encoding):
+
+    # (type, flags, binary value) for one parameter
+    if value is None:
+        return TYPE_NULL, 0, b''
+    if isinstance(value, bool):
+        value = int(value)
+    if isinstance(value, int):
+        if value >= 1 << 63:
+            return TYPE_LONGLONG, UNSIGNED_FLAG, struct.pack('<Q', value)
+        return TYPE_LONGLONG, 0, struct.pack('<q', value)
+    if isinstance(value, float):
+        return TYPE_DOUBLE, 0, struct.pack('<d', value)
+    if isinstance(value, datetime.datetime):
+        value = value.isoformat(' ')
+    elif isinstance(value, datetime.date):
+        value = value.isoformat()
+    if not isinstance(value, (bytes, bytearray)):
+        value = str(value).encode(encoding)
+    return TYPE_VAR_STRING, 0, length_encoded(bytes(value))
+
+
+def execute_packet(statement_id, params, encoding):
+
+    # COM_STMT_EXECUTE body: id, no cursor, one iteration, NULL bitmap, types, values
+    packet = struct.pack('<IBI', statement_id, 0, 1)
+    if not params:
+        return packet
+    null_bitmap = bytearray((len(params) + 7) // 8)
+    types = []
+    values = []
+    for index, value in enumerate(params):
+        param_type, flags, data = encode_param(value, encoding)
+        if param_type == TYPE_NULL:
+            null_bitmap[index // 8] |= 1 << (index % 8)
+        types.append(struct.pack('<BB', param_type, flags))
+        values.append(data)
+    return packet + bytes(null_bitmap) + b'\x01' + b''.join(types) + b''.join(values)
+
+
+def skip_definitions(raw, count):
+    # column definitions followed by an EOF packet
+    if count:
+        for _ in range(count):
+            raw._read_packet()
+        raw._read_packet()
+
+
+def prepare(raw, cache, sql_statement):
+
+    #
+    # returns (statement id, param count), or None when the statement goes out as text
+    #
+    raw._execute_command(COMMAND.COM_STMT_PREPARE, server_text(sql_statement))
+    try:
+        packet = raw._read_packet()
+    except pymysql.MySQLError as e:
+        code = e.args[0] if e.args else None
+        if code in UNSUPPORTED_ERRORS:
+            log_warning("Warning: server cannot prepare statement, sent as text: %s", e)
+            cache[sql_statement] = None
+        elif code == TOO_MANY_STATEMENTS:
+            log_warning("Warning: max_prepared_stmt_count reached, statement sent as text")
+        else:
+            raise
+        return None
+
+    # COM_STMT_PREPARE_OK: status, statement id, columns, params, filler, warnings
+    _, statement_id, column_count, param_count = packet.read_struct('<BIHH')
+    skip_definitions(raw, param_count)
+    skip_definitions(raw, column_count)
+    if column_count:
+        # only statements answered by an OK packet are run here
+        raw._execute_command(COMMAND.COM_STMT_CLOSE, struct.pack('<I', statement_id))
+        cache[sql_statement] = None
+        return None
+
+    stats['prepares'] += 1
+    cache[sql_statement] = (statement_id, param_count)
+    return statement_id, param_count
+
+
+def run_prepared(raw, prepared, params):
+    statement_id, param_count = prepared
+    if len(params) != param_count:
+        raise pymysql.err.ProgrammingError(0, f"Statement takes {param_count} parameters, {len(params)} given")
+    raw._execute_command(COMMAND.COM_STMT_EXECUTE, execute_packet(statement_id, params, raw.encoding))
+    return raw._read_ok_packet().affected_rows
+
+
+def text_execute(cursor, sql_statement, params):
+    stats['text'] += 1
+    return cursor.execute(sql_statement, params)
+
+
+def execute(cursor, sql_statement, params):
+
+    #
+    # cursor.execute(sql_statement, params) as a prepared statement on the
+    # cursor's connection, returns the affected row count
+    #
+    raw = socket_connection(getattr(cursor, 'connection', None))
+    if (not binary_protocol or raw is None or not hasattr(raw, 'server_thread_id')
+            or PROXY_HOST_MARKER in (raw.host or '')):
+        return text_execute(cursor, sql_statement, params)
+
+    params = tuple(params or ())
+    apply_deadline(raw)
+    cache = statement_cache(raw)
+    if sql_statement in cache:
+        prepared = cache[sql_statement]
+    else:
+        prepared = prepare(raw, cache, sql_statement)
+    if prepared is None:
+        return text_execute(cursor, sql_statement, params)
+
+    try:
+        rows = run_prepared(raw, prepared, params)
+    except pymysql.MySQLError as e:
+        if not (e.args and e.args[0] == UNKNOWN_STATEMENT):
+            raise
+        # the server session lost the statement, prepare it again
+        del cache[sql_statement]
+        prepared = prepare(raw, cache, sql_statement)
+        if prepared is None:
+            return text_execute(cursor, sql_statement, params)
+        rows = run_prepared(raw, prepared, params)
+
+    stats['executes'] += 1
+    return rows
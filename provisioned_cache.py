@@ -0,0 +1,60 @@
+import collections
+import os
+import time
+
+#
+# per-container record of userNames this container fully provisioned.
+#
+# A repeat PostConfirmation for a cached userName (Cognito retry, replay,
+# re-confirmation) returns the event without touching the database, which
+# keeps a retry storm off RDS when it is already struggling. Entries expire
+# after ttl seconds and the least recently used entry is evicted past max_size.
+# provisioned_cache_size=0 (the default) turns the cache off.
+#
+
+
+class ProvisionedCache:
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        # userName => expiry time, oldest use first
+        self.entries = collections.OrderedDict()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def contains(self, userName):
+        if self.max_size <= 0:
+            return False
+
+        expires = self.entries.get(userName)
+        if expires is None:
+            self.stats['misses'] += 1
+            return False
+
+        if expires <= time.monotonic():
+            del self.entries[userName]
+            self.stats['expirations'] += 1
+            self.stats['misses'] += 1
+            return False
+
+        self.entries.move_to_end(userName)
+        self.stats['hits'] += 1
+        return True
+
+    def add(self, userName):
+        if self.max_size <= 0:
+            return
+
+        self.entries[userName] = time.monotonic() + self.ttl
+        self.entries.move_to_end(userName)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.stats['evictions'] += 1
+
+
+cache = ProvisionedCache(
+    int(os.environ.get('provisioned_cache_size', '0')),
+    float(os.environ.get('provisioned_cache_ttl', '900')))
@@ -0,0 +1,135 @@
+import pymysql
+from pymysql.constants import CLIENT
+
+from classifier import pretty_print_sql
+from seed_data import SEED_PLAN
+
+PROFILE_INSERT = "INSERT INTO profiles (id, name, email) VALUES (%s, %s, %s);"
+
+
+def supports_multi_statements(conn):
+    return bool(getattr(conn, 'client_flag', 0) & CLIENT.MULTI_STATEMENTS)
+
+
+def provision_user(conn, userName, name, email, seed_plan=None):
+
+    #
+    # create the profile and the seed tree in one transaction. Either every row
+    # is committed or none is, so a user is never left partially provisioned.
+    # raises pymysql.Error after rolling back on any failure.
+    #
+    seed_plan = seed_plan or SEED_PLAN
+    try:
+        if supports_multi_statements(conn):
+            _provision_batch(conn, userName, name, email, seed_plan)
+        else:
+            _provision_statements(conn, userName, name, email, seed_plan)
+
+    except pymysql.Error:
+        try:
+            conn.rollback()
+        except pymysql.Error:
+            pass
+        raise
+
+
+def _provision_batch(conn, userName, name, email, seed_plan):
+
+    # single packet: COMMIT rides along, a failure part way stops the server executing the rest
+    seed_statements = seed_plan.statements([userName])
+    batch_statement = ' '.join([PROFILE_INSERT]
+                               + [statement.sql_statement for statement in seed_statements]
+                               + ['COMMIT;'])
+    batch_params = (userName, name, email) + tuple(value
+                                                   for statement in seed_statements
+                                                   for value in statement.params)
+    pretty_print_sql(batch_statement, 'PROVISION NEW USER')
+
+    with conn.cursor() as cursor:
+        cursor.execute(batch_statement, batch_params)
+        # drain every result so an error in a later statement surfaces here
+        while cursor.nextset():
+            pass
+
+
+def _provision_statements(conn, userName, name, email, seed_plan):
+
+    pretty_print_sql(PROFILE_INSERT, 'PUT NEW USER')
+
+    with conn.cursor() as cursor:
+        affected_put_rows = cursor.execute(PROFILE_INSERT, (userName, name, email))
+        if affected_put_rows == 0:
+            raise pymysql.err.OperationalError(0, 'Zero affected rows returned for profile')
+
+        # one statement per seed level, parent ids are resolved server side
+        for statement in seed_plan.statements([userName]):
+            pretty_print_sql(statement.sql_statement, statement.label)
+            cursor.execute(statement.sql_statement, statement.params)
+
+    conn.commit()
+
+
+#
+# idempotent provisioning, used when Cognito retries a trigger the first attempt
+# may already have finished, fully or in part
+#
+PROVISIONING_STATE = """SELECT
+    (SELECT COUNT(*) FROM profiles WHERE id = %s),
+    (SELECT COUNT(*) FROM domains WHERE creator_fk = %s),
+    (SELECT COUNT(*) FROM areas WHERE creator_fk = %s),
+    (SELECT COUNT(*) FROM tasks WHERE creator_fk = %s);"""
+
+STATE_NEW = 'new'
+STATE_PARTIAL = 'partial'
+STATE_COMPLETE = 'complete'
+
+
+def provisioning_state(conn, userName, seed_plan=None):
+
+    # one indexed round trip: new, partial or complete
+    pretty_print_sql(PROVISIONING_STATE, 'CHECK USER STATE')
+
+    with conn.cursor() as cursor:
+        cursor.execute(PROVISIONING_STATE, (userName,) * 4)
+        row = cursor.fetchone()
+    return state_from_counts(row, seed_plan)
+
+
+def state_from_counts(row, seed_plan=None):
+
+    # classify a PROVISIONING_STATE row, tuple or dict
+    seed_plan = seed_plan or SEED_PLAN
+    profile_count, domain_count, area_count, task_count = row.values() if isinstance(row, dict) else row
+
+    if profile_count == 0:
+        return STATE_NEW
+    if (domain_count >= len(seed_plan.domain_rows)
+            and area_count >= len(seed_plan.area_rows)
+            and task_count >= len(seed_plan.task_rows)):
+        return STATE_COMPLETE
+    return STATE_PARTIAL
+
+
+def repair_users(conn, user_names, seed_plan=None):
+
+    #
+    # insert only the seed rows each user is missing, in one transaction.
+    # returns the number of rows inserted, raises pymysql.Error after rolling back.
+    #
+    seed_plan = seed_plan or SEED_PLAN
+    inserted = 0
+    try:
+        with conn.cursor() as cursor:
+            for statement in seed_plan.statements(user_names, missing_only=True):
+                pretty_print_sql(statement.sql_statement, statement.label)
+                inserted += cursor.execute(statement.sql_statement, statement.params)
+        conn.commit()
+
+    except pymysql.Error:
+        try:
+            conn.rollback()
+        except pymysql.Error:
+            pass
+        raise
+
+    return inserted
@@ -0,0 +1,237 @@
+import argparse
+import datetime
+import json
+import os
+import sys
+
+import pymysql
+
+from classifier import pretty_print_sql
+from provisioning import repair_users
+from seed_data import SEED_PLAN, derived_table
+
+#
+# repair users a warning path left partially provisioned.
+#
+# usage: python reconcile.py [--batch-size 500] [--progress reconcile.json] [--restart] [--dry-run]
+#                            [--after KEY] [--until KEY] [--max-age-hours 72]
+#
+# profiles confirmed within the last --max-age-hours are walked in keyset
+# order on (created, id) a page at a time, so a pass reads only the recent end
+# of the table. Each page is checked with one set-based anti-join against the
+# seed tree, and the incomplete users found are repaired together with the
+# missing_only seed plan, one transaction per page. Short transactions keep
+# lock time and replica lag down on a large table. Progress is written after
+# every page, a re-run picks up after the last repaired page until a pass
+# completes. --after and --until restrict the pass to profile ids in
+# (after, until], e.g. to split the users between several runs.
+#
+# Users half seeded before the window are never repaired by default. Sweep
+# them once with a --max-age-hours reaching back far enough.
+#
+# A user whose signup is still in flight can look incomplete, run it outside
+# the sign up peak or against users that confirmed a while ago.
+#
+# needs: profiles.created and its keyset index, darwin_dev has neither yet
+#   ALTER TABLE profiles
+#       ADD COLUMN created DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+#       ADD INDEX profiles_created (created, id);
+# existing profiles get the time of the ALTER as created, they fall out of
+# the default window --max-age-hours later.
+#
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_PROGRESS_FILE = 'reconcile.json'
+DEFAULT_MAX_AGE_HOURS = 72
+
+# (created, id) keyset from the cutoff on, a range scan of profiles_created
+PAGE_QUERY = ("SELECT created, id FROM profiles WHERE created >= %s "
+              "AND (created > %s OR (created = %s AND id > %s)) AND id > %s "
+              "ORDER BY created, id LIMIT %s;")
+BOUNDED_PAGE_QUERY = ("SELECT created, id FROM profiles WHERE created >= %s "
+                      "AND (created > %s OR (created = %s AND id > %s)) AND id > %s AND id <= %s "
+                      "ORDER BY created, id LIMIT %s;")
+
+
+def incomplete_users_query(page_size, seed_plan=None):
+
+    #
+    # (sql, seed params) finding the users of a page of page_size profile ids
+    # that a warning path left half seeded. Each seed level is INSERTed by one
+    # statement, so a failed level leaves its parents childless: a profile with
+    # no domains, a seed domain with no areas or a seed area with no tasks.
+    # A seed row renamed, moved or deleted by its user is not a gap, only an
+    # empty seed parent is. Every part takes its seed params, then the page ids.
+    #
+    seed_plan = seed_plan or SEED_PLAN
+    bounds = f"p.id IN ({', '.join(['%s'] * page_size)})"
+    parts = []
+    params = []
+
+    if seed_plan.domain_rows:
+        parts.append(
+            f"SELECT p.id FROM profiles p WHERE {bounds} "
+            "AND NOT EXISTS (SELECT 1 FROM domains d WHERE d.creator_fk = p.id)")
+        params.append(())
+
+    # seed domains with seed areas, seed areas with seed tasks
+    area_parents = list(dict.fromkeys(row[0] for row in seed_plan.area_rows))
+    task_parents = list(dict.fromkeys(row[:2] for row in seed_plan.task_rows))
+
+    if area_parents:
+        parts.append(
+            "SELECT p.id FROM profiles p JOIN domains d ON d.creator_fk = p.id "
+            f"JOIN ({derived_table(['domain_name'], len(area_parents))}) seed ON seed.domain_name = d.domain_name "
+            f"WHERE {bounds} AND NOT EXISTS (SELECT 1 FROM areas a WHERE a.domain_fk = d.id)")
+        params.append(tuple(area_parents))
+
+    if task_parents:
+        parts.append(
+            "SELECT p.id FROM profiles p JOIN areas a ON a.creator_fk = p.id "
+            "JOIN domains d ON d.id = a.domain_fk "
+            f"JOIN ({derived_table(['domain_name', 'area_name'], len(task_parents))}) seed "
+            "ON seed.domain_name = d.domain_name AND seed.area_name = a.area_name "
+            f"WHERE {bounds} AND NOT EXISTS (SELECT 1 FROM tasks t WHERE t.area_fk = a.id)")
+        params.append(tuple(value for parent in task_parents for value in parent))
+
+    # UNION removes the duplicates of a user found by several parts
+    return ' UNION '.join(parts) + ' ORDER BY id;', params
+
+
+def confirmed_since(max_age_hours):
+    # profiles.created is UTC, as CURRENT_TIMESTAMP on RDS
+    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    return now - datetime.timedelta(hours=max_age_hours)
+
+
+def first_column(row):
+    return next(iter(row.values())) if isinstance(row, dict) else row[0]
+
+
+def scan_page(conn, position, batch_size, confirmed_after, after='', until=None, seed_plan=None):
+
+    #
+    # position is the (created, id) key the page starts after. returns (key of
+    # the last profile in the page or None at the end, incomplete users in the page)
+    #
+    last_created, last_key = position
+    keyset = (confirmed_after, last_created, last_created, last_key, after)
+    with conn.cursor() as cursor:
+        if until is None:
+            cursor.execute(PAGE_QUERY, keyset + (batch_size,))
+        else:
+            cursor.execute(BOUNDED_PAGE_QUERY, keyset + (until, batch_size))
+        rows = [row.values() if isinstance(row, dict) else row for row in cursor.fetchall()]
+        if not rows:
+            return None, []
+        page = [profile_id for _, profile_id in rows]
+
+        sql_statement, seed_params = incomplete_users_query(len(page), seed_plan)
+        params = tuple(value
+                       for level_params in seed_params
+                       for value in level_params + tuple(page))
+        pretty_print_sql(sql_statement, 'FIND INCOMPLETE USERS')
+        cursor.execute(sql_statement, params)
+        incomplete = [first_column(row) for row in cursor.fetchall()]
+
+    # a consistent read is not needed past this point, end the snapshot before repairing
+    conn.commit()
+    # created as text, the progress file is JSON
+    last_created, last_key = rows[-1]
+    return (str(last_created), last_key), incomplete
+
+
+def load_progress(path):
+    # the saved record of an unfinished pass, otherwise a new pass from the cutoff
+    if path and os.path.exists(path):
+        with open(path) as progress_file:
+            progress = json.load(progress_file)
+        if not progress.get('complete'):
+            return progress
+    return {'last_created': None, 'last_key': '', 'scanned_pages': 0, 'incomplete': 0, 'repaired': 0,
+            'rows_inserted': 0, 'complete': False}
+
+
+def save_progress(path, progress):
+    if not path:
+        return
+    # write then rename, an interrupted run never leaves a torn progress file
+    with open(path + '.tmp', 'w') as progress_file:
+        json.dump(progress, progress_file)
+    os.replace(path + '.tmp', path)
+
+
+def reconcile(conn, batch_size=DEFAULT_BATCH_SIZE, progress_path=None, restart=False, dry_run=False,
+              after='', until=None, seed_plan=None, max_age_hours=DEFAULT_MAX_AGE_HOURS):
+
+    #
+    # returns the progress record: users found incomplete, users repaired, rows inserted
+    #
+    progress = load_progress(None if restart else progress_path)
+    confirmed_after = confirmed_since(max_age_hours)
+
+    while True:
+        position = (progress['last_created'] or confirmed_after, progress['last_key'])
+        last_position, incomplete = scan_page(conn, position, batch_size, confirmed_after, after, until, seed_plan)
+        if last_position is None:
+            break
+        last_created, last_key = last_position
+
+        if incomplete and not dry_run:
+            try:
+                progress['rows_inserted'] += repair_users(conn, incomplete, seed_plan)
+            except pymysql.Error as e:
+                print(f"Reconcile failed after key {progress['last_key']!r}: {e.args[0]} {e.args[1]}")
+                print('Re-run to resume from the last completed page')
+                raise
+            progress['repaired'] += len(incomplete)
+
+        progress['incomplete'] += len(incomplete)
+        progress['scanned_pages'] += 1
+        progress['last_created'] = last_created
+        progress['last_key'] = last_key
+        if not dry_run:
+            save_progress(progress_path, progress)
+        print(f"Reconcile progress: through {last_key!r}, {progress['incomplete']} incomplete, "
+              f"{progress['repaired']} repaired")
+
+    progress['complete'] = True
+    if not dry_run:
+        save_progress(progress_path, progress)
+    return progress
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Repair partially provisioned users')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='profiles scanned per page')
+    parser.add_argument('--progress', default=DEFAULT_PROGRESS_FILE, help='progress file used to resume')
+    parser.add_argument('--restart', action='store_true', help='ignore saved progress and start a new pass')
+    parser.add_argument('--dry-run', action='store_true', help='count incomplete users without repairing them')
+    parser.add_argument('--after', default='', help='only profile ids after this one')
+    parser.add_argument('--until', help='only profile ids up to this one')
+    parser.add_argument('--max-age-hours', type=float, default=DEFAULT_MAX_AGE_HOURS,
+                        help='only repair users confirmed this recently')
+    args = parser.parse_args(argv)
+
+    conn = pymysql.connect(
+        host=os.environ['endpoint'], user=os.environ['username'],
+        password=os.environ['db_password'], database=os.environ['db_name'])
+
+    try:
+        progress = reconcile(conn, args.batch_size, args.progress, args.restart, args.dry_run,
+                             args.after, args.until, max_age_hours=args.max_age_hours)
+    except pymysql.Error:
+        return 1
+    finally:
+        conn.close()
+
+    if args.dry_run:
+        print(f"Dry run: {progress['incomplete']} incomplete users")
+    else:
+        print(f"Reconcile complete: {progress['repaired']} users repaired, {progress['rows_inserted']} rows inserted")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,41 +1,333 @@
+import base64
+import gzip
+import hashlib
+import io
 import json
-from classifier import varDump
+import os
+import zlib
+from types import MappingProxyType
+
+from classifier import varDump, log_debug, log_info, log_enabled
+
+#
+# headers shared by every response, built once per container. Each response
+# gets its own shallow copy so a caller mutating it cannot leak into the next.
+#
+CORS_HEADERS = MappingProxyType({
+    'Content-Type': 'application/json',
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Headers': 'body, Content-Type, Access-Control-Allow-Headers, Access-Control-Allow-Origin, Access-Control-Allow-Methods',
+    'Access-Control-Allow-Methods': 'PUT, GET, POST, DELETE, OPTIONS',
+})
+
+#
+# json encoder: 'stdlib' output is byte identical to json.dumps(body), 'fast'
+# uses orjson when it is installed (compact separators, native datetime) and
+# falls back to json.dumps for anything orjson cannot encode, e.g. Decimal.
+#
+json_encoder = os.environ.get('json_encoder', 'stdlib')
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def encode_json(body, encoder=None):
+    if (encoder or json_encoder) == 'fast' and orjson is not None:
+        try:
+            return orjson.dumps(body).decode()
+        except TypeError:
+            pass
+    return json.dumps(body)
+
+
+#
+# opt-in response compression, used when the caller passes the request's
+# Accept-Encoding header. Bodies smaller than the threshold are sent as is.
+# The compressed body is base64 encoded with isBase64Encoded set, REST APIs
+# need a binary media type of */* for API Gateway to decode it on the way out.
+#
+compression_threshold = int(os.environ.get('compression_threshold', '1024'))
+compression_level = int(os.environ.get('compression_level', '6'))
+
+# preferred first when the client weighs them equally
+SUPPORTED_ENCODINGS = ('gzip', 'deflate')
+
+
+def request_header(event, name):
+    # header names are case insensitive, API Gateway passes them as sent
+    name = name.lower()
+    for header, value in (event.get('headers') or {}).items():
+        if header.lower() == name:
+            return value
+    return None
+
+
+def request_accept_encoding(event):
+    return request_header(event, 'Accept-Encoding')
+
+
+def request_if_none_match(event):
+    return request_header(event, 'If-None-Match')
+
+
+def choose_encoding(accept_encoding):
+
+    # highest q value wins, q=0 means never
+    weights = {}
+    for token in accept_encoding.split(','):
+        coding, _, params = token.strip().partition(';')
+        coding = coding.strip().lower()
+        weight = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[coding] = weight
+
+    best = None
+    for coding in SUPPORTED_ENCODINGS:
+        weight = weights.get(coding, weights.get('*', 0.0))
+        if weight > 0 and (best is None or weight > weights.get(best, weights.get('*', 0.0))):
+            best = coding
+    return best
+
+
+def compress_body(encoded_body, encoding, level=None):
+    level = compression_level if level is None else level
+    data = encoded_body.encode()
+    if encoding == 'gzip':
+        # mtime=0 keeps the output identical for identical bodies
+        compressed = gzip.compress(data, compresslevel=level, mtime=0)
+    else:
+        compressed = zlib.compress(data, level)
+    return base64.b64encode(compressed).decode()
+
+
+#
+# entity tags for conditional requests. A computed tag is a hash of the encoded
+# body, kept in a small per-container cache so a payload served repeatedly
+# while the container is warm is hashed once. The cache is keyed by the body's
+# length and Python string hash, so it holds no bodies, and bodies larger than
+# ETAG_CACHE_MAX_BODY are hashed every time: for those the lookup costs about
+# as much as the sha256 it would save.
+#
+ETAG_CACHE_SIZE = 64
+ETAG_CACHE_MAX_BODY = 16 * 1024
+etag_cache = {}
+
+
+def body_etag(encoded_body):
+    if len(encoded_body) > ETAG_CACHE_MAX_BODY:
+        return '"' + hashlib.sha256(encoded_body.encode()).hexdigest()[:32] + '"'
+    key = (len(encoded_body), hash(encoded_body))
+    etag = etag_cache.get(key)
+    if etag is None:
+        etag = '"' + hashlib.sha256(encoded_body.encode()).hexdigest()[:32] + '"'
+        if len(etag_cache) >= ETAG_CACHE_SIZE:
+            # drop the oldest entry, dicts keep insertion order
+            del etag_cache[next(iter(etag_cache))]
+        etag_cache[key] = etag
+    return etag
+
+
+def quote_etag(etag):
+    return etag if etag.startswith(('"', 'W/"')) else f'"{etag}"'
+
+
+def etag_matches(etag, if_none_match):
+
+    # If-None-Match uses the weak comparison, W/ prefixes are ignored
+    if if_none_match.strip() == '*':
+        return True
+    opaque = etag[2:] if etag.startswith('W/') else etag
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        # tags handed out with a compressed body carry the coding as a suffix
+        for coding in SUPPORTED_ENCODINGS:
+            if candidate.endswith(f'-{coding}"'):
+                candidate = candidate[:-len(coding) - 2] + '"'
+        if candidate == opaque:
+            return True
+    return False
+
+
+# OPTIONS preflight answer, identical to compose_rest_response(200) without the work
+PREFLIGHT_RESPONSE = MappingProxyType({
+    'isBase64Encoded': False,
+    'statusCode': 200,
+    'body': json.dumps(''),
+})
+
+
+def compose_preflight_response():
+    return dict(PREFLIGHT_RESPONSE, headers=dict(CORS_HEADERS))
+
 
 #
-# json response utility function
+# json response utility functions
 #
-def compose_rest_response(status_code, body='', http_message=''):
+def compose_rest_response(status_code, body='', http_message='', encoder=None, accept_encoding=None,
+                          etag=None, compute_etag=False, if_none_match=None):
 
     #
     # Compose AWS Lambda proxy response format
     # https://docs.aws.amazon.com/apigateway/latest/developerguide/set-up-lambda-proxy-integrations.html#api-gateway-simple-proxy-for-lambda-output-format
     #
-    print(f"HTTP Status Code: {status_code}")
+    log_debug("HTTP Status Code: %s", status_code)
 
     status_code_int = int(status_code)
 
     lambda_rest_api_response = {
         'isBase64Encoded': False,
         'statusCode': status_code_int,
-        'headers': {'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*',
-                    'Access-Control-Allow-Headers': 'body, Content-Type, Access-Control-Allow-Headers, Access-Control-Allow-Origin, Access-Control-Allow-Methods',
-                    'Access-Control-Allow-Methods': 'PUT, GET, POST, DELETE, OPTIONS',
-        }
+        'headers': dict(CORS_HEADERS),
     }
 
     if status_code_int not in (200, 201, 204):
-        print(f"Error message inserted into body.  {body} : {http_message}")
+        log_info("Error message inserted into body.  %s : %s", body, http_message)
         body = http_message
- 
+
     #
     # json encode body, insert into response
     #
     if body is not None:
-        lambda_rest_api_response['body'] = json.dumps(body)
+        lambda_rest_api_response['body'] = encode_json(body, encoder)
     else:
-        print('body is empty')
+        log_debug('body is empty')
+
+    return finish_response(lambda_rest_api_response, accept_encoding, etag, compute_etag, if_none_match)
+
 
-    varDump(lambda_rest_api_response, 'Lambda proxy response')
+def finish_response(lambda_rest_api_response, accept_encoding=None, etag=None, compute_etag=False, if_none_match=None):
+
+    #
+    # optional ETag, supplied by the caller (e.g. a row version) or computed
+    # from the body. A matching If-None-Match turns a 200 into a bodyless 304.
+    #
+    encoded_body = lambda_rest_api_response.get('body')
+    if lambda_rest_api_response['statusCode'] == 200 and (etag is not None or (compute_etag and encoded_body is not None)):
+        etag = quote_etag(str(etag)) if etag is not None else body_etag(encoded_body)
+        lambda_rest_api_response['headers']['ETag'] = etag
+
+        if if_none_match is not None and etag_matches(etag, if_none_match):
+            log_debug("ETag %s matched, 304 Not Modified", etag)
+            lambda_rest_api_response['statusCode'] = 304
+            lambda_rest_api_response.pop('body', None)
+            if accept_encoding is not None:
+                lambda_rest_api_response['headers']['Vary'] = 'Accept-Encoding'
+            return lambda_rest_api_response
+
+    #
+    # optional compression, only worth it above the size threshold
+    #
+    if accept_encoding is not None:
+        lambda_rest_api_response['headers']['Vary'] = 'Accept-Encoding'
+        encoding = choose_encoding(accept_encoding)
+        if encoding and encoded_body is not None and len(encoded_body) >= compression_threshold:
+            lambda_rest_api_response['body'] = compress_body(encoded_body, encoding)
+            lambda_rest_api_response['headers']['Content-Encoding'] = encoding
+            lambda_rest_api_response['isBase64Encoded'] = True
+            # a strong tag must differ between the identity and compressed representations
+            if 'ETag' in lambda_rest_api_response['headers']:
+                lambda_rest_api_response['headers']['ETag'] = lambda_rest_api_response['headers']['ETag'][:-1] + f'-{encoding}"'
+
+    if log_enabled('debug'):
+        varDump(lambda_rest_api_response, 'Lambda proxy response')
 
     return lambda_rest_api_response
+
+
+#
+# streamed list responses. Rows are pulled from any iterator, e.g. a pymysql
+# SSCursor, and encoded one at a time, so the full row list never exists in
+# memory. Output is identical to json.dumps(list(rows)) unless the encoded
+# array would pass max_payload bytes, in which case it is cut off at the last
+# whole row and a continuation token for the next page is returned in the
+# X-Next-Token header. A first row that alone passes max_payload can never be
+# sent, the response is a 413 rather than an empty page pointing at itself.
+#
+# Lambda caps a synchronous response at 6MB, leave room for headers and base64
+max_payload_bytes = int(os.environ.get('max_payload_bytes', '4000000'))
+
+NEXT_TOKEN_HEADER = 'X-Next-Token'
+
+
+def offset_token(offset):
+    return base64.urlsafe_b64encode(json.dumps({'offset': offset}).encode()).decode()
+
+
+def decode_offset_token(token):
+    # offset the next page starts from, 0 for no or a malformed token
+    if not token:
+        return 0
+    try:
+        return int(json.loads(base64.urlsafe_b64decode(token.encode()))['offset'])
+    except (ValueError, KeyError, TypeError):
+        return 0
+
+
+def encode_rows(rows, max_payload=None, encoder=None):
+
+    #
+    # returns (encoded JSON array, rows encoded, last row encoded, truncated)
+    #
+    max_payload = max_payload_bytes if max_payload is None else max_payload
+    buffer = io.StringIO()
+    buffer.write('[')
+    size = 2
+    count = 0
+    last_row = None
+    truncated = False
+
+    for row in rows:
+        chunk = encode_json(row, encoder)
+        chunk_size = len(chunk) if chunk.isascii() else len(chunk.encode())
+        separator = 2 if count else 0
+        if size + separator + chunk_size > max_payload:
+            truncated = True
+            break
+        if count:
+            buffer.write(', ')
+        buffer.write(chunk)
+        size += separator + chunk_size
+        count += 1
+        last_row = row
+
+    buffer.write(']')
+    return buffer.getvalue(), count, last_row, truncated
+
+
+def compose_rest_list_response(rows, max_payload=None, encoder=None, offset=0, next_token=None,
+                               accept_encoding=None, etag=None, compute_etag=False, if_none_match=None):
+
+    #
+    # 200 response whose body is a JSON array streamed from rows. offset is the
+    # position of the first row, used for the default offset token. For keyset
+    # pagination pass next_token, called with the last row sent, returning a token.
+    #
+    lambda_rest_api_response = {
+        'isBase64Encoded': False,
+        'statusCode': 200,
+        'headers': dict(CORS_HEADERS),
+    }
+
+    encoded_body, count, last_row, truncated = encode_rows(rows, max_payload, encoder)
+    if truncated and count == 0:
+        return compose_rest_response(413, http_message=f"Row at offset {offset} is larger than the response size limit",
+                                     encoder=encoder, accept_encoding=accept_encoding)
+    lambda_rest_api_response['body'] = encoded_body
+    log_debug("HTTP Status Code: 200, %s rows streamed, truncated %s", count, truncated)
+
+    if truncated:
+        token = next_token(last_row) if next_token is not None else offset_token(offset + count)
+        lambda_rest_api_response['headers'][NEXT_TOKEN_HEADER] = token
+        # browsers only let scripts read response headers that are exposed
+        lambda_rest_api_response['headers']['Access-Control-Expose-Headers'] = NEXT_TOKEN_HEADER
+
+    return finish_response(lambda_rest_api_response, accept_encoding, etag, compute_etag, if_none_match)
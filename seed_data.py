@@ -0,0 +1,167 @@
+import json
+import os
+from collections import namedtuple
+
+#
+# onboarding content every new user receives, declared as a tree:
+# domains => areas => tasks, any number at each level. Point the seed_file
+# environment variable at a JSON file of the same shape to replace it.
+#
+# The tree is compiled once per container into one INSERT per level. Areas and
+# tasks are INSERT ... SELECT statements that join the seed rows to the parent
+# rows just written, so no parent id ever travels back to the client and the
+# round trip count does not grow with the size of the tree.
+#
+TASK_DESCRIPTION = 'Tasks are organized in two levels: Domains and Areas. On the Plan page, Domains correspond to the tabs, areas to the cards. All tasks are stored in an Area and sorted by priority. When completed, tasks show up in the calendar view.'
+
+DEFAULT_SEED = [
+    {
+        'domain_name': 'Personal',
+        'areas': [
+            {
+                'area_name': 'Home',
+                'tasks': [
+                    {'priority': 1, 'description': TASK_DESCRIPTION},
+                ],
+            },
+        ],
+    },
+]
+
+# kind is used in log and error messages: Domain, Area or Task
+SeedStatement = namedtuple('SeedStatement', ['kind', 'label', 'sql_statement', 'params'])
+
+
+def load_seed():
+    seed_file = os.environ.get('seed_file')
+    if seed_file:
+        with open(seed_file) as f:
+            return json.load(f)
+    return DEFAULT_SEED
+
+
+def derived_table(columns, row_count):
+    # SELECT %s AS a, %s AS b UNION ALL SELECT %s, %s ... one row per seed entry
+    first_row = 'SELECT ' + ', '.join(f'%s AS {column}' for column in columns)
+    other_row = 'SELECT ' + ', '.join(['%s'] * len(columns))
+    return ' UNION ALL '.join([first_row] + [other_row] * (row_count - 1))
+
+
+def placeholders(count):
+    return ', '.join(['%s'] * count)
+
+
+class SeedPlan:
+
+    def __init__(self, seed):
+        self.domain_rows = []
+        self.area_rows = []
+        self.task_rows = []
+
+        for sort_order, domain in enumerate(seed):
+            domain_name = domain['domain_name']
+            if any(row[0] == domain_name for row in self.domain_rows):
+                raise ValueError(f"Seed domain names must be unique: {domain_name}")
+            self.domain_rows.append((domain_name, domain.get('closed', 0), domain.get('sort_order', sort_order)))
+
+            for area in domain.get('areas', []):
+                area_name = area['area_name']
+                if any(row[:2] == (domain_name, area_name) for row in self.area_rows):
+                    raise ValueError(f"Seed area names must be unique within a domain: {domain_name}/{area_name}")
+                self.area_rows.append((domain_name, area_name, area.get('closed', 0)))
+
+                for task in area.get('tasks', []):
+                    self.task_rows.append((domain_name, area_name, task.get('priority', 1),
+                                           task.get('done', 0), task['description']))
+
+        self.area_params = tuple(value for row in self.area_rows for value in row)
+        self.task_params = tuple(value for row in self.task_rows for value in row)
+
+        # statement text depends only on the number of users and the form, compiled on first use
+        self.compiled = {}
+
+    def rows_per_user(self):
+        return len(self.domain_rows) + len(self.area_rows) + len(self.task_rows)
+
+    def compile(self, user_count, missing_only=False):
+
+        #
+        # missing_only compiles the repair form: every INSERT skips seed rows the
+        # user already has, so it can be re-run safely on a partially seeded user
+        #
+        users = placeholders(user_count)
+        sql_statements = []
+
+        if self.domain_rows and missing_only:
+            sql_statements.append(
+                "INSERT INTO domains (domain_name, creator_fk, closed, sort_order) "
+                "SELECT seed.domain_name, users.creator_fk, seed.closed, seed.sort_order "
+                f"FROM ({derived_table(['domain_name', 'closed', 'sort_order'], len(self.domain_rows))}) seed "
+                f"CROSS JOIN ({derived_table(['creator_fk'], user_count)}) users "
+                "WHERE NOT EXISTS (SELECT 1 FROM domains existing "
+                "WHERE existing.creator_fk = users.creator_fk AND existing.domain_name = seed.domain_name);")
+        elif self.domain_rows:
+            sql_statements.append(
+                "INSERT INTO domains (domain_name, creator_fk, closed, sort_order) VALUES "
+                + ', '.join(['(%s, %s, %s, %s)'] * (len(self.domain_rows) * user_count)) + ";")
+
+        if self.area_rows:
+            missing_area = (" AND NOT EXISTS (SELECT 1 FROM areas existing "
+                            "WHERE existing.domain_fk = d.id AND existing.area_name = seed.area_name)")
+            sql_statements.append(
+                "INSERT INTO areas (area_name, domain_fk, creator_fk, closed) "
+                "SELECT seed.area_name, d.id, d.creator_fk, seed.closed FROM domains d "
+                f"JOIN ({derived_table(['domain_name', 'area_name', 'closed'], len(self.area_rows))}) seed "
+                f"ON seed.domain_name = d.domain_name WHERE d.creator_fk IN ({users})"
+                + (missing_area if missing_only else '') + ";")
+
+        if self.task_rows:
+            missing_task = (" AND NOT EXISTS (SELECT 1 FROM tasks existing "
+                            "WHERE existing.area_fk = a.id AND existing.description = seed.description)")
+            sql_statements.append(
+                "INSERT INTO tasks (priority, done, description, area_fk, creator_fk) "
+                "SELECT seed.priority, seed.done, seed.description, a.id, a.creator_fk FROM areas a "
+                "JOIN domains d ON d.id = a.domain_fk "
+                f"JOIN ({derived_table(['domain_name', 'area_name', 'priority', 'done', 'description'], len(self.task_rows))}) seed "
+                "ON seed.domain_name = d.domain_name AND seed.area_name = a.area_name "
+                f"WHERE a.creator_fk IN ({users})"
+                + (missing_task if missing_only else '') + ";")
+
+        self.compiled[(user_count, missing_only)] = sql_statements
+        return sql_statements
+
+    def statements(self, user_names, missing_only=False):
+
+        #
+        # SeedStatements creating the seed tree for every user in user_names,
+        # or with missing_only just the seed rows each user is missing
+        #
+        compiled_key = (len(user_names), missing_only)
+        sql_statements = self.compiled.get(compiled_key) or self.compile(*compiled_key)
+        user_names = tuple(user_names)
+        statements = []
+
+        if self.domain_rows and missing_only:
+            domain_params = tuple(value for row in self.domain_rows for value in row) + user_names
+            statements.append(SeedStatement('Domain', 'REPAIR DOMAINS', sql_statements[len(statements)], domain_params))
+        elif self.domain_rows:
+            domain_params = tuple(value
+                                  for userName in user_names
+                                  for domain_name, closed, sort_order in self.domain_rows
+                                  for value in (domain_name, userName, closed, sort_order))
+            statements.append(SeedStatement('Domain', 'CREATE NEW DOMAINS', sql_statements[len(statements)], domain_params))
+
+        if self.area_rows:
+            statements.append(SeedStatement('Area', 'REPAIR AREAS' if missing_only else 'CREATE NEW AREAS',
+                                            sql_statements[len(statements)], self.area_params + user_names))
+
+        if self.task_rows:
+            statements.append(SeedStatement('Task', 'REPAIR TASKS' if missing_only else 'CREATE NEW TASKS',
+                                            sql_statements[len(statements)], self.task_params + user_names))
+
+        return statements
+
+
+# compiled once at cold start
+SEED_PLAN = SeedPlan(load_seed())
+SEED_PLAN.compile(1)
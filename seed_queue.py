@@ -0,0 +1,168 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+#
+# pluggable queue for "seed user" jobs in two phase signup mode.
+#
+# every backend offers the same three calls:
+#   put(job)            enqueue one job dict
+#   receive(max_jobs)   up to max_jobs (receipt, job) pairs, hidden from other receivers
+#   delete(receipts)    acknowledge jobs that were processed
+#
+# select the backend with the seed_queue_backend environment variable:
+#   spool   SQLite file at seed_queue_path, survives restarts on one host
+#   sqs     Amazon SQS queue at seed_queue_url, needs boto3
+#
+# A spool is only seen by a seed worker that opens the same file. In Lambda,
+# /tmp belongs to one container and nothing drains it, so seed_queue_path must
+# be on shared storage (an EFS mount) with seed_worker.py running against
+# that mount. Inside Lambda a spool under /tmp is not counted as configured.
+#
+# There is no default. A job put in a Lambda container's memory is never
+# drained, so MemoryQueue is only for tests, which set queue directly.
+#
+# The queue may be built and used from worker threads (async_handler puts
+# through asyncio.to_thread), SpoolQueue serializes its one SQLite connection.
+#
+
+# seconds a received job stays hidden before it is handed out again
+VISIBILITY_TIMEOUT = 60
+
+
+class MemoryQueue:
+
+    def __init__(self):
+        self.jobs = []
+        self.in_flight = {}
+        self.next_receipt = 0
+
+    def put(self, job):
+        self.jobs.append(job)
+
+    def receive(self, max_jobs):
+        received = []
+        while self.jobs and len(received) < max_jobs:
+            self.next_receipt += 1
+            job = self.jobs.pop(0)
+            self.in_flight[self.next_receipt] = job
+            received.append((self.next_receipt, job))
+        return received
+
+    def delete(self, receipts):
+        for receipt in receipts:
+            self.in_flight.pop(receipt, None)
+
+
+class SpoolQueue:
+
+    def __init__(self, path, visibility_timeout=VISIBILITY_TIMEOUT):
+        self.visibility_timeout = visibility_timeout
+        # one connection shared by every thread, one call at a time
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.db.execute("CREATE TABLE IF NOT EXISTS seed_jobs "
+                        "(id INTEGER PRIMARY KEY AUTOINCREMENT, body TEXT NOT NULL, claimed_at REAL)")
+
+    def put(self, job):
+        with self.lock:
+            self.db.execute("INSERT INTO seed_jobs (body) VALUES (?)", (json.dumps(job),))
+
+    def receive(self, max_jobs):
+        now = time.time()
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self.db.execute(
+                    "SELECT id, body FROM seed_jobs WHERE claimed_at IS NULL OR claimed_at < ? ORDER BY id LIMIT ?",
+                    (now - self.visibility_timeout, max_jobs)).fetchall()
+                self.db.executemany("UPDATE seed_jobs SET claimed_at = ? WHERE id = ?",
+                                    [(now, row[0]) for row in rows])
+                self.db.execute("COMMIT")
+            except sqlite3.Error:
+                self.db.execute("ROLLBACK")
+                raise
+        return [(job_id, json.loads(body)) for job_id, body in rows]
+
+    def delete(self, receipts):
+        with self.lock:
+            self.db.executemany("DELETE FROM seed_jobs WHERE id = ?", [(receipt,) for receipt in receipts])
+
+
+class SQSQueue:
+
+    # SQS caps receive and delete batches at 10 messages
+    SQS_BATCH = 10
+
+    def __init__(self, queue_url):
+        import boto3
+        self.queue_url = queue_url
+        self.sqs = boto3.client('sqs')
+
+    def put(self, job):
+        self.sqs.send_message(QueueUrl=self.queue_url, MessageBody=json.dumps(job))
+
+    def receive(self, max_jobs):
+        received = []
+        while len(received) < max_jobs:
+            response = self.sqs.receive_message(
+                QueueUrl=self.queue_url,
+                MaxNumberOfMessages=min(self.SQS_BATCH, max_jobs - len(received)),
+                WaitTimeSeconds=0)
+            messages = response.get('Messages', [])
+            if not messages:
+                break
+            received.extend((message['ReceiptHandle'], json.loads(message['Body'])) for message in messages)
+        return received
+
+    def delete(self, receipts):
+        receipts = list(receipts)
+        for start in range(0, len(receipts), self.SQS_BATCH):
+            entries = [{'Id': str(index), 'ReceiptHandle': receipt}
+                       for index, receipt in enumerate(receipts[start:start + self.SQS_BATCH])]
+            self.sqs.delete_message_batch(QueueUrl=self.queue_url, Entries=entries)
+
+
+DURABLE_BACKENDS = ('spool', 'sqs')
+# container local storage in Lambda, a spool there is never drained
+LAMBDA_LOCAL_STORAGE = '/tmp/'
+
+# one queue per container, built on first use
+queue = None
+queue_lock = threading.Lock()
+
+
+def configured():
+    # True when jobs put now will be seen by a seed worker
+    if queue is not None:
+        return True
+    backend = os.environ.get('seed_queue_backend')
+    if backend == 'spool' and 'AWS_LAMBDA_FUNCTION_NAME' in os.environ:
+        return not os.path.abspath(os.environ.get('seed_queue_path', '')).startswith(LAMBDA_LOCAL_STORAGE)
+    return backend in DURABLE_BACKENDS
+
+
+def get_queue():
+    global queue
+    with queue_lock:
+        if queue is None:
+            queue = new_queue()
+    return queue
+
+
+def put(job):
+    # enqueue on the container's queue, safe to call from a worker thread
+    get_queue().put(job)
+
+
+def new_queue():
+    backend = os.environ.get('seed_queue_backend')
+    if backend == 'spool':
+        return SpoolQueue(os.environ['seed_queue_path'])
+    if backend == 'sqs':
+        return SQSQueue(os.environ['seed_queue_url'])
+    if backend is None:
+        raise ValueError("seed_queue_backend is not set, use spool or sqs")
+    raise ValueError(f"Unknown seed_queue_backend: {backend}")
@@ -0,0 +1,70 @@
+import argparse
+import json
+import sys
+
+import seed_queue
+from classifier import log_info
+from provisioning import repair_users
+
+#
+# second phase of two phase signup: create seed data for users whose profile
+# lambda_handler already committed.
+#
+# Lambda:  handler seed_worker.worker_handler behind an SQS event source mapping
+# CLI:     python seed_worker.py [--batch-size 100]   drains the configured queue
+#
+# Seeding uses the missing_only seed plan, so a job delivered twice or a user
+# seeded inline after an enqueue failure never gets duplicate rows.
+#
+
+DEFAULT_BATCH_SIZE = 100
+
+
+def seed_batch(conn, jobs):
+    user_names = sorted({job['userName'] for job in jobs})
+    if user_names:
+        repair_users(conn, user_names)
+    return len(user_names)
+
+
+def drain(queue, conn, batch_size=DEFAULT_BATCH_SIZE):
+
+    #
+    # seed every queued user, batch_size users per transaction.
+    # a failed batch is left unacknowledged and reappears after the visibility timeout.
+    #
+    seeded = 0
+    while True:
+        received = queue.receive(batch_size)
+        if not received:
+            return seeded
+        seeded += seed_batch(conn, [job for _, job in received])
+        queue.delete([receipt for receipt, _ in received])
+
+
+def worker_handler(event, context):
+
+    # SQS event source mapping delivers up to a batch of records, raising returns them to the queue
+    from lambda_function import get_connection
+
+    jobs = [json.loads(record['body']) for record in event.get('Records', [])]
+    seeded = seed_batch(get_connection(), jobs)
+    log_info("Seed worker: %s users seeded", seeded)
+    return {'seeded': seeded}
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Drain the seed user queue')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    from lambda_function import get_connection
+
+    seeded = drain(seed_queue.get_queue(), get_connection(), args.batch_size)
+    print(f"Seed worker: {seeded} users seeded")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,158 @@
+import collections
+import os
+import time
+
+from classifier import normalize_sql, log_info, log_warning
+
+#
+# opt-in statement profiler wrapped around the pymysql connection.
+#
+# Every statement is recorded with its normalized text, parameter count,
+# execution time, rows affected and whether its transaction was committed.
+# The newest entries are kept in a bounded ring buffer per process and any
+# statement slower than slow_query_ms is written to the log as it happens,
+# giving round trip counts and slow statements without the server side
+# general log on a shared RDS instance.
+#
+
+ring_size = int(os.environ.get('sql_profile_size', '256'))
+slow_query_ms = float(os.environ.get('slow_query_ms', '100'))
+
+# newest statements across all invocations in this container
+recent = collections.deque(maxlen=ring_size)
+
+# totals for the current invocation, see reset_invocation
+invocation = {'statements': 0, 'commits': 0, 'rollbacks': 0, 'total_ms': 0.0, 'slow': 0}
+
+
+def reset_invocation():
+    invocation.update(statements=0, commits=0, rollbacks=0, total_ms=0.0, slow=0)
+
+
+def log_invocation_summary():
+    log_info("SQL profile: %s statements, %s commits, %s rollbacks, %s slow, %.2f ms",
+             invocation['statements'], invocation['commits'], invocation['rollbacks'],
+             invocation['slow'], invocation['total_ms'])
+
+
+def param_count(params):
+    if params is None:
+        return 0
+    return len(params)
+
+
+def record(owner, sql_statement, params, elapsed_ms, rows, error):
+    entry = {
+        'sql': normalize_sql(sql_statement),
+        'params': params,
+        'ms': round(elapsed_ms, 3),
+        'rows': rows,
+        'committed': False,
+        'error': error,
+    }
+    recent.append(entry)
+    owner.pending.append(entry)
+
+    invocation['statements'] += 1
+    invocation['total_ms'] += elapsed_ms
+
+    if elapsed_ms >= slow_query_ms:
+        invocation['slow'] += 1
+        log_warning("Slow query %.1f ms, %s rows, %s params: %s",
+                    elapsed_ms, rows, params, entry['sql'])
+
+    # a multi statement batch may carry its own COMMIT
+    if error is None and entry['sql'].upper().endswith('COMMIT;'):
+        owner.mark_committed()
+
+
+class ProfilingConnection:
+
+    def __init__(self, conn):
+        self.conn = conn
+        # entries of the open transaction, flagged committed on commit
+        self.pending = []
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+    def cursor(self, *args, **kwargs):
+        return ProfilingCursor(self, self.conn.cursor(*args, **kwargs))
+
+    def mark_committed(self):
+        for entry in self.pending:
+            entry['committed'] = True
+        self.pending = []
+        invocation['commits'] += 1
+
+    def commit(self):
+        started = time.perf_counter()
+        self.conn.commit()
+        invocation['total_ms'] += (time.perf_counter() - started) * 1000
+        self.mark_committed()
+
+    def rollback(self):
+        started = time.perf_counter()
+        try:
+            self.conn.rollback()
+        finally:
+            invocation['total_ms'] += (time.perf_counter() - started) * 1000
+            invocation['rollbacks'] += 1
+            self.pending = []
+
+
+class ProfilingCursor:
+
+    def __init__(self, owner, cursor):
+        self.owner = owner
+        self.cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.cursor.close()
+
+    def execute(self, sql_statement, args=None):
+        started = time.perf_counter()
+        rows, error = None, None
+        try:
+            rows = self.cursor.execute(sql_statement, args)
+            return rows
+        except Exception as e:
+            error = e.args[0] if e.args else type(e).__name__
+            raise
+        finally:
+            record(self.owner, sql_statement, param_count(args),
+                   (time.perf_counter() - started) * 1000, rows, error)
+
+    def execute_prepared(self, sql_statement, args=None):
+        import prepared_statements
+        started = time.perf_counter()
+        rows, error = None, None
+        try:
+            rows = prepared_statements.execute(self.cursor, sql_statement, args)
+            return rows
+        except Exception as e:
+            error = e.args[0] if e.args else type(e).__name__
+            raise
+        finally:
+            record(self.owner, sql_statement, param_count(args),
+                   (time.perf_counter() - started) * 1000, rows, error)
+
+    def executemany(self, sql_statement, args):
+        args = list(args)
+        started = time.perf_counter()
+        rows, error = None, None
+        try:
+            rows = self.cursor.executemany(sql_statement, args)
+            return rows
+        except Exception as e:
+            error = e.args[0] if e.args else type(e).__name__
+            raise
+        finally:
+            record(self.owner, sql_statement, sum(param_count(row) for row in args),
+                   (time.perf_counter() - started) * 1000, rows, error)
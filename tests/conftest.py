@@ -1,10 +1,22 @@
 """
 Lambda-Cognito pytest shared fixtures.
 
-All tests use darwin_dev test database. Never touches darwin production.
-
-Since darwin_dev uses production-identical table names (profiles, domains,
-areas, tasks), we only need to patch get_connection() to point at darwin_dev.
+All tests use a darwin_dev test database. Never touches darwin production.
+
+The backend is chosen with the test_db_backend environment variable:
+  sqlite  (default) in-process stand-in, see sqlite_backend.py, no server needed
+  mysql   the live darwin_dev MySQL database at endpoint/username/db_password
+
+The mysql backend needs two profiles columns darwin_dev does not have yet,
+last_login (last_login.py) and created with its keyset index (reconcile.py).
+Without them test_15 and test_20 fail with 1054 Unknown column:
+  ALTER TABLE profiles
+      ADD COLUMN last_login DATETIME NULL,
+      ADD COLUMN created DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+      ADD INDEX profiles_created (created, id);
+
+Both use production-identical table names (profiles, domains, areas, tasks),
+so we only need to patch get_connection() to point at darwin_dev.
 No SQL rewriting or table name translation needed.
 """
 import sys
@@ -17,22 +29,41 @@ import pytest
 # Add Lambda-Cognito root to path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
+import sqlite_backend  # noqa: E402
+
+TEST_DB_BACKEND = os.environ.get('test_db_backend', 'sqlite')
+
 
 # ---------------------------------------------------------------------------
 # Database connection
 # ---------------------------------------------------------------------------
 
-@pytest.fixture(scope="session")
-def db_connection():
-    """Direct pymysql connection to darwin_dev test database."""
-    conn = pymysql.connect(
+def connect_test_db(cursorclass=None):
+    """New connection to darwin_dev on the configured backend."""
+    if TEST_DB_BACKEND == 'sqlite':
+        return sqlite_backend.connect(database='darwin_dev', cursorclass=cursorclass)
+    return pymysql.connect(
         host=os.environ['endpoint'],
         user=os.environ['username'],
         password=os.environ['db_password'],
         database='darwin_dev',
-        cursorclass=pymysql.cursors.DictCursor,
+        cursorclass=cursorclass or pymysql.cursors.Cursor,
         autocommit=False,
     )
+
+
+@pytest.fixture(scope="session")
+def db_connection():
+    """Direct connection to darwin_dev test database, rows as dicts."""
+    conn = connect_test_db(cursorclass=pymysql.cursors.DictCursor)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture(scope="session")
+def handler_connection():
+    """The one connection every patched lambda invocation reuses."""
+    conn = connect_test_db()
     yield conn
     conn.close()
 
@@ -93,13 +124,13 @@ def build_cognito_event(
 # ---------------------------------------------------------------------------
 
 @pytest.fixture(scope="session")
-def invoke_cognito():
+def invoke_cognito(handler_connection):
     """Invoke lambda_handler with connection patched to darwin_dev.
 
     The real lambda_function.py uses get_connection() which connects to the
     production darwin database. This fixture patches get_connection() to
-    connect to darwin_dev instead. Since darwin_dev uses production-identical
-    table names, no SQL rewriting is needed.
+    return one darwin_dev connection reused by every invocation. Since
+    darwin_dev uses production-identical table names, no SQL rewriting is needed.
 
     Returns a callable: invoke_cognito(event) -> result
     """
@@ -112,12 +143,7 @@ def invoke_cognito():
         original_get_connection = lambda_function.get_connection
 
         def patched_get_connection():
-            return pymysql.connect(
-                host=os.environ['endpoint'],
-                user=os.environ['username'],
-                password=os.environ['db_password'],
-                database='darwin_dev',
-            )
+            return handler_connection
 
         # Patch get_connection and reset module connection
         lambda_function.get_connection = patched_get_connection
@@ -128,6 +154,8 @@ def invoke_cognito():
         finally:
             lambda_function.get_connection = original_get_connection
             lambda_function.connection = None
+            # discard anything left uncommitted, as closing a fresh connection would
+            handler_connection.rollback()
 
         return result
 
@@ -147,12 +175,12 @@ def cleanup_test_data(db_connection, test_user_name, created_users):
     case tests that create users with dynamic UUIDs).
     """
     yield
-    # Collect all user IDs to clean up
+    # Collect all user IDs to clean up, one set-based DELETE per table
     all_users = list(set([test_user_name] + created_users))
+    placeholders = ', '.join(['%s'] * len(all_users))
     with db_connection.cursor() as cur:
-        for user_id in all_users:
-            cur.execute("DELETE FROM tasks WHERE creator_fk = %s", (user_id,))
-            cur.execute("DELETE FROM areas WHERE creator_fk = %s", (user_id,))
-            cur.execute("DELETE FROM domains WHERE creator_fk = %s", (user_id,))
-            cur.execute("DELETE FROM profiles WHERE id = %s", (user_id,))
+        cur.execute(f"DELETE FROM tasks WHERE creator_fk IN ({placeholders})", all_users)
+        cur.execute(f"DELETE FROM areas WHERE creator_fk IN ({placeholders})", all_users)
+        cur.execute(f"DELETE FROM domains WHERE creator_fk IN ({placeholders})", all_users)
+        cur.execute(f"DELETE FROM profiles WHERE id IN ({placeholders})", all_users)
     db_connection.commit()
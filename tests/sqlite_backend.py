@@ -0,0 +1,291 @@
+"""
+In-process SQLite stand-in for the pymysql surface the Lambda code uses.
+
+connect() returns a connection to a named in-memory database holding the
+darwin schema (profiles, domains, areas, tasks). Every connection to the same
+name shares one SQLite connection, so the test fixtures and the handler see
+the same rows and the same transaction, as a single reused MySQL session would.
+
+MySQL %s placeholders, LAST_INSERT_ID(), GREATEST(), multi statement batches and
+DictCursor rows are translated. SQLite errors are raised as the pymysql
+exception classes with the MySQL error codes the handler logs, e.g. 1062 for
+a duplicate profile and 1048 for a missing name or email.
+"""
+import datetime
+import re
+import sqlite3
+import threading
+
+import pymysql
+from pymysql.constants import CLIENT
+
+SCHEMA = """
+CREATE TABLE profiles (
+    id VARCHAR(128) PRIMARY KEY,
+    name VARCHAR(128) NOT NULL,
+    email VARCHAR(256) NOT NULL,
+    last_login DATETIME NULL,
+    created DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE domains (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    domain_name VARCHAR(32) NOT NULL,
+    creator_fk VARCHAR(128) NOT NULL,
+    closed TINYINT NOT NULL DEFAULT 0,
+    sort_order INT NULL
+);
+CREATE TABLE areas (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    area_name VARCHAR(32) NOT NULL,
+    domain_fk INT NOT NULL,
+    creator_fk VARCHAR(128) NOT NULL,
+    closed TINYINT NOT NULL DEFAULT 0,
+    sort_order INT NULL
+);
+CREATE TABLE tasks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    priority TINYINT NOT NULL,
+    done TINYINT NOT NULL DEFAULT 0,
+    description VARCHAR(1024) NOT NULL,
+    area_fk INT NOT NULL,
+    creator_fk VARCHAR(128) NOT NULL
+);
+CREATE INDEX profiles_created ON profiles (created, id);
+CREATE INDEX domains_creator ON domains (creator_fk);
+CREATE INDEX areas_creator ON areas (creator_fk);
+CREATE INDEX areas_domain ON areas (domain_fk);
+CREATE INDEX tasks_creator ON tasks (creator_fk);
+CREATE INDEX tasks_area ON tasks (area_fk);
+"""
+
+# name => (shared sqlite3 connection, lock serializing statements across threads)
+databases = {}
+
+LAST_INSERT_ID = re.compile(r'LAST_INSERT_ID\(\)', re.IGNORECASE)
+# SQLite's scalar max() takes several arguments like MySQL's GREATEST()
+GREATEST = re.compile(r'\bGREATEST\(', re.IGNORECASE)
+NOT_NULL = re.compile(r'NOT NULL constraint failed: \w+\.(\w+)')
+
+
+def open_database(database):
+    if database not in databases:
+        sqlite_conn = sqlite3.connect(':memory:', check_same_thread=False)
+        sqlite_conn.executescript(SCHEMA)
+        databases[database] = (sqlite_conn, threading.RLock())
+    return databases[database]
+
+
+def drop_database(database):
+    sqlite_conn, _ = databases.pop(database, (None, None))
+    if sqlite_conn is not None:
+        sqlite_conn.close()
+
+
+def connect(database='darwin_dev', cursorclass=None, client_flag=0, autocommit=False, **ignored):
+    """Same call shape as pymysql.connect, host and credentials are ignored."""
+    return Connection(database, cursorclass or pymysql.cursors.Cursor, client_flag, autocommit)
+
+
+def translate_error(e):
+
+    # sqlite3 exception => pymysql exception with the MySQL error code
+    message = str(e)
+    if isinstance(e, sqlite3.IntegrityError):
+        not_null = NOT_NULL.search(message)
+        if not_null:
+            return pymysql.err.IntegrityError(1048, f"Column '{not_null.group(1)}' cannot be null")
+        if 'UNIQUE' in message:
+            return pymysql.err.IntegrityError(1062, f"Duplicate entry: {message}")
+        return pymysql.err.IntegrityError(1452, message)
+    if 'no such table' in message:
+        return pymysql.err.ProgrammingError(1146, f"Table doesn't exist: {message}")
+    if 'no such column' in message:
+        return pymysql.err.OperationalError(1054, f"Unknown column: {message}")
+    if 'syntax error' in message:
+        return pymysql.err.ProgrammingError(1064, f"You have an error in your SQL syntax: {message}")
+    return pymysql.err.OperationalError(1105, message)
+
+
+def to_sqlite_value(value):
+    if isinstance(value, datetime.datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    if isinstance(value, bool):
+        return int(value)
+    return value
+
+
+def split_statements(sql_statement):
+
+    # top level ; separated statements, a ; inside a quoted literal does not split
+    statements = []
+    current = []
+    quote = None
+    for char in sql_statement:
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in ("'", '"'):
+            quote = char
+        elif char == ';':
+            statements.append(''.join(current).strip())
+            current = []
+            continue
+        current.append(char)
+    statements.append(''.join(current).strip())
+    return [statement for statement in statements if statement]
+
+
+class Connection:
+
+    def __init__(self, database, cursorclass, client_flag, autocommit):
+        self.database = database
+        self.cursorclass = cursorclass
+        self.client_flag = client_flag
+        self.autocommit_mode = autocommit
+        self.sqlite_conn, self.lock = open_database(database)
+        self.open = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def check_open(self):
+        if not self.open:
+            raise pymysql.err.InterfaceError(0, 'Not connected')
+
+    def cursor(self, cursor=None):
+        self.check_open()
+        return Cursor(self, cursor or self.cursorclass)
+
+    def commit(self):
+        self.check_open()
+        with self.lock:
+            self.sqlite_conn.commit()
+
+    def rollback(self):
+        self.check_open()
+        with self.lock:
+            self.sqlite_conn.rollback()
+
+    def ping(self, reconnect=True):
+        if not self.open:
+            if not reconnect:
+                raise pymysql.err.Error('Already closed')
+            self.sqlite_conn, self.lock = open_database(self.database)
+            self.open = True
+
+    def autocommit(self, value):
+        self.autocommit_mode = bool(value)
+
+    def close(self):
+        if not self.open:
+            raise pymysql.err.Error('Already closed')
+        self.open = False
+
+
+class Cursor:
+
+    def __init__(self, connection, cursorclass):
+        self.connection = connection
+        self.as_dict = issubclass(cursorclass, pymysql.cursors.DictCursorMixin)
+        self.results = []
+        self.rows = []
+        self.description = None
+        self.rowcount = -1
+        self.lastrowid = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def close(self):
+        self.results = []
+        self.rows = []
+
+    def execute(self, sql_statement, args=None):
+        self.connection.check_open()
+        if args is not None:
+            sql_statement = sql_statement.replace('%s', '?').replace('%%', '%')
+            args = [to_sqlite_value(value) for value in args]
+        sql_statement = LAST_INSERT_ID.sub('last_insert_rowid()', sql_statement)
+        sql_statement = GREATEST.sub('max(', sql_statement)
+
+        statements = split_statements(sql_statement)
+        if len(statements) > 1 and not self.connection.client_flag & CLIENT.MULTI_STATEMENTS:
+            raise pymysql.err.ProgrammingError(1064, 'You have an error in your SQL syntax: multiple statements')
+
+        # each statement takes its share of the arguments, in order
+        self.results = []
+        remaining = list(args or [])
+        with self.connection.lock:
+            for statement in statements:
+                placeholder_count = statement.count('?') if args is not None else 0
+                params, remaining = remaining[:placeholder_count], remaining[placeholder_count:]
+                self.results.append(self.run(statement, params))
+
+            if self.connection.autocommit_mode:
+                self.connection.sqlite_conn.commit()
+
+        self.nextset()
+        return self.rowcount
+
+    def run(self, statement, params):
+        sqlite_conn = self.connection.sqlite_conn
+        keyword = statement.split(None, 1)[0].upper()
+        if keyword == 'COMMIT':
+            sqlite_conn.commit()
+            return None, [], 0, None
+        if keyword == 'ROLLBACK':
+            sqlite_conn.rollback()
+            return None, [], 0, None
+        if keyword in ('BEGIN', 'START'):
+            return None, [], 0, None
+
+        try:
+            sqlite_cursor = sqlite_conn.execute(statement, params)
+            rows = sqlite_cursor.fetchall()
+        except sqlite3.Error as e:
+            raise translate_error(e) from e
+
+        description = sqlite_cursor.description
+        if description is not None:
+            names = [column[0] for column in description]
+            if self.as_dict:
+                rows = [dict(zip(names, row)) for row in rows]
+            return description, rows, len(rows), sqlite_cursor.lastrowid
+        return None, [], sqlite_cursor.rowcount, sqlite_cursor.lastrowid
+
+    def executemany(self, sql_statement, args):
+        rowcount = 0
+        for params in args:
+            rowcount += self.execute(sql_statement, params)
+        self.rowcount = rowcount
+        return rowcount
+
+    def nextset(self):
+        if not self.results:
+            return None
+        self.description, self.rows, self.rowcount, lastrowid = self.results.pop(0)
+        if lastrowid:
+            self.lastrowid = lastrowid
+        return True
+
+    def fetchone(self):
+        return self.rows.pop(0) if self.rows else None
+
+    def fetchmany(self, size=1):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
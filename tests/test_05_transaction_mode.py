@@ -0,0 +1,81 @@
+"""
+Test the single-transaction provisioning mode.
+
+With provision_mode='transaction' the profile, domain, area and task are
+written in one transaction: either the full hierarchy exists or nothing does.
+"""
+import uuid
+
+import pytest
+
+from conftest import build_cognito_event
+
+
+@pytest.fixture
+def transaction_mode(monkeypatch):
+    """Switch lambda_function into transaction provisioning for one test."""
+    import lambda_function
+    monkeypatch.setattr(lambda_function, 'provision_mode', 'transaction')
+
+
+def test_transaction_mode_creates_hierarchy(invoke_cognito, created_users, db_connection, transaction_mode):
+    """Transaction mode provisions the full profile → domain → area → task chain."""
+    user_name = f"cognito-test-txn-{uuid.uuid4().hex[:6]}"
+    created_users.append(user_name)
+    event = build_cognito_event(user_name=user_name, name='Txn User', email='txn@test.com')
+
+    result = invoke_cognito(event)
+    assert isinstance(result, dict)
+
+    with db_connection.cursor() as cur:
+        cur.execute(
+            "SELECT t.priority, a.area_name, d.domain_name, p.name "
+            "FROM tasks t "
+            "JOIN areas a ON t.area_fk = a.id "
+            "JOIN domains d ON a.domain_fk = d.id "
+            "JOIN profiles p ON d.creator_fk = p.id "
+            "WHERE p.id = %s",
+            (user_name,),
+        )
+        rows = cur.fetchall()
+
+    assert len(rows) == 1
+    assert rows[0]['domain_name'] == 'Personal'
+    assert rows[0]['area_name'] == 'Home'
+    assert rows[0]['priority'] == 1
+
+
+def test_transaction_mode_rolls_back_on_failure(invoke_cognito, created_users, db_connection,
+                                                transaction_mode, monkeypatch):
+    """A failure in the last INSERT leaves no profile, domain or area behind."""
+    import provisioning
+    from seed_data import SeedPlan, SeedStatement, DEFAULT_SEED
+
+    class FailingSeedPlan(SeedPlan):
+        def statements(self, user_names):
+            broken = SeedStatement('Task', 'BROKEN TASK', "INSERT INTO no_such_table (id) VALUES (%s);", (user_names[0],))
+            return super().statements(user_names) + [broken]
+
+    monkeypatch.setattr(provisioning, 'SEED_PLAN', FailingSeedPlan(DEFAULT_SEED))
+
+    user_name = f"cognito-test-txn-fail-{uuid.uuid4().hex[:6]}"
+    created_users.append(user_name)
+    event = build_cognito_event(user_name=user_name, name='Txn Fail', email='txnfail@test.com')
+
+    result = invoke_cognito(event)
+    assert isinstance(result, str)
+    assert 'failed' in result.lower()
+
+    with db_connection.cursor() as cur:
+        cur.execute("SELECT COUNT(*) AS cnt FROM profiles WHERE id = %s", (user_name,))
+        assert cur.fetchone()['cnt'] == 0
+        cur.execute("SELECT COUNT(*) AS cnt FROM domains WHERE creator_fk = %s", (user_name,))
+        assert cur.fetchone()['cnt'] == 0
+
+
+def test_transaction_mode_duplicate_returns_error(invoke_cognito, test_user_name, transaction_mode):
+    """A duplicate userName still returns an error string in transaction mode."""
+    event = build_cognito_event(user_name=test_user_name, name='Dup', email='dup@test.com')
+    result = invoke_cognito(event)
+    assert isinstance(result, str)
+    assert 'failed' in result.lower()
@@ -0,0 +1,114 @@
+"""
+Test the offline bulk backfill CLI.
+
+Verifies export parsing (CSV and JSONL), dry-run counting, resume offsets
+and that chunked multi-row INSERTs build the same hierarchy as the handler.
+"""
+import json
+import uuid
+
+import pytest
+
+import backfill
+from conftest import connect_test_db
+
+
+def write_csv(path, users):
+    with open(path, 'w') as f:
+        f.write('name,email,cognito:username\n')
+        for user_name, name, email in users:
+            f.write(f'{name},{email},{user_name}\n')
+
+
+def write_jsonl(path, users):
+    with open(path, 'w') as f:
+        for user_name, name, email in users:
+            record = {
+                'Username': user_name,
+                'Attributes': [{'Name': 'name', 'Value': name}, {'Name': 'email', 'Value': email}],
+            }
+            f.write(json.dumps(record) + '\n')
+
+
+@pytest.fixture
+def export_users():
+    return [(f"cognito-test-bf-{uuid.uuid4().hex[:6]}", f'Backfill {i}', f'bf{i}@test.com') for i in range(5)]
+
+
+def test_read_export_csv_and_jsonl(tmp_path, export_users):
+    """Both export formats stream the same (userName, name, email) tuples."""
+    csv_path = str(tmp_path / 'users.csv')
+    jsonl_path = str(tmp_path / 'users.jsonl')
+    write_csv(csv_path, export_users)
+    write_jsonl(jsonl_path, export_users)
+
+    assert list(backfill.read_export(csv_path)) == export_users
+    assert list(backfill.read_export(jsonl_path)) == export_users
+
+
+def test_dry_run_counts_from_offset(tmp_path, export_users):
+    """Dry run counts users after the offset without a connection."""
+    path = str(tmp_path / 'users.jsonl')
+    write_jsonl(path, export_users)
+
+    provisioned, next_offset = backfill.backfill(path, None, batch_size=2, offset=2, dry_run=True)
+    assert provisioned == 3
+    assert next_offset == 5
+
+
+def test_backfill_provisions_hierarchy(tmp_path, export_users, created_users, db_connection):
+    """Backfilled users get the same profile → domain → area → task chain."""
+    created_users.extend(user_name for user_name, _, _ in export_users)
+    path = str(tmp_path / 'users.csv')
+    write_csv(path, export_users)
+
+    conn = connect_test_db()
+    try:
+        provisioned, _ = backfill.backfill(path, conn, batch_size=2)
+    finally:
+        conn.close()
+
+    assert provisioned == len(export_users)
+
+    user_names = [user_name for user_name, _, _ in export_users]
+    placeholders = ', '.join(['%s'] * len(user_names))
+    with db_connection.cursor() as cur:
+        cur.execute(
+            "SELECT COUNT(*) AS cnt FROM tasks t "
+            "JOIN areas a ON t.area_fk = a.id "
+            "JOIN domains d ON a.domain_fk = d.id "
+            f"WHERE d.domain_name = 'Personal' AND a.area_name = 'Home' AND t.creator_fk IN ({placeholders})",
+            user_names,
+        )
+        assert cur.fetchone()['cnt'] == len(export_users)
+
+
+def test_backfill_skips_existing_users(tmp_path, export_users, created_users, db_connection):
+    """Existing profiles are not inserted again, only an unseeded one gets seed rows."""
+    created_users.extend(user_name for user_name, _, _ in export_users)
+    seeded, unseeded = export_users[0][0], export_users[1][0]
+    with db_connection.cursor() as cur:
+        for user_name, name, email in export_users[:2]:
+            cur.execute("INSERT INTO profiles (id, name, email) VALUES (%s, %s, %s)", (user_name, name, email))
+        cur.execute("INSERT INTO domains (domain_name, creator_fk, closed, sort_order) VALUES ('Mine', %s, 0, 0)",
+                    (seeded,))
+    db_connection.commit()
+
+    path = str(tmp_path / 'users.csv')
+    write_csv(path, export_users)
+    conn = connect_test_db()
+    try:
+        # the second run finds every user already provisioned and changes nothing
+        for _ in range(2):
+            provisioned, _ = backfill.backfill(path, conn, batch_size=2)
+            assert provisioned == len(export_users)
+    finally:
+        conn.close()
+
+    with db_connection.cursor() as cur:
+        cur.execute("SELECT creator_fk, domain_name FROM domains WHERE creator_fk IN (%s, %s)", (seeded, unseeded))
+        assert sorted((row['creator_fk'], row['domain_name']) for row in cur.fetchall()) == sorted(
+            [(seeded, 'Mine'), (unseeded, 'Personal')])
+        cur.execute("SELECT COUNT(*) AS cnt FROM profiles WHERE id = %s", (export_users[4][0],))
+        assert cur.fetchone()['cnt'] == 1
+    db_connection.commit()
@@ -0,0 +1,147 @@
+"""
+Test ping elision and transparent reconnect in connection_health.
+
+Uses a small stand-in connection so dropped sockets can be simulated
+deterministically.
+"""
+import pymysql
+import pytest
+from pymysql.constants import SERVER_STATUS
+
+import connection_health
+from connection_health import HealthTrackedConnection
+
+
+class StubCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.lastrowid = None
+
+    def execute(self, sql, args=None):
+        if self.conn.dropped:
+            raise pymysql.err.OperationalError(2013, 'Lost connection to MySQL server during query')
+        self.conn.executed.append(sql)
+        return 1
+
+    def close(self):
+        pass
+
+
+class StubConnection:
+    def __init__(self, dropped=False):
+        self.dropped = dropped
+        self.executed = []
+        self.pings = 0
+
+    def cursor(self):
+        return StubCursor(self)
+
+    def ping(self, reconnect=False):
+        self.pings += 1
+        if self.dropped:
+            raise pymysql.err.OperationalError(2006, 'MySQL server has gone away')
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def stats(monkeypatch):
+    """Fresh counters for each test."""
+    fresh = {key: 0 for key in connection_health.stats}
+    monkeypatch.setattr(connection_health, 'stats', fresh)
+    return fresh
+
+
+def test_ping_skipped_inside_idle_window(stats):
+    """A recently used connection is returned without a ping."""
+    conn = HealthTrackedConnection(StubConnection, idle_window=60)
+    conn.ensure_alive()
+    conn.ensure_alive()
+    assert stats['pings_skipped'] == 2
+    assert stats['pings'] == 0
+    assert conn.conn.pings == 0
+
+
+def test_ping_after_idle_window_reconnects_dead_connection(stats):
+    """Past the idle window a failed ping triggers a reconnect."""
+    connections = [StubConnection(dropped=True), StubConnection()]
+    conn = HealthTrackedConnection(lambda: connections.pop(0), idle_window=0)
+    conn.ensure_alive()
+    assert stats['pings'] == 1
+    assert stats['reconnects'] == 1
+    assert stats['connects'] == 2
+    assert not conn.conn.dropped
+
+
+def test_first_statement_retried_after_lost_connection(stats):
+    """A lost connection on the first statement reconnects and retries once."""
+    connections = [StubConnection(dropped=True), StubConnection()]
+    conn = HealthTrackedConnection(lambda: connections.pop(0), idle_window=60)
+
+    with conn.cursor() as cursor:
+        assert cursor.execute("INSERT INTO profiles VALUES (1)") == 1
+
+    assert stats['retries'] == 1
+    assert conn.conn.executed == ["INSERT INTO profiles VALUES (1)"]
+
+
+def test_statement_inside_transaction_not_retried(stats):
+    """Once a transaction has work in it, a lost connection is raised."""
+    conn = HealthTrackedConnection(StubConnection, idle_window=60)
+
+    with conn.cursor() as cursor:
+        cursor.execute("INSERT INTO profiles VALUES (1)")
+        conn.conn.dropped = True
+        with pytest.raises(pymysql.err.OperationalError):
+            cursor.execute("INSERT INTO domains VALUES (1)")
+
+    assert stats['retries'] == 0
+
+
+class StatusConnection(StubConnection):
+    """Carries pymysql's socket timeouts and server status flags."""
+
+    def __init__(self, dropped=False):
+        super().__init__(dropped)
+        self._read_timeout = None
+        self._write_timeout = None
+        self.server_status = 0
+        self.open = True
+
+    def commit(self):
+        self.server_status = 0
+
+
+def test_transaction_state_comes_from_server_status(stats):
+    """A COMMIT inside a batch ends the transaction, a statement carrying COMMIT is never replayed."""
+    conn = HealthTrackedConnection(StatusConnection, idle_window=60)
+
+    with conn.cursor() as cursor:
+        cursor.execute("INSERT INTO profiles VALUES (1);")
+        conn.conn.server_status = SERVER_STATUS.SERVER_STATUS_IN_TRANS
+        assert conn.in_transaction
+        cursor.execute("INSERT INTO domains VALUES (1); COMMIT;")
+        conn.conn.server_status = 0
+        assert not conn.in_transaction
+
+        conn.conn.dropped = True
+        with pytest.raises(pymysql.err.OperationalError):
+            cursor.execute("INSERT INTO profiles VALUES (2); COMMIT;")
+    assert stats['retries'] == 0
+
+
+def test_closed_connection_reconnects_inside_idle_window(stats):
+    """A connection pymysql has already closed is replaced without a ping."""
+    conn = HealthTrackedConnection(StatusConnection, idle_window=60)
+    conn.conn.open = False
+    conn.ensure_alive()
+    assert stats['reconnects'] == 1
+    assert stats['pings'] == 0
+    assert conn.conn.open
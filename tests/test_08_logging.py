@@ -0,0 +1,68 @@
+"""
+Test the leveled logging layer in classifier.
+
+Debug output (SQL statements, varDumps) must cost nothing at the default
+info level and come back in full when a single invocation asks for it.
+"""
+import pytest
+
+import classifier
+import lambda_function
+from conftest import build_cognito_event
+
+
+@pytest.fixture(autouse=True)
+def restore_log_level():
+    yield
+    classifier.set_invocation_log_level()
+
+
+def test_debug_output_suppressed_at_info(capsys):
+    """varDump and pretty_print_sql print nothing at the default info level."""
+    classifier.set_invocation_log_level('info')
+    classifier.varDump({'a': 1}, 'dump', 'json')
+    classifier.pretty_print_sql("SELECT 1", 'TEST')
+    classifier.log_debug("never %s", 'shown')
+    assert capsys.readouterr().out == ''
+
+
+def test_invocation_override_restores_full_dumps(capsys):
+    """A per-invocation debug level prints dumps and SQL regardless of sampling."""
+    classifier.set_invocation_log_level('debug')
+    classifier.varDump({'a': 1}, 'dump', 'json')
+    classifier.pretty_print_sql("SELECT   1\n  FROM dual", 'TEST')
+    out = capsys.readouterr().out
+    assert '"a": 1' in out
+    assert 'TEST SQL statement is: SELECT 1 FROM dual' in out
+
+
+def test_normalized_sql_is_cached():
+    """Each statement is normalized once and reused."""
+    sql_statement = "INSERT INTO profiles\n   (id) VALUES (%s);"
+    assert classifier.normalize_sql(sql_statement) == "INSERT INTO profiles (id) VALUES (%s);"
+    assert classifier.sql_cache[sql_statement] == "INSERT INTO profiles (id) VALUES (%s);"
+
+
+def test_lazy_formatting_only_when_enabled(capsys):
+    """Arguments are formatted into the message only when the level is enabled."""
+    classifier.set_invocation_log_level('warning')
+    classifier.log_info("info %s", 'hidden')
+    classifier.log_warning("warning %s", 'shown')
+    assert capsys.readouterr().out == "warning shown\n"
+
+
+def test_debug_level_does_not_leak_to_later_invocations(monkeypatch):
+    """Every invocation, not only a signup, resets the level from its own event."""
+    trigger = 'PostAuthentication_Authentication'
+    monkeypatch.setattr(lambda_function, 'TRIGGER_HANDLERS', {trigger: lambda event, context: event})
+    monkeypatch.setattr(lambda_function, 'warm_up', lambda event, context: event)
+    debug_event = dict(build_cognito_event(user_name='debug', trigger_source=trigger), logLevel='debug')
+
+    lambda_function.lambda_handler(debug_event, {})
+    assert classifier.log_enabled('debug')
+    lambda_function.lambda_handler(build_cognito_event(user_name='next', trigger_source=trigger), {})
+    assert not classifier.log_enabled('debug')
+
+    lambda_function.lambda_handler(debug_event, {})
+    lambda_function.lambda_handler({'warmer': True}, {})
+    assert not classifier.log_enabled('debug')
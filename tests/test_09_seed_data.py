@@ -0,0 +1,70 @@
+"""
+Test compilation of the declarative seed tree in seed_data.
+
+The number of statements must stay constant however large the tree grows,
+and a richer seed must provision every level linked to the right parent.
+"""
+import uuid
+
+import pytest
+
+from conftest import build_cognito_event
+from seed_data import SeedPlan, DEFAULT_SEED
+
+
+RICH_SEED = [
+    {
+        'domain_name': f'Domain {d}',
+        'areas': [
+            {
+                'area_name': f'Area {a}',
+                'tasks': [{'priority': t, 'description': f'Task {d}.{a}.{t}'} for t in range(1, 4)],
+            }
+            for a in range(3)
+        ],
+    }
+    for d in range(3)
+]
+
+
+def test_statement_count_independent_of_seed_size():
+    """Default and rich seeds both compile to one statement per level."""
+    assert len(SeedPlan(DEFAULT_SEED).statements(['user'])) == 3
+    assert len(SeedPlan(RICH_SEED).statements(['user'])) == 3
+    assert SeedPlan(RICH_SEED).rows_per_user() == 3 + 9 + 27
+
+
+def test_duplicate_names_rejected():
+    """Parent rows are matched by name, so names must be unique at each level."""
+    with pytest.raises(ValueError):
+        SeedPlan([{'domain_name': 'Personal'}, {'domain_name': 'Personal'}])
+    with pytest.raises(ValueError):
+        SeedPlan([{'domain_name': 'Personal', 'areas': [{'area_name': 'Home'}, {'area_name': 'Home'}]}])
+
+
+def test_rich_seed_provisions_linked_tree(invoke_cognito, created_users, db_connection, monkeypatch):
+    """A 3 domain / 9 area / 27 task seed is provisioned with correct parents."""
+    import provisioning
+    monkeypatch.setattr(provisioning, 'SEED_PLAN', SeedPlan(RICH_SEED))
+
+    user_name = f"cognito-test-seed-{uuid.uuid4().hex[:6]}"
+    created_users.append(user_name)
+    result = invoke_cognito(build_cognito_event(user_name=user_name, name='Seed User', email='seed@test.com'))
+    assert isinstance(result, dict)
+
+    with db_connection.cursor() as cur:
+        cur.execute(
+            "SELECT t.description, a.area_name, d.domain_name "
+            "FROM tasks t "
+            "JOIN areas a ON t.area_fk = a.id "
+            "JOIN domains d ON a.domain_fk = d.id "
+            "WHERE t.creator_fk = %s",
+            (user_name,),
+        )
+        rows = cur.fetchall()
+
+    assert len(rows) == 27
+    for row in rows:
+        _, d, a, _ = row['description'].replace('Task ', 'x.').split('.')
+        assert row['domain_name'] == f'Domain {d}'
+        assert row['area_name'] == f'Area {a}'
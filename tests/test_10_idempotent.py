@@ -0,0 +1,60 @@
+"""
+Test idempotent provisioning for retried Cognito triggers.
+
+With idempotent_provisioning enabled a repeat delivery for a fully
+provisioned user is a no-op, and a partially provisioned user gets only
+the missing seed rows.
+"""
+import uuid
+
+import pytest
+
+from conftest import build_cognito_event
+
+
+@pytest.fixture
+def idempotent_mode(monkeypatch):
+    """Enable idempotent provisioning for one test."""
+    import lambda_function
+    monkeypatch.setattr(lambda_function, 'idempotent_provisioning', True)
+
+
+def count_rows(db_connection, user_name):
+    counts = {}
+    with db_connection.cursor() as cur:
+        for table in ('domains', 'areas', 'tasks'):
+            cur.execute(f"SELECT COUNT(*) AS cnt FROM {table} WHERE creator_fk = %s", (user_name,))
+            counts[table] = cur.fetchone()['cnt']
+    db_connection.commit()
+    return counts
+
+
+def test_repeat_for_provisioned_user_is_noop(invoke_cognito, created_users, db_connection, idempotent_mode):
+    """A retried trigger for a complete user returns the event and adds nothing."""
+    user_name = f"cognito-test-idem-{uuid.uuid4().hex[:6]}"
+    created_users.append(user_name)
+    event = build_cognito_event(user_name=user_name, name='Idem User', email='idem@test.com')
+
+    assert isinstance(invoke_cognito(event), dict)
+    before = count_rows(db_connection, user_name)
+
+    result = invoke_cognito(build_cognito_event(user_name=user_name, name='Idem User', email='idem@test.com'))
+    assert isinstance(result, dict)
+    assert count_rows(db_connection, user_name) == before == {'domains': 1, 'areas': 1, 'tasks': 1}
+
+
+def test_partial_user_gets_missing_rows_only(invoke_cognito, created_users, db_connection, idempotent_mode):
+    """A user missing the area and task is repaired without duplicating the domain."""
+    user_name = f"cognito-test-idem-part-{uuid.uuid4().hex[:6]}"
+    created_users.append(user_name)
+    event = build_cognito_event(user_name=user_name, name='Partial User', email='partial@test.com')
+    assert isinstance(invoke_cognito(event), dict)
+
+    with db_connection.cursor() as cur:
+        cur.execute("DELETE FROM tasks WHERE creator_fk = %s", (user_name,))
+        cur.execute("DELETE FROM areas WHERE creator_fk = %s", (user_name,))
+    db_connection.commit()
+
+    result = invoke_cognito(build_cognito_event(user_name=user_name, name='Partial User', email='partial@test.com'))
+    assert isinstance(result, dict)
+    assert count_rows(db_connection, user_name) == {'domains': 1, 'areas': 1, 'tasks': 1}
@@ -0,0 +1,116 @@
+"""
+Test two phase signup: synchronous profile, queued seed data.
+
+lambda_handler commits only the profile and enqueues a seed job;
+seed_worker drains the queue and creates the seed tree in batches.
+"""
+import uuid
+
+import pytest
+
+import seed_queue
+import seed_worker
+from conftest import build_cognito_event, connect_test_db
+
+
+@pytest.fixture
+def memory_queue(monkeypatch):
+    """Two phase mode with a fresh in-memory queue."""
+    import lambda_function
+    queue = seed_queue.MemoryQueue()
+    monkeypatch.setattr(lambda_function, 'provision_mode', 'two_phase')
+    monkeypatch.setattr(seed_queue, 'queue', queue)
+    return queue
+
+
+def test_spool_queue_round_trip(tmp_path):
+    """Spool jobs survive reopening and are hidden once received."""
+    path = str(tmp_path / 'spool.db')
+    seed_queue.SpoolQueue(path).put({'userName': 'a'})
+    seed_queue.SpoolQueue(path).put({'userName': 'b'})
+
+    queue = seed_queue.SpoolQueue(path)
+    received = queue.receive(10)
+    assert [job['userName'] for _, job in received] == ['a', 'b']
+    assert queue.receive(10) == []
+
+    queue.delete([receipt for receipt, _ in received])
+    queue.visibility_timeout = 0
+    assert queue.receive(10) == []
+
+
+def test_two_phase_defers_seed_data(invoke_cognito, created_users, db_connection, memory_queue):
+    """The handler commits the profile only, the worker adds the seed tree."""
+    user_names = [f"cognito-test-2ph-{uuid.uuid4().hex[:6]}" for _ in range(3)]
+    created_users.extend(user_names)
+
+    for user_name in user_names:
+        result = invoke_cognito(build_cognito_event(user_name=user_name, name='Two Phase', email='2ph@test.com'))
+        assert isinstance(result, dict)
+
+    placeholders = ', '.join(['%s'] * len(user_names))
+    with db_connection.cursor() as cur:
+        cur.execute(f"SELECT COUNT(*) AS cnt FROM profiles WHERE id IN ({placeholders})", user_names)
+        assert cur.fetchone()['cnt'] == 3
+        cur.execute(f"SELECT COUNT(*) AS cnt FROM domains WHERE creator_fk IN ({placeholders})", user_names)
+        assert cur.fetchone()['cnt'] == 0
+    db_connection.commit()
+
+    conn = connect_test_db()
+    try:
+        assert seed_worker.drain(memory_queue, conn, batch_size=2) == 3
+    finally:
+        conn.close()
+
+    with db_connection.cursor() as cur:
+        cur.execute(f"SELECT COUNT(*) AS cnt FROM tasks WHERE creator_fk IN ({placeholders})", user_names)
+        assert cur.fetchone()['cnt'] == 3
+    db_connection.commit()
+
+
+def test_two_phase_without_backend_seeds_inline(invoke_cognito, created_users, db_connection, monkeypatch):
+    """With no durable backend the job would never be drained, the handler seeds inline."""
+    import lambda_function
+    monkeypatch.setattr(lambda_function, 'provision_mode', 'two_phase')
+    monkeypatch.setattr(seed_queue, 'queue', None)
+    monkeypatch.delenv('seed_queue_backend', raising=False)
+    with pytest.raises(ValueError):
+        seed_queue.get_queue()
+
+    user_name = f"cognito-test-2ph-{uuid.uuid4().hex[:6]}"
+    created_users.append(user_name)
+    assert isinstance(invoke_cognito(build_cognito_event(user_name=user_name)), dict)
+
+    with db_connection.cursor() as cur:
+        cur.execute("SELECT COUNT(*) AS cnt FROM tasks WHERE creator_fk = %s", (user_name,))
+        assert cur.fetchone()['cnt'] == 1
+    db_connection.commit()
+    assert seed_queue.queue is None
+
+
+def test_lambda_spool_must_be_on_shared_storage(monkeypatch):
+    """In Lambda a spool under the container's /tmp is never drained, one on EFS is."""
+    monkeypatch.setattr(seed_queue, 'queue', None)
+    monkeypatch.setenv('seed_queue_backend', 'spool')
+    monkeypatch.setenv('seed_queue_path', '/tmp/seed_jobs.db')
+    assert seed_queue.configured()
+
+    monkeypatch.setenv('AWS_LAMBDA_FUNCTION_NAME', 'cognito-post-confirmation')
+    assert not seed_queue.configured()
+    monkeypatch.setenv('seed_queue_path', '/mnt/seed/seed_jobs.db')
+    assert seed_queue.configured()
+
+
+def test_queued_user_not_cached_as_provisioned(invoke_cognito, created_users, memory_queue, monkeypatch):
+    """A user whose seed job is only queued is not in the provisioned cache."""
+    from provisioned_cache import ProvisionedCache
+    import lambda_function
+    cache = ProvisionedCache(max_size=10, ttl=60)
+    monkeypatch.setattr(lambda_function, 'provisioned_cache', cache)
+
+    user_name = f"cognito-test-2ph-{uuid.uuid4().hex[:6]}"
+    created_users.append(user_name)
+    assert isinstance(invoke_cognito(build_cognito_event(user_name=user_name)), dict)
+
+    assert len(memory_queue.jobs) == 1
+    assert not cache.contains(user_name)
@@ -0,0 +1,57 @@
+"""
+Test the per-step Embedded Metric Format line written by lambda_handler.
+"""
+import json
+import uuid
+
+from conftest import build_cognito_event
+from metrics import StepMetrics
+
+
+def emf_lines(output):
+    return [json.loads(line) for line in output.splitlines() if line.startswith('{"_aws"')]
+
+
+def test_step_metrics_record_shape():
+    """Every lap becomes a Milliseconds metric, dimensions include Outcome."""
+    metrics = StepMetrics('TestNamespace', {'ColdStart': 'false'})
+    metrics.lap('Connect')
+    metrics.lap('ProfileInsert')
+    metrics.outcome = 'warning'
+    record = metrics.record()
+
+    directive = record['_aws']['CloudWatchMetrics'][0]
+    assert directive['Namespace'] == 'TestNamespace'
+    assert directive['Dimensions'] == [['ColdStart', 'Outcome']]
+    assert [m['Name'] for m in directive['Metrics']] == ['Connect', 'ProfileInsert', 'Total']
+    assert record['Outcome'] == 'warning'
+    assert record['Total'] >= record['Connect'] + record['ProfileInsert'] - 0.01
+
+
+def test_one_metrics_line_per_signup(invoke_cognito, created_users, capsys):
+    """A successful signup writes exactly one EMF line with every step timed."""
+    user_name = f"cognito-test-emf-{uuid.uuid4().hex[:6]}"
+    created_users.append(user_name)
+    capsys.readouterr()
+
+    invoke_cognito(build_cognito_event(user_name=user_name, name='EMF User', email='emf@test.com'))
+
+    lines = emf_lines(capsys.readouterr().out)
+    assert len(lines) == 1
+    assert lines[0]['Outcome'] == 'success'
+    for step in ('Connect', 'EventParse', 'ProfileInsert', 'DomainInsert', 'AreaInsert', 'TaskInsert'):
+        assert step in lines[0]
+
+
+def test_error_outcome_and_noop_trigger(invoke_cognito, capsys):
+    """A missing userName is recorded as an error, a no-op trigger writes nothing."""
+    event = build_cognito_event(user_name='placeholder')
+    event['userName'] = None
+    capsys.readouterr()
+
+    invoke_cognito(event)
+    invoke_cognito(build_cognito_event(user_name='noop', trigger_source='PostConfirmation_ConfirmForgotPassword'))
+
+    lines = emf_lines(capsys.readouterr().out)
+    assert len(lines) == 1
+    assert lines[0]['Outcome'] == 'error'
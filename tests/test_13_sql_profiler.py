@@ -0,0 +1,62 @@
+"""
+Test the opt-in SQL profiler in sql_profiler.
+
+Wraps a real darwin_dev connection and checks what is recorded for each
+statement, the committed flag and the slow-query log.
+"""
+import uuid
+
+import pymysql
+import pytest
+
+import sql_profiler
+from conftest import connect_test_db
+
+
+@pytest.fixture
+def profiled_connection(monkeypatch):
+    """A darwin_dev connection wrapped in ProfilingConnection with empty buffers."""
+    monkeypatch.setattr(sql_profiler, 'recent', type(sql_profiler.recent)(maxlen=4))
+    sql_profiler.reset_invocation()
+    conn = connect_test_db()
+    yield sql_profiler.ProfilingConnection(conn)
+    conn.close()
+
+
+def test_statements_recorded_and_committed(profiled_connection, created_users):
+    """Each statement is recorded normalized with params and rows, then flagged committed."""
+    user_name = f"cognito-test-prof-{uuid.uuid4().hex[:6]}"
+    created_users.append(user_name)
+
+    with profiled_connection.cursor() as cursor:
+        cursor.execute("INSERT INTO profiles (id, name, email)\n    VALUES (%s, %s, %s);",
+                       (user_name, 'Profiled', 'prof@test.com'))
+    assert sql_profiler.recent[-1]['committed'] is False
+    profiled_connection.commit()
+
+    entry = sql_profiler.recent[-1]
+    assert entry['sql'] == "INSERT INTO profiles (id, name, email) VALUES (%s, %s, %s);"
+    assert entry['params'] == 3
+    assert entry['rows'] == 1
+    assert entry['committed'] is True
+    assert sql_profiler.invocation['statements'] == 1
+    assert sql_profiler.invocation['commits'] == 1
+
+
+def test_ring_buffer_bounded_and_slow_log(profiled_connection, monkeypatch, capsys):
+    """The ring keeps only the newest entries and slow statements are logged."""
+    monkeypatch.setattr(sql_profiler, 'slow_query_ms', 0)
+    with profiled_connection.cursor() as cursor:
+        for _ in range(6):
+            cursor.execute("SELECT 1")
+
+    assert len(sql_profiler.recent) == 4
+    assert capsys.readouterr().out.count('Slow query') == 6
+
+
+def test_failed_statement_records_error(profiled_connection):
+    """A failing statement is recorded with its MySQL error code and re-raised."""
+    with profiled_connection.cursor() as cursor:
+        with pytest.raises(pymysql.Error):
+            cursor.execute("SELECT * FROM no_such_table")
+    assert sql_profiler.recent[-1]['error'] is not None
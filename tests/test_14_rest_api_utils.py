@@ -0,0 +1,167 @@
+"""
+Test the compose_rest_response fast path in rest_api_utils.
+"""
+import json
+
+import rest_api_utils
+from rest_api_utils import compose_rest_response, compose_preflight_response
+
+
+ROWS = [{'id': i, 'description': f'task {i}', 'priority': i % 3, 'done': 0} for i in range(50)]
+
+
+def test_stdlib_encoder_byte_identical():
+    """The default encoder produces exactly json.dumps(body)."""
+    response = compose_rest_response(200, ROWS)
+    assert response['body'] == json.dumps(ROWS)
+    assert response['statusCode'] == 200
+    assert response['isBase64Encoded'] is False
+
+
+def test_headers_are_independent_copies():
+    """Mutating one response's headers never changes the template or the next response."""
+    first = compose_rest_response(200, {})
+    first['headers']['X-Extra'] = '1'
+    second = compose_rest_response(200, {})
+    assert 'X-Extra' not in second['headers']
+    assert second['headers'] == dict(rest_api_utils.CORS_HEADERS)
+
+
+def test_error_status_uses_http_message():
+    """Non-2xx responses carry http_message as the body."""
+    response = compose_rest_response(404, ROWS, 'not found')
+    assert response['body'] == json.dumps('not found')
+
+
+def test_preflight_matches_composed_response():
+    """The canned OPTIONS response equals compose_rest_response(200)."""
+    assert compose_preflight_response() == compose_rest_response(200)
+
+
+def test_fast_encoder_round_trips_and_falls_back():
+    """The fast encoder decodes to the same data and handles what orjson cannot."""
+    assert json.loads(rest_api_utils.encode_json(ROWS, 'fast')) == ROWS
+    # orjson rejects integers wider than 64 bits, json.dumps does not
+    body = {'big': 2 ** 70}
+    assert rest_api_utils.encode_json(body, 'fast') == json.dumps(body)
+
+
+def test_gzip_compression_above_threshold():
+    """A large body is gzipped, base64 encoded and flagged for the client."""
+    import base64
+    import gzip
+
+    response = compose_rest_response(200, ROWS, accept_encoding='deflate;q=0.5, gzip')
+    assert response['isBase64Encoded'] is True
+    assert response['headers']['Content-Encoding'] == 'gzip'
+    assert response['headers']['Vary'] == 'Accept-Encoding'
+    assert gzip.decompress(base64.b64decode(response['body'])).decode() == json.dumps(ROWS)
+
+
+def test_deflate_and_small_bodies():
+    """Deflate is used when preferred, small bodies and q=0 are left uncompressed."""
+    import base64
+    import zlib
+
+    response = compose_rest_response(200, ROWS, accept_encoding='gzip;q=0, deflate')
+    assert response['headers']['Content-Encoding'] == 'deflate'
+    assert zlib.decompress(base64.b64decode(response['body'])).decode() == json.dumps(ROWS)
+
+    small = compose_rest_response(200, {'id': 1}, accept_encoding='gzip')
+    assert small['isBase64Encoded'] is False
+    assert 'Content-Encoding' not in small['headers']
+    assert small['body'] == json.dumps({'id': 1})
+
+
+def test_accept_encoding_header_lookup():
+    """The header is found regardless of case."""
+    event = {'headers': {'accept-encoding': 'gzip, br'}}
+    assert rest_api_utils.request_accept_encoding(event) == 'gzip, br'
+    assert rest_api_utils.request_accept_encoding({'headers': None}) is None
+
+
+def test_computed_etag_and_304():
+    """A computed ETag is returned and a matching If-None-Match yields a bodyless 304."""
+    first = compose_rest_response(200, ROWS, compute_etag=True)
+    etag = first['headers']['ETag']
+    assert etag.startswith('"') and etag.endswith('"')
+
+    second = compose_rest_response(200, ROWS, compute_etag=True, if_none_match=f'W/{etag}')
+    assert second['statusCode'] == 304
+    assert 'body' not in second
+    assert second['headers']['ETag'] == etag
+
+    changed = compose_rest_response(200, ROWS[:-1], compute_etag=True, if_none_match=etag)
+    assert changed['statusCode'] == 200
+    assert changed['headers']['ETag'] != etag
+
+
+def test_caller_etag_and_compressed_tag():
+    """A caller supplied version is quoted, and a compressed variant's tag still matches."""
+    response = compose_rest_response(200, ROWS, etag='v42', accept_encoding='gzip')
+    assert response['headers']['ETag'] == '"v42-gzip"'
+
+    not_modified = compose_rest_response(200, ROWS, etag='v42', accept_encoding='gzip',
+                                         if_none_match='"v42-gzip"')
+    assert not_modified['statusCode'] == 304
+
+
+def test_etag_cache_bounded(monkeypatch):
+    """Identical bodies hit the cache, which holds no bodies and never grows past its cap."""
+    monkeypatch.setattr(rest_api_utils, 'etag_cache', {})
+    monkeypatch.setattr(rest_api_utils, 'ETAG_CACHE_SIZE', 2)
+    for i in range(5):
+        rest_api_utils.body_etag(f'body {i}')
+    assert len(rest_api_utils.etag_cache) == 2
+    assert 'body 4' not in rest_api_utils.etag_cache
+    assert rest_api_utils.body_etag('body 4') == rest_api_utils.etag_cache[(6, hash('body 4'))]
+
+    large_body = 'x' * (rest_api_utils.ETAG_CACHE_MAX_BODY + 1)
+    assert rest_api_utils.body_etag(large_body) == rest_api_utils.body_etag(large_body)
+    assert len(rest_api_utils.etag_cache) == 2
+
+
+def test_streamed_list_identical_to_json_dumps():
+    """An untruncated streamed body equals json.dumps of the full list."""
+    response = rest_api_utils.compose_rest_list_response(iter(ROWS))
+    assert response['body'] == json.dumps(ROWS)
+    assert rest_api_utils.NEXT_TOKEN_HEADER not in response['headers']
+
+    empty = rest_api_utils.compose_rest_list_response(iter([]))
+    assert empty['body'] == '[]'
+
+
+def test_streamed_list_cut_off_with_continuation():
+    """Past max_payload the array ends at a whole row and a token resumes the rest."""
+    generated = (row for row in ROWS)
+    response = rest_api_utils.compose_rest_list_response(generated, max_payload=500)
+
+    page = json.loads(response['body'])
+    assert 0 < len(page) < len(ROWS)
+    assert len(response['body']) <= 500
+    assert page == ROWS[:len(page)]
+
+    token = response['headers'][rest_api_utils.NEXT_TOKEN_HEADER]
+    offset = rest_api_utils.decode_offset_token(token)
+    assert offset == len(page)
+
+    rest = rest_api_utils.compose_rest_list_response(iter(ROWS[offset:]), max_payload=10 ** 6, offset=offset)
+    assert page + json.loads(rest['body']) == ROWS
+
+
+def test_streamed_list_keyset_token():
+    """A next_token callable builds the token from the last row sent."""
+    response = rest_api_utils.compose_rest_list_response(
+        iter(ROWS), max_payload=300, next_token=lambda row: f"after-{row['id']}")
+    page = json.loads(response['body'])
+    assert response['headers'][rest_api_utils.NEXT_TOKEN_HEADER] == f"after-{page[-1]['id']}"
+
+
+def test_streamed_list_oversized_first_row_is_413():
+    """A first row larger than max_payload is an error, never an empty page with a token."""
+    for next_token in (None, lambda row: f"after-{row['id']}"):
+        response = rest_api_utils.compose_rest_list_response(iter(ROWS), max_payload=10, offset=7,
+                                                             next_token=next_token)
+        assert response['statusCode'] == 413
+        assert rest_api_utils.NEXT_TOKEN_HEADER not in response['headers']
+        assert 'offset 7' in json.loads(response['body'])
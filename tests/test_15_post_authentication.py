@@ -0,0 +1,122 @@
+"""
+Test trigger dispatch and coalesced last-login tracking for PostAuthentication.
+"""
+import datetime
+import uuid
+
+import pytest
+
+import last_login
+from conftest import build_cognito_event
+
+
+@pytest.fixture
+def login_buffer(monkeypatch):
+    """An empty last-login buffer for each test."""
+    monkeypatch.setattr(last_login, 'buffer', {})
+    monkeypatch.setattr(last_login, 'oldest_entry', None)
+    monkeypatch.setattr(last_login, 'retry_after', None)
+    monkeypatch.setattr(last_login, 'dropped', 0)
+
+
+def test_repeat_logins_coalesce(login_buffer):
+    """Repeat logins by one user keep a single entry with the latest time."""
+    early = datetime.datetime(2024, 1, 1, 8, 0, 0)
+    late = datetime.datetime(2024, 1, 1, 9, 0, 0)
+    last_login.record_login('user-a', late)
+    last_login.record_login('user-a', early)
+    last_login.record_login('user-b', early)
+    assert last_login.buffer == {'user-a': late, 'user-b': early}
+
+
+def test_flush_due_by_size_and_age(login_buffer, monkeypatch):
+    """The buffer flushes once it reaches the size cap or the age limit."""
+    monkeypatch.setattr(last_login, 'flush_size', 2)
+    monkeypatch.setattr(last_login, 'flush_seconds', 3600)
+    assert not last_login.flush_due()
+    last_login.record_login('user-a')
+    assert not last_login.flush_due()
+    last_login.record_login('user-b')
+    assert last_login.flush_due()
+
+    monkeypatch.setattr(last_login, 'buffer', {})
+    monkeypatch.setattr(last_login, 'flush_seconds', 0)
+    last_login.record_login('user-c')
+    assert last_login.flush_due()
+
+
+def test_login_buffered_without_connection(login_buffer, monkeypatch):
+    """Below the flush threshold a login never acquires a connection."""
+    import lambda_function
+    monkeypatch.setattr(last_login, 'flush_size', 100)
+
+    def no_connection():
+        raise AssertionError('connection acquired')
+
+    monkeypatch.setattr(lambda_function, 'get_connection', no_connection)
+    event = build_cognito_event(user_name='buffered-user', trigger_source='PostAuthentication_Authentication')
+    assert lambda_function.lambda_handler(event, {}) == event
+    assert 'buffered-user' in last_login.buffer
+
+
+def test_flush_updates_profiles_in_one_batch(invoke_cognito, created_users, db_connection,
+                                             login_buffer, monkeypatch):
+    """Reaching the threshold writes every buffered login with one UPDATE."""
+    user_names = [f"cognito-test-login-{uuid.uuid4().hex[:6]}" for _ in range(3)]
+    created_users.extend(user_names)
+    for user_name in user_names:
+        assert isinstance(invoke_cognito(build_cognito_event(user_name=user_name)), dict)
+
+    monkeypatch.setattr(last_login, 'flush_size', 3)
+    for user_name in user_names:
+        event = build_cognito_event(user_name=user_name, trigger_source='PostAuthentication_Authentication')
+        assert invoke_cognito(event) == event
+    assert last_login.buffer == {}
+
+    placeholders = ', '.join(['%s'] * len(user_names))
+    with db_connection.cursor() as cur:
+        cur.execute(f"SELECT COUNT(*) AS cnt FROM profiles WHERE last_login IS NOT NULL AND id IN ({placeholders})",
+                    user_names)
+        assert cur.fetchone()['cnt'] == 3
+    db_connection.commit()
+
+
+def test_flush_never_moves_last_login_back(invoke_cognito, created_users, db_connection, login_buffer):
+    """A container flushing an older login keeps the newer time another container wrote."""
+    user_name = f"cognito-test-login-{uuid.uuid4().hex[:6]}"
+    created_users.append(user_name)
+    assert isinstance(invoke_cognito(build_cognito_event(user_name=user_name)), dict)
+    newer, older = datetime.datetime(2026, 5, 2, 12, 0), datetime.datetime(2026, 5, 1, 12, 0)
+
+    last_login.record_login(user_name, newer)
+    last_login.flush(db_connection)
+    last_login.record_login(user_name, older)
+    last_login.flush(db_connection)
+
+    with db_connection.cursor() as cur:
+        cur.execute("SELECT last_login FROM profiles WHERE id = %s", (user_name,))
+        assert str(cur.fetchone()['last_login']) == str(newer)
+    db_connection.commit()
+
+
+def test_outage_backs_off_and_caps_buffer(login_buffer, monkeypatch):
+    """A failed connect is retried only after flush_seconds, the buffer keeps the newest users."""
+    monkeypatch.setattr(last_login, 'flush_size', 1)
+    monkeypatch.setattr(last_login, 'flush_seconds', 3600)
+    monkeypatch.setattr(last_login, 'max_buffer', 3)
+    attempts = []
+
+    def unreachable():
+        attempts.append(1)
+        raise OSError('connect timed out')
+
+    for i in range(5):
+        event = build_cognito_event(user_name=f'user-{i}', trigger_source='PostAuthentication_Authentication')
+        assert last_login.post_authentication(event, unreachable) == event
+
+    assert len(attempts) == 1
+    assert list(last_login.buffer) == ['user-2', 'user-3', 'user-4']
+    assert last_login.dropped == 2
+
+    monkeypatch.setattr(last_login, 'retry_after', 0)
+    assert last_login.flush_due()
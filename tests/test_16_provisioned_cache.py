@@ -0,0 +1,61 @@
+"""
+Test the per-container cache of provisioned userNames.
+"""
+import time
+import uuid
+
+import pytest
+
+from conftest import build_cognito_event
+from provisioned_cache import ProvisionedCache
+
+
+def test_hits_misses_and_lru_eviction():
+    """The least recently used entry is evicted past the size cap."""
+    cache = ProvisionedCache(max_size=2, ttl=60)
+    cache.add('a')
+    cache.add('b')
+    assert cache.contains('a')
+    cache.add('c')
+
+    assert not cache.contains('b')
+    assert cache.contains('a') and cache.contains('c')
+    assert len(cache) == 2
+    assert cache.stats == {'hits': 3, 'misses': 1, 'evictions': 1, 'expirations': 0}
+
+
+def test_ttl_expiry(monkeypatch):
+    """Entries older than the ttl count as misses and are dropped."""
+    cache = ProvisionedCache(max_size=10, ttl=5)
+    now = time.monotonic()
+    monkeypatch.setattr(time, 'monotonic', lambda: now)
+    cache.add('a')
+    monkeypatch.setattr(time, 'monotonic', lambda: now + 6)
+    assert not cache.contains('a')
+    assert cache.stats['expirations'] == 1
+    assert len(cache) == 0
+
+
+def test_disabled_cache_never_hits():
+    """A size of zero turns the cache off."""
+    cache = ProvisionedCache(max_size=0, ttl=60)
+    cache.add('a')
+    assert not cache.contains('a')
+
+
+def test_repeat_delivery_skips_database(invoke_cognito, created_users, monkeypatch):
+    """A repeat for a user this container provisioned returns the event without a connection."""
+    import lambda_function
+    monkeypatch.setattr(lambda_function, 'provisioned_cache', ProvisionedCache(max_size=10, ttl=60))
+
+    user_name = f"cognito-test-cache-{uuid.uuid4().hex[:6]}"
+    created_users.append(user_name)
+    assert isinstance(invoke_cognito(build_cognito_event(user_name=user_name)), dict)
+
+    def no_connection():
+        raise AssertionError('connection acquired')
+
+    monkeypatch.setattr(lambda_function, 'get_connection', no_connection)
+    event = build_cognito_event(user_name=user_name)
+    assert lambda_function.lambda_handler(event, {}) == event
+    assert lambda_function.provisioned_cache.stats['hits'] == 1
@@ -0,0 +1,163 @@
+"""
+Test endpoint failover, cooldown and latency ordering in endpoint_pool.
+
+Unreachable endpoints are local stand-in servers: a closed port refuses the
+connection, a listening socket that never answers stands in for a hung host.
+"""
+import socket
+import time
+
+import pymysql
+import pytest
+
+import deadline
+import endpoint_pool
+from endpoint_pool import EndpointPool
+
+
+@pytest.fixture(autouse=True)
+def stats(monkeypatch):
+    """Fresh counters for each test."""
+    fresh = {key: 0 for key in endpoint_pool.stats}
+    monkeypatch.setattr(endpoint_pool, 'stats', fresh)
+    return fresh
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controllable monotonic clock."""
+    now = [1000.0]
+    monkeypatch.setattr(time, 'monotonic', lambda: now[0])
+    return now
+
+
+class StandIns:
+    """open_connection stand-in, hosts in down refuse, the rest connect."""
+
+    def __init__(self, down=()):
+        self.down = set(down)
+        self.attempts = []
+
+    def __call__(self, host, timeout):
+        self.attempts.append((host, timeout))
+        if host in self.down:
+            raise pymysql.err.OperationalError(2003, f"Can't connect to MySQL server on '{host}'")
+        return f"connection to {host}"
+
+
+def test_falls_through_to_next_endpoint(stats, clock):
+    """A refused writer fails over to the proxy and is skipped during its cooldown."""
+    pool = EndpointPool(['writer', 'proxy', 'standby'], connect_timeout=3, cooldown=30)
+    opener = StandIns(down={'writer'})
+
+    assert pool.connect(opener) == 'connection to proxy'
+    assert [host for host, _ in opener.attempts] == ['writer', 'proxy']
+
+    opener.attempts.clear()
+    clock[0] += 10
+    assert pool.connect(opener) == 'connection to proxy'
+    assert [host for host, _ in opener.attempts] == ['proxy']
+    assert stats['failures'] == 1
+
+
+def test_cooled_endpoint_is_tried_again(clock):
+    """Once its cooldown ends a recovered endpoint competes on its latency again."""
+    pool = EndpointPool(['writer', 'proxy'], connect_timeout=3, cooldown=30)
+    pool.latency.update(writer=0.01, proxy=0.05)
+    pool.mark_dead('writer')
+    assert pool.candidates() == ['proxy', 'writer']
+
+    clock[0] += 31
+    assert pool.candidates() == ['writer', 'proxy']
+
+
+def test_latency_orders_candidates_and_scales_timeout():
+    """Fastest measured endpoint first, unmeasured after in configured order."""
+    pool = EndpointPool(['writer', 'proxy', 'standby'], connect_timeout=3, cooldown=30)
+    pool.latency.update(proxy=0.02, standby=0.4)
+    assert pool.candidates() == ['proxy', 'standby', 'writer']
+
+    assert pool.attempt_timeout('proxy', last=False) == endpoint_pool.MIN_CONNECT_TIMEOUT
+    assert pool.attempt_timeout('standby', last=False) == pytest.approx(1.6)
+    assert pool.attempt_timeout('writer', last=False) == 3
+    assert pool.attempt_timeout('proxy', last=True) == 3
+
+
+def test_failover_is_counted(stats):
+    """Moving away from the endpoint last connected to counts a failover."""
+    pool = EndpointPool(['writer', 'proxy'], connect_timeout=3, cooldown=30)
+    pool.connect(StandIns())
+    pool.connect(StandIns(down={'writer'}))
+    assert pool.current == 'proxy'
+    assert stats['failovers'] == 1
+
+
+def test_all_unreachable_raises_last_error():
+    """Every endpoint is tried, then the last connect error is raised."""
+    pool = EndpointPool(['writer', 'proxy'], connect_timeout=3, cooldown=30)
+    opener = StandIns(down={'writer', 'proxy'})
+    with pytest.raises(pymysql.err.OperationalError) as raised:
+        pool.connect(opener)
+    assert 'proxy' in raised.value.args[1]
+    assert len(opener.attempts) == 2
+
+
+def test_attempts_cut_off_at_the_deadline(clock):
+    """No attempt waits past the invocation deadline, none starts without time left."""
+    pool = EndpointPool(['writer', 'proxy'], connect_timeout=3, cooldown=30)
+    limit = deadline.Deadline(4000)
+    attempts = []
+
+    def hung(host, timeout):
+        attempts.append((host, timeout))
+        clock[0] += timeout
+        raise pymysql.err.OperationalError(2003, f"Can't connect to MySQL server on '{host}'")
+
+    with pytest.raises(pymysql.err.OperationalError):
+        pool.connect(hung, limit)
+    assert attempts == [('writer', 3), ('proxy', pytest.approx(1.0))]
+
+    attempts.clear()
+    clock[0] += 1
+    with pytest.raises(pymysql.err.OperationalError):
+        pool.connect(hung, limit)
+    assert attempts == []
+
+
+def test_server_errors_do_not_fail_over():
+    """A reachable server refusing the login is not a dead endpoint."""
+    pool = EndpointPool(['writer', 'proxy'], connect_timeout=3, cooldown=30)
+
+    def access_denied(host, timeout):
+        raise pymysql.err.OperationalError(1045, "Access denied for user")
+
+    with pytest.raises(pymysql.err.OperationalError):
+        pool.connect(access_denied)
+    assert pool.dead_until == {}
+
+
+def test_local_stand_in_servers_are_unreachable():
+    """A refused port and a silent listener both classify as unreachable."""
+    closed = socket.socket()
+    closed.bind(('127.0.0.1', 0))
+    closed_port = closed.getsockname()[1]
+    closed.close()
+
+    silent = socket.socket()
+    silent.bind(('127.0.0.1', 0))
+    silent.listen(1)
+    silent_port = silent.getsockname()[1]
+
+    def open_connection(host, timeout):
+        return pymysql.connect(host='127.0.0.1', port=int(host), user='test', password='test',
+                               connect_timeout=timeout, read_timeout=timeout)
+
+    pool = EndpointPool([str(closed_port), str(silent_port)], connect_timeout=0.3, cooldown=30)
+    try:
+        with pytest.raises(pymysql.err.OperationalError) as raised:
+            pool.connect(open_connection)
+    finally:
+        silent.close()
+
+    assert endpoint_pool.is_unreachable(raised.value)
+    assert set(pool.dead_until) == {str(closed_port), str(silent_port)}
@@ -0,0 +1,108 @@
+"""
+Test warm-up events: priming without data access, cold reporting and fan out.
+"""
+import io
+import json
+
+import pytest
+
+import lambda_function
+import warmer
+
+
+class ForbiddenConnection:
+    """Stand-in connection that fails the test on any statement."""
+
+    def cursor(self, *args, **kwargs):
+        raise AssertionError('warmer touched the database')
+
+
+@pytest.fixture
+def warm_container(monkeypatch):
+    """Fresh container state with a stand-in connection."""
+    acquired = []
+
+    def get_connection():
+        acquired.append(True)
+        return ForbiddenConnection()
+
+    monkeypatch.setattr(lambda_function, 'get_connection', get_connection)
+    monkeypatch.setattr(lambda_function, 'invocation_count', 0)
+    return acquired
+
+
+def test_warmer_primes_and_reports_cold_start(warm_container):
+    """The first warmer reports a cold container, the next a warm one."""
+    first = lambda_function.lambda_handler({'warmer': True}, {})
+    second = lambda_function.lambda_handler({'warmer': True}, {})
+
+    assert first['warmed'] and first['coldStart'] and first['connected']
+    assert second['coldStart'] is False
+    assert second['primeMs'] < 1.0
+    assert len(warm_container) == 2
+    assert (1, False) in lambda_function.provisioning.SEED_PLAN.compiled
+
+
+def test_warmer_survives_connect_failure(monkeypatch):
+    """A failed connect is reported, not raised."""
+    def unreachable():
+        raise OSError('no route to host')
+
+    monkeypatch.setattr(lambda_function, 'get_connection', unreachable)
+    report = lambda_function.lambda_handler({'warmer': True}, {})
+    assert report['warmed'] and report['connected'] is False
+
+
+def test_warmer_needs_literal_true():
+    """Only the documented event shape is a warmer."""
+    event = {'warmer': 'yes'}
+    assert lambda_function.lambda_handler(event, {}) == event
+
+
+class FakeLambdaClient:
+    """Records invokes, answers like a freshly started container."""
+
+    def __init__(self, fail_index=None):
+        self.payloads = []
+        self.fail_index = fail_index
+
+    def invoke(self, FunctionName, InvocationType, Payload):
+        payload = json.loads(Payload)
+        self.payloads.append(payload)
+        if payload['warmerIndex'] == self.fail_index:
+            raise RuntimeError('TooManyRequestsException')
+        return {'Payload': io.BytesIO(json.dumps({'warmed': True, 'coldStart': True}).encode())}
+
+
+class FakeContext:
+    function_name = 'cognito-post-confirmation'
+
+
+def test_fan_out_invokes_concurrency_minus_one():
+    """Three warm containers means two extra invokes flagged as targets."""
+    client = FakeLambdaClient()
+    cold = warmer.fan_out({'warmer': True, 'concurrency': 3}, FakeContext(), client)
+
+    assert cold == 2
+    assert sorted(payload['warmerIndex'] for payload in client.payloads) == [1, 2]
+    assert all(payload['warmerTarget'] for payload in client.payloads)
+
+
+def test_fan_out_targets_do_not_fan_out_again():
+    """An invoked target never invokes further warmers."""
+    client = FakeLambdaClient()
+    assert warmer.fan_out({'warmer': True, 'warmerTarget': True, 'concurrency': 3}, FakeContext(), client) == 0
+    assert client.payloads == []
+
+
+def test_fan_out_failure_is_logged_not_raised():
+    """A throttled invoke does not fail the warmer."""
+    client = FakeLambdaClient(fail_index=1)
+    assert warmer.fan_out({'warmer': True, 'concurrency': 3}, FakeContext(), client) == 1
+
+
+@pytest.mark.parametrize('value, expected', [(None, 1), ('4', 4), (0, 1), ('many', 1), (1000, warmer.MAX_CONCURRENCY)])
+def test_requested_concurrency_is_clamped(value, expected):
+    """Concurrency is parsed leniently and bounded."""
+    event = {'warmer': True} if value is None else {'warmer': True, 'concurrency': value}
+    assert warmer.requested_concurrency(event) == expected
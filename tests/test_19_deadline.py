@@ -0,0 +1,164 @@
+"""
+Test deadline-aware execution: socket timeouts from the time left and
+deferral of optional seed steps when the Cognito budget runs low.
+"""
+import pymysql
+import pytest
+
+import deadline
+import lambda_function
+import seed_queue
+from conftest import build_cognito_event
+import connection_health
+from connection_health import HealthTrackedConnection
+
+
+class RawConnection:
+    """Stand-in pymysql connection, records statements and socket timeouts."""
+
+    def __init__(self):
+        self._read_timeout = deadline.DEFAULT_STATEMENT_TIMEOUT
+        self._write_timeout = deadline.DEFAULT_STATEMENT_TIMEOUT
+        self.executed = []
+        self.timeouts = []
+        self.dropped = False
+
+    def cursor(self, *args, **kwargs):
+        return RawCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class RawCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def execute(self, sql, args=None):
+        if self.conn.dropped:
+            raise pymysql.err.OperationalError(2013, 'Lost connection to MySQL server during query')
+        self.conn.executed.append(sql)
+        self.conn.timeouts.append(self.conn._read_timeout)
+        return 1
+
+    def close(self):
+        pass
+
+
+class LambdaContext:
+    def __init__(self, remaining_ms):
+        self.remaining_ms = remaining_ms
+
+    def get_remaining_time_in_millis(self):
+        return self.remaining_ms
+
+
+@pytest.fixture(autouse=True)
+def no_deadline():
+    """Never leak a deadline into the next test."""
+    yield
+    deadline.clear()
+
+
+def test_deadline_uses_smaller_of_budget_and_context(monkeypatch):
+    """The Lambda context only shortens the Cognito budget."""
+    monkeypatch.setattr(deadline, 'cognito_budget_ms', 5000)
+    monkeypatch.setattr(deadline, 'deadline_margin_ms', 300)
+
+    assert deadline.start(LambdaContext(2000)).budget_ms == 1700
+    assert deadline.start(LambdaContext(60000)).budget_ms == 4700
+    assert deadline.start({}).budget_ms == 4700
+
+
+def test_statement_timeout_is_clamped():
+    """Timeouts never exceed the connect default nor drop below the floor."""
+    assert deadline.Deadline(60000).statement_timeout() == deadline.DEFAULT_STATEMENT_TIMEOUT
+    assert deadline.Deadline(1500).statement_timeout() == pytest.approx(1.5, abs=0.05)
+    assert deadline.Deadline(-100).statement_timeout() == deadline.MIN_STATEMENT_TIMEOUT
+
+
+def test_tracked_statements_get_remaining_time():
+    """Each statement re-arms the pymysql timeouts, and they reset between invocations."""
+    raw = RawConnection()
+    conn = HealthTrackedConnection(lambda: raw, idle_window=30)
+
+    deadline.current = deadline.Deadline(1200)
+    with conn.cursor() as cursor:
+        cursor.execute('SELECT 1')
+    assert raw.timeouts[-1] == pytest.approx(1.2, abs=0.05)
+
+    deadline.clear()
+    with conn.cursor() as cursor:
+        cursor.execute('SELECT 1')
+    assert raw.timeouts[-1] == deadline.DEFAULT_STATEMENT_TIMEOUT
+
+
+def test_lost_connection_not_replaced_without_reconnect_time(monkeypatch):
+    """With less than reconnect_ms left a lost connection is raised instead of replayed."""
+    monkeypatch.setattr(connection_health, 'stats', dict.fromkeys(connection_health.stats, 0))
+    raw = RawConnection()
+    conn = HealthTrackedConnection(lambda: raw, idle_window=30)
+    raw.dropped = True
+
+    deadline.current = deadline.Deadline(deadline.reconnect_ms / 2)
+    with conn.cursor() as cursor:
+        with pytest.raises(pymysql.err.OperationalError):
+            cursor.execute('SELECT 1')
+    assert connection_health.stats['reconnects'] == 0
+
+
+def test_wrappers_are_unwrapped():
+    """Timeouts land on the pymysql connection, not on a wrapper."""
+    raw = RawConnection()
+    conn = HealthTrackedConnection(lambda: raw, idle_window=30)
+    assert deadline.socket_connection(conn) is raw
+    assert deadline.socket_connection(object()) is None
+
+
+def test_low_budget_defers_seed_steps(monkeypatch):
+    """The profile is created, the seed rows are queued for the worker instead."""
+    raw = RawConnection()
+    queue = seed_queue.MemoryQueue()
+    monkeypatch.setattr(lambda_function, 'get_connection', lambda: raw)
+    monkeypatch.setattr(lambda_function, 'provision_mode', 'steps')
+    monkeypatch.setattr(lambda_function, 'idempotent_provisioning', False)
+    monkeypatch.setattr(lambda_function, 'emit_metrics', False)
+    monkeypatch.setattr(seed_queue, 'queue', queue)
+    monkeypatch.setattr(deadline, 'optional_step_ms', 10 ** 9)
+
+    event = build_cognito_event(user_name='cognito-test-deadline')
+    assert lambda_function.lambda_handler(event, LambdaContext(5000)) == event
+
+    assert raw.executed == [lambda_function.provisioning.PROFILE_INSERT]
+    assert [job for _, job in queue.receive(10)] == [{'userName': 'cognito-test-deadline'}]
+    assert deadline.current is None
+
+
+def test_deferred_user_left_partial_without_queue(monkeypatch, capsys):
+    """Without a durable queue backend nothing is enqueued, the user is logged as partial."""
+    raw = RawConnection()
+    monkeypatch.setattr(lambda_function, 'get_connection', lambda: raw)
+    monkeypatch.setattr(lambda_function, 'provision_mode', 'steps')
+    monkeypatch.setattr(lambda_function, 'idempotent_provisioning', False)
+    monkeypatch.setattr(lambda_function, 'emit_metrics', False)
+    monkeypatch.setattr(seed_queue, 'queue', None)
+    monkeypatch.delenv('seed_queue_backend', raising=False)
+    monkeypatch.setattr(deadline, 'optional_step_ms', 10 ** 9)
+
+    event = build_cognito_event(user_name='cognito-test-deadline')
+    assert lambda_function.lambda_handler(event, LambdaContext(5000)) == event
+
+    assert seed_queue.queue is None
+    assert 'left partial for reconciliation' in capsys.readouterr().out
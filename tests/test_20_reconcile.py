@@ -0,0 +1,128 @@
+"""
+Test the set-based reconciliation job for partially provisioned users.
+
+Each test works on its own key range (--after/--until) so users outside
+the test are never scanned or repaired.
+"""
+import datetime
+import json
+import uuid
+
+import pytest
+
+import reconcile
+from conftest import build_cognito_event
+
+
+def count_rows(db_connection, user_name):
+    counts = {}
+    with db_connection.cursor() as cur:
+        for table in ('domains', 'areas', 'tasks'):
+            cur.execute(f"SELECT COUNT(*) AS cnt FROM {table} WHERE creator_fk = %s", (user_name,))
+            counts[table] = cur.fetchone()['cnt']
+    db_connection.commit()
+    return counts
+
+
+@pytest.fixture
+def key_range(invoke_cognito, created_users, db_connection):
+    """Four users under one prefix: complete, profile only, no area, no task."""
+    prefix = f"cognito-test-recon-{uuid.uuid4().hex[:6]}-"
+    users = {state: prefix + state for state in ('complete', 'profile', 'noarea', 'notask')}
+    for user_name in users.values():
+        created_users.append(user_name)
+        assert isinstance(invoke_cognito(build_cognito_event(user_name=user_name)), dict)
+
+    with db_connection.cursor() as cur:
+        cur.execute("DELETE FROM tasks WHERE creator_fk IN (%s, %s, %s)",
+                    (users['profile'], users['noarea'], users['notask']))
+        cur.execute("DELETE FROM areas WHERE creator_fk IN (%s, %s)", (users['profile'], users['noarea']))
+        cur.execute("DELETE FROM domains WHERE creator_fk = %s", (users['profile'],))
+    db_connection.commit()
+    return prefix, users
+
+
+def test_incomplete_query_placeholders_match_params():
+    """Every level contributes its seed values plus the page ids."""
+    sql_statement, seed_params = reconcile.incomplete_users_query(5)
+    assert sql_statement.count('%s') == sum(len(params) + 5 for params in seed_params)
+
+
+def test_dry_run_counts_without_repairing(key_range, db_connection):
+    """A dry run reports the three incomplete users and inserts nothing."""
+    prefix, users = key_range
+    progress = reconcile.reconcile(db_connection, batch_size=2, dry_run=True, after=prefix, until=prefix + '~')
+
+    assert progress['incomplete'] == 3
+    assert progress['repaired'] == 0
+    assert count_rows(db_connection, users['profile']) == {'domains': 0, 'areas': 0, 'tasks': 0}
+
+
+def test_reconcile_repairs_in_pages(key_range, db_connection, tmp_path):
+    """Every incomplete user ends with exactly one seed tree, the complete one is untouched."""
+    prefix, users = key_range
+    progress_path = str(tmp_path / 'reconcile.json')
+    progress = reconcile.reconcile(db_connection, batch_size=2, progress_path=progress_path,
+                                   after=prefix, until=prefix + '~')
+
+    assert progress['repaired'] == 3
+    assert progress['scanned_pages'] == 2
+    assert progress['rows_inserted'] == 3 + 2 + 1
+    for user_name in users.values():
+        assert count_rows(db_connection, user_name) == {'domains': 1, 'areas': 1, 'tasks': 1}
+
+    with open(progress_path) as progress_file:
+        assert json.load(progress_file)['complete'] is True
+
+    again = reconcile.reconcile(db_connection, batch_size=2, after=prefix, until=prefix + '~')
+    assert again['incomplete'] == 0
+
+
+def test_unfinished_pass_resumes_from_last_key(key_range, db_connection, tmp_path):
+    """A saved unfinished pass continues after its last (created, id) key."""
+    prefix, users = key_range
+    created = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None, microsecond=0)
+    with db_connection.cursor() as cur:
+        cur.execute("UPDATE profiles SET created = %s WHERE id > %s AND id <= %s", (created, prefix, prefix + '~'))
+    db_connection.commit()
+    progress_path = str(tmp_path / 'reconcile.json')
+    reconcile.save_progress(progress_path, dict(reconcile.load_progress(None), repaired=7,
+                                                last_created=str(created), last_key=users['noarea']))
+
+    progress = reconcile.reconcile(db_connection, progress_path=progress_path, after=prefix, until=prefix + '~')
+
+    # only notask and profile sort after noarea
+    assert progress['repaired'] == 7 + 2
+    assert count_rows(db_connection, users['noarea']) == {'domains': 1, 'areas': 0, 'tasks': 0}
+
+
+def test_user_edited_seed_data_left_alone(invoke_cognito, created_users, db_connection):
+    """A renamed seed domain and a deleted tutorial task are the user's own edits."""
+    user_name = f"cognito-test-recon-{uuid.uuid4().hex[:6]}-edited"
+    created_users.append(user_name)
+    assert isinstance(invoke_cognito(build_cognito_event(user_name=user_name)), dict)
+    with db_connection.cursor() as cur:
+        cur.execute("UPDATE domains SET domain_name = 'Work' WHERE creator_fk = %s", (user_name,))
+        cur.execute("DELETE FROM tasks WHERE creator_fk = %s", (user_name,))
+    db_connection.commit()
+
+    progress = reconcile.reconcile(db_connection, after=user_name[:-1], until=user_name)
+
+    assert progress['incomplete'] == 0
+    assert progress['rows_inserted'] == 0
+    assert count_rows(db_connection, user_name) == {'domains': 1, 'areas': 1, 'tasks': 0}
+
+
+def test_users_confirmed_before_the_window_skipped(key_range, db_connection):
+    """Half seeded users older than max_age_hours are not repaired."""
+    prefix, users = key_range
+    with db_connection.cursor() as cur:
+        cur.execute("UPDATE profiles SET created = %s WHERE id = %s",
+                    (datetime.datetime(2020, 1, 1), users['profile']))
+    db_connection.commit()
+
+    progress = reconcile.reconcile(db_connection, after=prefix, until=prefix + '~', max_age_hours=24)
+
+    assert progress['repaired'] == 2
+    assert progress['scanned_pages'] == 1
+    assert count_rows(db_connection, users['profile']) == {'domains': 0, 'areas': 0, 'tasks': 0}
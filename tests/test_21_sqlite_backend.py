@@ -0,0 +1,83 @@
+"""
+Test the SQLite stand-in behaves like pymysql where the handler relies on it.
+"""
+import pymysql
+import pytest
+from pymysql.constants import CLIENT
+
+import sqlite_backend
+
+
+@pytest.fixture
+def conn():
+    """A private database, dropped after the test."""
+    connection = sqlite_backend.connect(database='stand-in-test', cursorclass=pymysql.cursors.DictCursor)
+    yield connection
+    sqlite_backend.drop_database('stand-in-test')
+
+
+def test_errors_carry_mysql_codes(conn):
+    """Duplicate keys, NULL columns and missing tables map to MySQL error codes."""
+    with conn.cursor() as cursor:
+        cursor.execute("INSERT INTO profiles (id, name, email) VALUES (%s, %s, %s);", ('a', 'A', 'a@test.com'))
+        with pytest.raises(pymysql.err.IntegrityError) as duplicate:
+            cursor.execute("INSERT INTO profiles (id, name, email) VALUES (%s, %s, %s);", ('a', 'A', 'a@test.com'))
+        with pytest.raises(pymysql.err.IntegrityError) as null_email:
+            cursor.execute("INSERT INTO profiles (id, name, email) VALUES (%s, %s, %s);", ('b', 'B', None))
+        with pytest.raises(pymysql.err.ProgrammingError) as no_table:
+            cursor.execute("SELECT * FROM no_such_table")
+
+    assert duplicate.value.args[0] == 1062
+    assert null_email.value.args == (1048, "Column 'email' cannot be null")
+    assert no_table.value.args[0] == 1146
+
+
+def test_rows_last_insert_id_and_rowcounts(conn):
+    """SELECT returns its row count, LAST_INSERT_ID() the newest auto increment id."""
+    with conn.cursor() as cursor:
+        assert cursor.execute("INSERT INTO domains (domain_name, creator_fk) VALUES (%s, %s), (%s, %s);",
+                              ('Personal', 'a', 'Work', 'a')) == 2
+        cursor.execute("SELECT LAST_INSERT_ID() AS id")
+        assert cursor.fetchone() == {'id': cursor.lastrowid}
+        assert cursor.execute("SELECT domain_name FROM domains WHERE creator_fk = %s ORDER BY id", ('a',)) == 2
+        assert cursor.fetchall() == [{'domain_name': 'Personal'}, {'domain_name': 'Work'}]
+
+    with sqlite_backend.connect(database='stand-in-test').cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM domains")
+        assert cursor.fetchone() == (2,)
+
+
+def test_multi_statements_need_the_client_flag(conn):
+    """A batch runs only with MULTI_STATEMENTS, and its COMMIT commits."""
+    batch = "INSERT INTO profiles (id, name, email) VALUES (%s, %s, %s); COMMIT;"
+    with pytest.raises(pymysql.err.ProgrammingError):
+        conn.cursor().execute(batch, ('a', 'A', 'a@test.com'))
+
+    multi = sqlite_backend.connect(database='stand-in-test', client_flag=CLIENT.MULTI_STATEMENTS)
+    with multi.cursor() as cursor:
+        cursor.execute(batch, ('a', 'A', 'a@test.com'))
+        assert cursor.nextset() is True
+        assert cursor.nextset() is None
+    conn.rollback()
+
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) AS cnt FROM profiles")
+        assert cursor.fetchone()['cnt'] == 1
+
+
+def test_connections_share_one_transaction(conn):
+    """Uncommitted rows are visible to every connection of the database."""
+    other = sqlite_backend.connect(database='stand-in-test')
+    conn.cursor().execute("INSERT INTO profiles (id, name, email) VALUES (%s, %s, %s);", ('a', 'A', 'a@test.com'))
+    assert other.cursor().execute("SELECT id FROM profiles") == 1
+    other.rollback()
+    assert conn.cursor().execute("SELECT id FROM profiles") == 0
+
+
+def test_ping_after_close(conn):
+    """A closed connection fails ping without reconnect, like pymysql."""
+    conn.close()
+    with pytest.raises(pymysql.err.Error):
+        conn.ping(reconnect=False)
+    conn.ping()
+    assert conn.cursor().execute("SELECT 1") == 1
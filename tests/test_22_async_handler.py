@@ -0,0 +1,169 @@
+"""
+Test the asyncio entry point against the SQLite stand-in.
+
+A small bounded pool hands out async wrappers of stand-in connections, each
+call yields to the event loop so concurrent signups really interleave.
+"""
+import asyncio
+import contextlib
+import uuid
+
+import pytest
+
+import async_handler
+import seed_queue
+from conftest import build_cognito_event, connect_test_db
+
+
+class AsyncCursor:
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.cursor.close()
+
+    async def execute(self, sql, args=None):
+        await asyncio.sleep(0)
+        return self.cursor.execute(sql, args)
+
+    async def fetchone(self):
+        return self.cursor.fetchone()
+
+
+class AsyncConnection:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def cursor(self):
+        return AsyncCursor(self.conn.cursor())
+
+    async def commit(self):
+        await asyncio.sleep(0)
+        self.conn.commit()
+
+    async def rollback(self):
+        self.conn.rollback()
+
+
+class BoundedPool:
+    """aiomysql style pool, records the most connections ever in use."""
+
+    def __init__(self, size):
+        self.free = [AsyncConnection(connect_test_db()) for _ in range(size)]
+        self.available = asyncio.Semaphore(size)
+        self.in_use = 0
+        self.peak = 0
+
+    @contextlib.asynccontextmanager
+    async def acquire(self):
+        async with self.available:
+            conn = self.free.pop()
+            self.in_use += 1
+            self.peak = max(self.peak, self.in_use)
+            try:
+                yield conn
+            finally:
+                self.in_use -= 1
+                self.free.append(conn)
+
+
+def count_rows(db_connection, table, column, user_names):
+    placeholders = ', '.join(['%s'] * len(user_names))
+    with db_connection.cursor() as cur:
+        cur.execute(f"SELECT COUNT(*) AS cnt FROM {table} WHERE {column} IN ({placeholders})", user_names)
+        count = cur.fetchone()['cnt']
+    db_connection.commit()
+    return count
+
+
+@pytest.mark.parametrize('mode', ['steps', 'transaction'])
+def test_concurrent_signups_share_a_bounded_pool(mode, monkeypatch, created_users, db_connection):
+    """Many in-flight signups are provisioned through no more than pool size connections."""
+    monkeypatch.setattr(async_handler, 'provision_mode', mode)
+    user_names = [f"cognito-test-async-{uuid.uuid4().hex[:8]}" for _ in range(20)]
+    created_users.extend(user_names)
+
+    async def run():
+        pool = BoundedPool(4)
+        events = [build_cognito_event(user_name=user_name) for user_name in user_names]
+        results = await asyncio.gather(*(async_handler.handle_event(event, pool) for event in events))
+        return pool, results
+
+    pool, results = asyncio.run(run())
+
+    assert all(isinstance(result, dict) for result in results)
+    assert pool.peak == 4
+    assert count_rows(db_connection, 'profiles', 'id', user_names) == 20
+    assert count_rows(db_connection, 'tasks', 'creator_fk', user_names) == 20
+
+
+def test_same_error_semantics_as_lambda_handler(created_users):
+    """Missing userName and duplicate profiles return error strings, other triggers the event."""
+    user_name = f"cognito-test-async-dup-{uuid.uuid4().hex[:6]}"
+    created_users.append(user_name)
+
+    async def run():
+        pool = BoundedPool(1)
+        first = await async_handler.handle_event(build_cognito_event(user_name=user_name), pool)
+        duplicate = await async_handler.handle_event(build_cognito_event(user_name=user_name), pool)
+        missing = await async_handler.handle_event(build_cognito_event(user_name=None), pool)
+        other = build_cognito_event(user_name=user_name, trigger_source='PostConfirmation_ConfirmForgotPassword')
+        return first, duplicate, missing, other, await async_handler.handle_event(other, pool)
+
+    first, duplicate, missing, other, other_result = asyncio.run(run())
+    assert isinstance(first, dict)
+    assert duplicate.startswith('User Profile Create failed')
+    assert missing.startswith('Username data unavailable')
+    assert other_result is other
+
+
+def test_idempotent_repeat_repairs_partial_user(monkeypatch, created_users, db_connection):
+    """A repeat for a partial user adds only the missing rows, as lambda_handler does."""
+    monkeypatch.setattr(async_handler, 'idempotent_provisioning', True)
+    user_name = f"cognito-test-async-idem-{uuid.uuid4().hex[:6]}"
+    created_users.append(user_name)
+
+    pool = BoundedPool(1)
+
+    async def signup():
+        return await async_handler.handle_event(build_cognito_event(user_name=user_name), pool)
+
+    assert isinstance(asyncio.run(signup()), dict)
+    with db_connection.cursor() as cur:
+        cur.execute("DELETE FROM tasks WHERE creator_fk = %s", (user_name,))
+    db_connection.commit()
+
+    assert isinstance(asyncio.run(signup()), dict)
+    assert count_rows(db_connection, 'domains', 'creator_fk', [user_name]) == 1
+    assert count_rows(db_connection, 'tasks', 'creator_fk', [user_name]) == 1
+
+
+def test_two_phase_spools_seed_jobs_off_the_event_loop(tmp_path, monkeypatch, created_users, db_connection):
+    """Concurrent two_phase signups put their seed jobs in the spool file, nothing is seeded inline."""
+    monkeypatch.setattr(async_handler, 'provision_mode', 'two_phase')
+    monkeypatch.setattr(seed_queue, 'queue', None)
+    monkeypatch.setenv('seed_queue_backend', 'spool')
+    monkeypatch.setenv('seed_queue_path', str(tmp_path / 'seed_jobs.db'))
+    user_names = [f"cognito-test-async-spool-{uuid.uuid4().hex[:8]}" for _ in range(8)]
+    created_users.extend(user_names)
+
+    async def run():
+        pool = BoundedPool(4)
+        return await asyncio.gather(*(async_handler.handle_event(build_cognito_event(user_name=user_name), pool)
+                                      for user_name in user_names))
+
+    assert all(isinstance(result, dict) for result in asyncio.run(run()))
+    assert count_rows(db_connection, 'profiles', 'id', user_names) == 8
+    assert count_rows(db_connection, 'domains', 'creator_fk', user_names) == 0
+    jobs = seed_queue.SpoolQueue(str(tmp_path / 'seed_jobs.db')).receive(20)
+    assert sorted(job['userName'] for _, job in jobs) == sorted(user_names)
+
+
+def test_create_pool_requires_driver(monkeypatch):
+    """Without aiomysql the container entry point fails loudly at start up."""
+    monkeypatch.setattr(async_handler, 'aiomysql', None)
+    with pytest.raises(RuntimeError):
+        asyncio.run(async_handler.create_pool())
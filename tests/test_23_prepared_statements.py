@@ -0,0 +1,287 @@
+"""
+Test the opt-in binary protocol prepared statements in prepared_statements.
+
+A real pymysql connection talks over a socket pair to a scripted server
+thread that understands COM_QUERY, COM_STMT_PREPARE, COM_STMT_EXECUTE and
+COM_STMT_CLOSE, records every command and decodes the binary parameters.
+"""
+import collections
+import socket
+import struct
+import threading
+import uuid
+
+import pymysql
+import pytest
+from pymysql.constants import COMMAND
+
+import connection_health
+import lambda_function
+import prepared_statements
+import sql_profiler
+from conftest import build_cognito_event
+
+INSERT = "INSERT INTO profiles (id, name, email) VALUES (%s, %s, %s);"
+
+
+def length_encoded_int(value):
+    return bytes((value,)) if value < 251 else b'\xfc' + struct.pack('<H', value)
+
+
+def ok_packet(affected_rows=0):
+    return b'\x00' + length_encoded_int(affected_rows) + b'\x00' + struct.pack('<HH', 2, 0)
+
+
+def error_packet(code, message='error'):
+    return b'\xff' + struct.pack('<H', code) + b'#HY000' + message.encode()
+
+
+# a column definition, its contents are never read by the client
+DEFINITION = b'\x03def\x00\x00\x00\x01?\x00\x0c\x3f\x00\x00\x00\x00\x00\xfd\x80\x00\x00\x00\x00'
+EOF = b'\xfe\x00\x00\x02\x00'
+
+
+class ProtocolServer(threading.Thread):
+
+    def __init__(self, sock):
+        super().__init__(daemon=True)
+        self.sock = sock
+        self.rfile = sock.makefile('rb')
+        self.commands = []
+        self.statements = {}
+        self.reject_prepare = None
+        self.fail_execute = None
+
+    def send(self, seq, *payloads):
+        for payload in payloads:
+            seq += 1
+            self.sock.sendall(struct.pack('<I', len(payload))[:3] + bytes((seq,)) + payload)
+
+    def run(self):
+        while True:
+            header = self.rfile.read(4)
+            if len(header) < 4:
+                return
+            length = int.from_bytes(header[:3], 'little')
+            payload = self.rfile.read(length)
+            command, body, seq = payload[0], payload[1:], header[3]
+            if command == COMMAND.COM_QUIT:
+                return
+            if command == COMMAND.COM_QUERY:
+                sql_statement = body.decode()
+                self.commands.append(('query', sql_statement))
+                self.send(seq, ok_packet(1 if sql_statement.startswith('INSERT') else 0))
+            elif command == COMMAND.COM_STMT_PREPARE:
+                sql_statement = body.decode()
+                self.commands.append(('prepare', sql_statement))
+                if self.reject_prepare:
+                    self.send(seq, error_packet(self.reject_prepare))
+                    continue
+                statement_id = len(self.statements) + 1
+                param_count = sql_statement.count('?')
+                self.statements[statement_id] = param_count
+                columns = 1 if sql_statement.startswith('SELECT') else 0
+                packets = [b'\x00' + struct.pack('<IHHBH', statement_id, columns, param_count, 0, 0)]
+                packets += [DEFINITION] * param_count + ([EOF] if param_count else [])
+                packets += [DEFINITION] * columns + ([EOF] if columns else [])
+                self.send(seq, *packets)
+            elif command == COMMAND.COM_STMT_EXECUTE:
+                statement_id = struct.unpack_from('<I', body)[0]
+                if statement_id not in self.statements:
+                    self.send(seq, error_packet(1243, 'Unknown prepared statement handler'))
+                    continue
+                self.commands.append(('execute', statement_id, self.decode_params(body, self.statements[statement_id])))
+                if self.fail_execute:
+                    self.send(seq, error_packet(self.fail_execute, 'Duplicate entry'))
+                else:
+                    self.send(seq, ok_packet(1))
+            elif command == COMMAND.COM_STMT_CLOSE:
+                self.commands.append(('close', struct.unpack_from('<I', body)[0]))
+                self.statements.pop(struct.unpack_from('<I', body)[0], None)
+            else:
+                self.send(seq, ok_packet())
+
+    @staticmethod
+    def decode_params(body, param_count):
+        position = 9
+        null_bitmap = body[position:position + (param_count + 7) // 8]
+        position += len(null_bitmap) + 1
+        types = [body[position + 2 * index] for index in range(param_count)]
+        position += 2 * param_count
+        params = []
+        for index, param_type in enumerate(types):
+            if null_bitmap[index // 8] & (1 << (index % 8)):
+                params.append(None)
+            elif param_type == prepared_statements.TYPE_LONGLONG:
+                params.append(struct.unpack_from('<q', body, position)[0])
+                position += 8
+            else:
+                length = body[position]
+                params.append(body[position + 1:position + 1 + length].decode())
+                position += 1 + length
+        return tuple(params)
+
+
+def connect_protocol_server(host='localhost', thread_id=7):
+    """A pymysql connection wired to a new ProtocolServer, the handshake skipped."""
+    client_sock, server_sock = socket.socketpair()
+    server = ProtocolServer(server_sock)
+    server.start()
+    conn = pymysql.connections.Connection(host=host, defer_connect=True)
+    conn._sock = client_sock
+    conn._rfile = client_sock.makefile('rb')
+    conn._current_timeout = None
+    conn._closed = False
+    conn.server_thread_id = (thread_id,)
+    conn.server_status = 0
+    return conn, server
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    """Empty statement caches and counters."""
+    monkeypatch.setattr(prepared_statements, 'caches', type(prepared_statements.caches)())
+    monkeypatch.setattr(prepared_statements, 'stats', {'prepares': 0, 'executes': 0, 'text': 0})
+
+
+@pytest.fixture
+def protocol_connection():
+    conn, server = connect_protocol_server()
+    yield conn, server
+    conn.close()
+
+
+def test_prepared_once_then_binary_executes(protocol_connection):
+    """The first call prepares, later calls send only the statement id and binary params."""
+    conn, server = protocol_connection
+    for user in ('a', 'b'):
+        assert prepared_statements.execute(conn.cursor(), INSERT, (user, None, 'é@test.com')) == 1
+    assert prepared_statements.execute(conn.cursor(), "INSERT INTO domains (closed) VALUES (%s);", (-3,)) == 1
+
+    assert server.commands == [
+        ('prepare', "INSERT INTO profiles (id, name, email) VALUES (?, ?, ?);"),
+        ('execute', 1, ('a', None, 'é@test.com')),
+        ('execute', 1, ('b', None, 'é@test.com')),
+        ('prepare', "INSERT INTO domains (closed) VALUES (?);"),
+        ('execute', 2, (-3,)),
+    ]
+    assert prepared_statements.stats == {'prepares': 2, 'executes': 3, 'text': 0}
+
+
+def test_reconnect_and_forgotten_statement_prepare_again(protocol_connection):
+    """A new server session starts an empty cache, a 1243 re-prepares the statement."""
+    conn, server = protocol_connection
+    prepared_statements.execute(conn.cursor(), INSERT, ('a', 'A', 'a@test.com'))
+
+    server.statements.clear()
+    assert prepared_statements.execute(conn.cursor(), INSERT, ('b', 'B', 'b@test.com')) == 1
+    conn.server_thread_id = (8,)
+    prepared_statements.execute(conn.cursor(), INSERT, ('c', 'C', 'c@test.com'))
+
+    assert [command[0] for command in server.commands] == ['prepare', 'execute', 'prepare', 'execute',
+                                                           'prepare', 'execute']
+    assert prepared_statements.stats['prepares'] == 3
+
+
+def test_execute_errors_raise_as_pymysql_errors(protocol_connection):
+    """A server error on execute is raised with its MySQL code, the connection stays usable."""
+    conn, server = protocol_connection
+    server.fail_execute = 1062
+    with pytest.raises(pymysql.err.IntegrityError) as duplicate:
+        prepared_statements.execute(conn.cursor(), INSERT, ('a', 'A', 'a@test.com'))
+    assert duplicate.value.args[0] == 1062
+
+    server.fail_execute = None
+    assert prepared_statements.execute(conn.cursor(), INSERT, ('a', 'A', 'a@test.com')) == 1
+
+
+def test_full_statement_cache_is_temporary(protocol_connection):
+    """max_prepared_stmt_count sends that call as text, the next call tries to prepare again."""
+    conn, server = protocol_connection
+    server.reject_prepare = 1461
+    assert prepared_statements.execute(conn.cursor(), INSERT, ('a', 'A', 'a@test.com')) == 1
+    server.reject_prepare = None
+    assert prepared_statements.execute(conn.cursor(), INSERT, ('b', 'B', 'b@test.com')) == 1
+
+    assert [command[0] for command in server.commands] == ['prepare', 'query', 'prepare', 'execute']
+
+
+def test_unpreparable_and_result_set_statements_sent_as_text(protocol_connection):
+    """A statement the server cannot prepare, or one returning rows, goes out as text from then on."""
+    conn, server = protocol_connection
+    server.reject_prepare = 1295
+    prepared_statements.execute(conn.cursor(), INSERT, ('a', 'A', 'a@test.com'))
+    prepared_statements.execute(conn.cursor(), INSERT, ('b', 'B', 'b@test.com'))
+    server.reject_prepare = None
+    prepared_statements.execute(conn.cursor(), "SELECT 1", ())
+    prepared_statements.execute(conn.cursor(), "SELECT 1", ())
+
+    assert [command[0] for command in server.commands] == ['prepare', 'query', 'query', 'prepare', 'close',
+                                                           'query', 'query']
+
+
+def test_other_pymysql_release_uses_text(protocol_connection, monkeypatch):
+    """Without the pymysql release the packet handling was written for, statements go out as text."""
+    conn, server = protocol_connection
+    monkeypatch.setattr(prepared_statements, 'binary_protocol', False)
+    assert prepared_statements.execute(conn.cursor(), INSERT, ('a', 'A', 'a@test.com')) == 1
+    assert [command[0] for command in server.commands] == ['query']
+
+
+def test_tracked_cursor_replays_and_profiles_prepared_statements(monkeypatch):
+    """execute_prepared goes through connection_health's retry and sql_profiler's recording."""
+    monkeypatch.setattr(sql_profiler, 'recent', collections.deque(maxlen=8))
+    monkeypatch.setattr(connection_health, 'stats', dict.fromkeys(connection_health.stats, 0))
+    (dropped, dropped_server), (conn, server) = connect_protocol_server(), connect_protocol_server(thread_id=8)
+    connections = [dropped, conn]
+    tracked = connection_health.HealthTrackedConnection(
+        lambda: sql_profiler.ProfilingConnection(connections.pop(0)), idle_window=60)
+    dropped_server.sock.shutdown(socket.SHUT_RDWR)
+    try:
+        with tracked.cursor() as cursor:
+            assert cursor.execute_prepared(INSERT, ('a', 'A', 'a@test.com')) == 1
+    finally:
+        conn.close()
+
+    assert connection_health.stats['retries'] == 1
+    assert [command[0] for command in server.commands] == ['prepare', 'execute']
+    assert [entry['error'] is None for entry in sql_profiler.recent] == [False, True]
+    assert sql_profiler.recent[-1]['rows'] == 1
+
+
+def test_rds_proxy_and_non_pymysql_connections_use_text(handler_connection):
+    """RDS Proxy would pin the session, the SQLite stand-in has no binary protocol."""
+    conn, server = connect_protocol_server(host='signups.proxy-abc123.us-east-1.rds.amazonaws.com')
+    try:
+        prepared_statements.execute(conn.cursor(), INSERT, ('a', 'A', 'a@test.com'))
+        assert [command[0] for command in server.commands] == ['query']
+    finally:
+        conn.close()
+
+    with handler_connection.cursor() as cursor:
+        assert prepared_statements.execute(cursor, "SELECT 1", ()) == 1
+    assert prepared_statements.stats == {'prepares': 0, 'executes': 0, 'text': 2}
+
+
+def test_handler_seeds_through_prepared_statements(protocol_connection, monkeypatch):
+    """With the mode on the steps handler sends the profile and every seed level as prepared statements."""
+    conn, server = protocol_connection
+    monkeypatch.setattr(lambda_function, 'get_connection', lambda: conn)
+    monkeypatch.setattr(lambda_function, 'provision_mode', 'steps')
+    monkeypatch.setattr(lambda_function, 'idempotent_provisioning', False)
+    monkeypatch.setattr(lambda_function, 'emit_metrics', False)
+    monkeypatch.setattr(lambda_function, 'prepared_statements', prepared_statements)
+
+    user_names = [f"cognito-test-prep-{uuid.uuid4().hex[:6]}" for _ in range(2)]
+    for user_name in user_names:
+        event = build_cognito_event(user_name=user_name)
+        assert lambda_function.lambda_handler(event, {}) == event
+
+    kinds = [command[0] for command in server.commands]
+    assert kinds.count('prepare') == 4
+    assert kinds.count('execute') == 8
+    assert [command[1] for command in server.commands if command[0] == 'query'] == ['COMMIT'] * 8
+    executes = [command[2] for command in server.commands if command[0] == 'execute']
+    assert executes[0] == (user_names[0], 'Test User', 'test@test.com')
+    assert executes[4] == (user_names[1], 'Test User', 'test@test.com')
+    assert all(user_names[1] in params for params in executes[5:])
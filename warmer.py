@@ -0,0 +1,81 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from classifier import log_info, log_warning
+
+#
+# scheduled warm-up events, e.g. an EventBridge rule with the constant input
+#
+#   {"warmer": true, "concurrency": 3}
+#
+# The invoked container primes itself (see lambda_function.warm_up) and, when
+# concurrency is above 1, invokes its own function concurrency - 1 more times
+# in parallel. Each of those holds its container for warmer_delay_ms, so they
+# cannot be served by one container and N containers end up primed.
+#
+
+# milliseconds a fanned out warmer keeps its container busy
+warmer_delay_ms = float(os.environ.get('warmer_delay_ms', '75'))
+# upper bound on concurrency, a typo in the schedule should not launch hundreds
+MAX_CONCURRENCY = 50
+
+lambda_client = None
+
+
+def requested_concurrency(event):
+    try:
+        concurrency = int(event.get('concurrency', 1))
+    except (TypeError, ValueError):
+        return 1
+    return max(1, min(concurrency, MAX_CONCURRENCY))
+
+
+def hold_container(event):
+    # only fanned out invocations wait, the scheduled one is what they overlap with
+    if event.get('warmerTarget'):
+        time.sleep(warmer_delay_ms / 1000)
+
+
+def get_lambda_client():
+    global lambda_client
+    if lambda_client is None:
+        import boto3
+        lambda_client = boto3.client('lambda')
+    return lambda_client
+
+
+def invoke_target(client, function_name, index):
+    payload = json.dumps({'warmer': True, 'warmerTarget': True, 'warmerIndex': index})
+    response = client.invoke(FunctionName=function_name, InvocationType='RequestResponse', Payload=payload)
+    return json.loads(response['Payload'].read() or 'null')
+
+
+def fan_out(event, context, client=None):
+
+    #
+    # invoke the other concurrency - 1 warmers in parallel and wait for them.
+    # Returns how many of them ran on a cold container, failures are logged.
+    #
+    concurrency = requested_concurrency(event)
+    function_name = getattr(context, 'invoked_function_arn', None) or getattr(context, 'function_name', None)
+    if event.get('warmerTarget') or concurrency <= 1 or function_name is None:
+        return 0
+
+    client = client or get_lambda_client()
+    cold = 0
+    with ThreadPoolExecutor(max_workers=concurrency - 1) as executor:
+        futures = [executor.submit(invoke_target, client, function_name, index)
+                   for index in range(1, concurrency)]
+        for future in futures:
+            try:
+                report = future.result()
+            except Exception as e:
+                log_warning("Warning: warmer fan out invoke failed: %s", e)
+                continue
+            if isinstance(report, dict) and report.get('coldStart'):
+                cold += 1
+
+    log_info("Warmer fan out: %s invocations, %s cold containers", concurrency - 1, cold)
+    return cold